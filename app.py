@@ -5,305 +5,869 @@ This is the main web application that serves the HTML form and handles
 audio uploads. It uses the OpenAI Whisper API to transcribe the uploaded
 audio and returns the result.
 """
-from flask import Flask, request, jsonify, render_template
-import tempfile
+from flask import Flask, request, jsonify, render_template, g, Response, stream_with_context
 import os
-from openai import OpenAI
-from openpyxl import Workbook, load_workbook
-from dotenv import load_dotenv
-import imageio_ffmpeg
-try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    HAS_REPORTLAB = True
-except ImportError:
-    HAS_REPORTLAB = False
-
+import shutil
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from io import BytesIO
 
-load_dotenv()
-
-# Configure pydub to use imageio-ffmpeg BEFORE importing pydub
-from pydub import AudioSegment
-AudioSegment.converter = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffprobe = imageio_ffmpeg.get_ffmpeg_exe()
+# Loads .env before the modules below read their settings.
+from core import API_KEY, BASE_URL
+from audio_pipeline import (COPY_CHUNK_SIZE, MAX_AUDIO_SECONDS, MAX_UPLOAD_BYTES, PASSTHROUGH, PASSTHROUGH_CODECS,
+                            AudioChunk, AudioLimitError, DecodedAudio, StreamDecoder, check_duration, check_size,
+                            check_upload, load_audio, new_buffer, prepare_upload, stream_size)
+from cache import TieredCache, hash_file, make_key, prompt_version
+from jobs import JobQueue, QueueFullError
+import metrics
+from metrics import (AUDIO_SECONDS, BYTES, CLIENT_BITRATE, CLIENT_SECONDS, CORRECTION_STREAM_SECONDS, FORM_FIELDS,
+                     TIMING_LOG, UPLOADS, UPLOADS_REJECTED)
+from pdf_render import HAS_REPORTLAB, PDF_BATCH_LIMIT, pdf_filename, record_date, render_batch, render_prescription
+from upstream import Upstream
+from transcription_backends import TRANSCRIBE_BACKEND, make_backend
+from records import CSV_EXPORT_PATH, EXCEL_EXPORT_PATH, PAGE_SIZE, ExportScheduler, RecordStore
+from correction_policy import batch_messages, needs_correction, parse_batch_response
+from form_extraction import EXTRACTION_PROMPT, extraction_messages, merge_fields, parse_extraction
+from long_recording import is_long_recording, transcribe_long
+from segmentation import SEGMENTATION, VAD_MIN_SILENCE_MS, pack_regions, speech_regions, vad_segments
 
 app = Flask(__name__)
 
-# --- Configuration ---
-# REPLACE THESE WITH YOUR ACTUAL VALUES OR SET ENVIRONMENT VARIABLES
-API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_API_KEY_HERE")
-BASE_URL = os.environ.get("OPENAI_BASE_URL", "YOUR_BASE_URL_HERE") 
-
-client = OpenAI(
-    api_key=API_KEY,
-    base_url=BASE_URL
-)
+# Requests larger than the upload limit (plus room for the form fields) are
+# refused from their Content-Length before the body is read.
+FORM_OVERHEAD_BYTES = 64 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES if MAX_UPLOAD_BYTES else None
 
-def convert_to_wav(input_path):
-    audio = AudioSegment.from_file(input_path)
-    wav_path = input_path + ".wav"
-    audio.export(wav_path, format="wav")
-    return wav_path
-
-import csv
-
-# ... (rest of imports and setup)
-
-def transcribe_audio(audio_path):
+# --- Configuration ---
+# OPENAI_API_KEY and OPENAI_BASE_URL are read in core.py.
+
+# Pooled connections, per-call deadlines, retries, circuit breaking and
+# optional hedging to OPENAI_HEDGE_BASE_URL (see upstream.py). The OpenAI SDK
+# is imported in the background so the worker starts serving sooner.
+upstream = Upstream(API_KEY, BASE_URL)
+threading.Thread(target=upstream.warm, name="upstream-warm", daemon=True).start()
+
+# --- Models & Caches ---
+TRANSCRIBE_MODEL = "whisper-1"
+CORRECTION_MODEL = "gpt-3.5-turbo" # Or your preferred model
+CORRECTION_PROMPT = "You are a professional medical scribe. Correct the following medical transcript for grammar, medical spelling, and professional structure. Maintain the original meaning exactly. If the input is just a few words, return them as is but correctly spelled."
+CORRECTION_PROMPT_VERSION = prompt_version(CORRECTION_PROMPT)
+EXTRACTION_PROMPT_VERSION = prompt_version(EXTRACTION_PROMPT)
+
+# Transcripts are keyed on the audio content and model, corrections on the
+# text, model and prompt, so browser retries and repeated clips are free.
+transcript_cache = TieredCache("transcripts")
+correction_cache = TieredCache("corrections")
+
+# TRANSCRIBE_BACKEND=remote sends audio to TRANSCRIBE_MODEL through the
+# upstream layer; "local" runs faster-whisper in-process, loaded in the
+# background at startup so the first dictation does not wait for it.
+transcription_backend = make_backend(TRANSCRIBE_BACKEND, upstream, TRANSCRIBE_MODEL)
+if transcription_backend.name == "local":
+    threading.Thread(target=transcription_backend.warm, name="whisper-load", daemon=True).start()
+
+def _unwrap_json_text(text_val):
+    """Some servers return the JSON body as text; take its "text" field."""
+    try:
+        parsed = json.loads(text_val)
+    except (ValueError, TypeError):
+        return text_val
+    if isinstance(parsed, dict) and isinstance(parsed.get("text"), str):
+        return parsed["text"].strip()
+    return text_val
+
+def _transcript_text(transcript):
     """
-    Transcribes audio using the configured OpenAI-compatible API.
-    Returns only the transcribed text, stripping any metadata.
+    Robust handling for various API response formats.
     """
-    with open(audio_path, "rb") as audio_file:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1", 
-            file=audio_file,
-            response_format="text"
-        )
-    
-def transcribe_audio(audio_path):
+    if isinstance(transcript, dict):
+        return transcript.get("text", "").strip()
+    if hasattr(transcript, 'text'):
+        return _unwrap_json_text(transcript.text.strip())
+    if isinstance(transcript, str):
+        return _unwrap_json_text(transcript.strip())
+    return str(transcript).strip()
+
+def transcribe_audio(audio, filename="audio.wav", audio_seconds=None):
     """
-    Transcribes audio using the configured OpenAI-compatible API.
+    Transcribes audio with the configured backend (TRANSCRIBE_BACKEND: the
+    OpenAI-compatible API or a local Whisper model).
+    Accepts a file path or an in-memory buffer; filename tells the API which
+    format the buffer holds. audio_seconds, when known, sets the deadline.
     Returns only the transcribed text, stripping any metadata.
     """
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, "rb") as audio_file:
+            return transcribe_audio(audio_file, os.path.basename(audio))
+
+    cache_key = make_key(hash_file(audio), transcription_backend.model_id)
+    cached = transcript_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if transcription_backend.name == "remote":
+        audio.seek(0, os.SEEK_END)
+        BYTES.inc(audio.tell(), direction="out", kind="upstream")
+    if audio_seconds:
+        AUDIO_SECONDS.inc(audio_seconds)
     try:
-        with open(audio_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio_file,
-                response_format="text"
-            )
-        
-        # Robust handling for various API response formats
-        if isinstance(transcript, dict):
-            return transcript.get("text", "").strip()
-        
-        if hasattr(transcript, 'text'):
-            text_val = transcript.text.strip()
-            import json
-            try:
-                parsed = json.loads(text_val)
-                if isinstance(parsed, dict) and "text" in parsed:
-                    return parsed["text"].strip()
-            except:
-                pass
-            return text_val
-        
-        if isinstance(transcript, str):
-            text_val = transcript.strip()
-            import json
-            try:
-                parsed = json.loads(text_val)
-                if isinstance(parsed, dict) and "text" in parsed:
-                    return parsed["text"].strip()
-            except:
-                pass
-            return text_val
-            
-        return str(transcript).strip()
+        audio.seek(0)
+        transcript = transcription_backend.transcribe(audio, filename, audio_seconds)
+        text = _transcript_text(transcript)
     except Exception as e:
         print(f"Transcription error: {e}")
         raise e
 
-def ai_correct_text(text):
+    transcript_cache.set(cache_key, text)
+    return text
+
+# Why each transcript was or was not sent to the LLM (see correction_policy).
+correction_decisions = {}
+correction_decisions_lock = threading.Lock()
+
+def _record_decision(reason):
+    with correction_decisions_lock:
+        correction_decisions[reason] = correction_decisions.get(reason, 0) + 1
+
+def _correction_cache_key(text):
+    return make_key(text, CORRECTION_MODEL, CORRECTION_PROMPT_VERSION)
+
+def _correction_messages(text):
+    return [
+        {"role": "system", "content": CORRECTION_PROMPT},
+        {"role": "user", "content": text}
+    ]
+
+def _request_correction(text):
+    response = upstream.chat(
+        model=CORRECTION_MODEL,
+        messages=_correction_messages(text),
+        temperature=0.3
+    )
+    return response.choices[0].message.content.strip()
+
+def _known_correction(text, field):
     """
-    Uses LLM to correct medical terminology, grammar, and structure.
+    Applies the correction policy and the cache: returns the final text when
+    no LLM call is needed, or None when text has to go to the LLM.
     """
-    if not text or len(text) < 3:
+    should_correct, reason = needs_correction(text, field)
+    _record_decision(reason)
+    if not should_correct:
         return text
-    
+    return correction_cache.get(_correction_cache_key(text))
+
+def ai_correct_text(text, field=None):
+    """
+    Uses LLM to correct medical terminology, grammar, and structure.
+    Structured fields and short transcripts with only known words are
+    returned unchanged without calling the LLM.
+    """
+    known = _known_correction(text, field)
+    if known is not None:
+        return known
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Or your preferred model
-            messages=[
-                {"role": "system", "content": "You are a professional medical scribe. Correct the following medical transcript for grammar, medical spelling, and professional structure. Maintain the original meaning exactly. If the input is just a few words, return them as is but correctly spelled."},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
+        corrected = _request_correction(text)
     except Exception as e:
         print(f"AI Correction error: {e}")
+        _record_decision("llm_error")
         return text
 
+    correction_cache.set(_correction_cache_key(text), corrected)
+    return corrected
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def correction_event_stream(result, field=None):
+    """
+    Server-sent events for a finished transcription (result holds
+    raw_transcription): "transcript" with the raw text at once, "token" for
+    each piece of the correction as the LLM streams it, then "done" with the
+    final paraphrased_text (the raw text if the LLM failed) and the time to
+    first token and total time in ms.
+    """
+    text = result['raw_transcription']
+
+    def generate():
+        yield _sse("transcript", result)
+        start = time.perf_counter()
+        first_token = None
+        with metrics.stage("correct"):
+            corrected = _known_correction(text, field)
+            if corrected is None:
+                pieces = []
+                try:
+                    for piece in upstream.chat_stream(model=CORRECTION_MODEL, messages=_correction_messages(text),
+                                                      temperature=0.3):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                            CORRECTION_STREAM_SECONDS.observe(first_token, phase="first_token")
+                        pieces.append(piece)
+                        yield _sse("token", {'text': piece})
+                    corrected = "".join(pieces).strip()
+                except Exception as e:
+                    print(f"AI Correction error: {e}")
+                    _record_decision("llm_error")
+                if corrected:
+                    correction_cache.set(_correction_cache_key(text), corrected)
+                else:
+                    corrected = text
+        total = time.perf_counter() - start
+        CORRECTION_STREAM_SECONDS.observe(total, phase="total")
+        timing = {'ttft_ms': round(first_token * 1000, 1) if first_token is not None else None,
+                  'total_ms': round(total * 1000, 1)}
+        if TIMING_LOG:
+            print(json.dumps(dict(timing, event='correction_stream', endpoint=request.endpoint)))
+        yield _sse("done", dict(result, paraphrased_text=corrected, **timing))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _wants_event_stream():
+    """Clients ask for the streamed correction with Accept: text/event-stream."""
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def ai_correct_batch(texts, fields=None):
+    """
+    Corrects several texts (chunks or form fields) with a single chat
+    completion and returns the corrections in the same order. Falls back to
+    one request per text if the batched reply cannot be split back out.
+    """
+    fields = fields or [None] * len(texts)
+    results = list(texts)
+    pending = []
+    for i, (text, field) in enumerate(zip(texts, fields)):
+        should_correct, reason = needs_correction(text, field)
+        _record_decision(reason)
+        if not should_correct:
+            continue
+        cached = correction_cache.get(_correction_cache_key(text))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    corrections = None
+    if len(pending) > 1:
+        try:
+            response = upstream.chat(
+                model=CORRECTION_MODEL,
+                messages=batch_messages(CORRECTION_PROMPT, [texts[i] for i in pending]),
+                temperature=0.3
+            )
+            corrections = parse_batch_response(response.choices[0].message.content, len(pending))
+            if corrections is None:
+                print("AI Correction batch reply could not be split; correcting one by one")
+        except Exception as e:
+            print(f"AI Correction batch error: {e}")
+
+    for n, i in enumerate(pending):
+        if corrections is not None:
+            corrected = corrections[n]
+        else:
+            try:
+                corrected = _request_correction(texts[i])
+            except Exception as e:
+                print(f"AI Correction error: {e}")
+                _record_decision("llm_error")
+                continue
+        correction_cache.set(_correction_cache_key(texts[i]), corrected)
+        results[i] = corrected
+    return results
+
+def extract_form_fields(transcript):
+    """
+    Fills every form field from one whole-form transcript with a single
+    chat completion. Fields the reply leaves out or gets wrong fall back to
+    the spoken labels in the transcript (see form_extraction). Returns
+    (fields, sources).
+    """
+    cache_key = make_key(transcript, CORRECTION_MODEL, EXTRACTION_PROMPT_VERSION)
+    cached = correction_cache.get(cache_key)
+    extracted = json.loads(cached) if cached is not None else None
+    if extracted is None and transcript.strip():
+        try:
+            response = upstream.chat(
+                model=CORRECTION_MODEL,
+                messages=extraction_messages(transcript),
+                temperature=0
+            )
+            extracted = parse_extraction(response.choices[0].message.content)
+            if extracted is None:
+                print("Form extraction reply was not a JSON object; using spoken labels")
+            else:
+                correction_cache.set(cache_key, json.dumps(extracted))
+        except Exception as e:
+            print(f"Form extraction error: {e}")
+    fields, sources = merge_fields(extracted, transcript)
+    for field, source in sources.items():
+        FORM_FIELDS.inc(field=field, source=source)
+    return fields, sources
+
+# --- Segmentation ---
+# SEGMENTATION=vad decodes the recording, drops silence and sends only the
+# speech segments (at most SEGMENT_MAX_SECONDS each); "fixed" sends the whole
+# recording as one request.
+SEGMENT_MAX_SECONDS = float(os.environ.get("SEGMENT_MAX_SECONDS", "30"))
+
+@contextmanager
+def _stage(name, job=None):
+    """Times a stage in the metrics and, for queued jobs, on the job."""
+    with metrics.stage(name), (job.stage(name) if job else nullcontext()):
+        yield
+
+def _transcribe_long_segment(segment):
+    chunk = AudioChunk(segment, 0, segment.duration_ms)
+    return transcribe_audio(*chunk.encode(), chunk.duration_s)
+
+def transcribe_recording(source, job=None, info=None):
+    """
+    Converts and transcribes one uploaded recording (seekable binary stream).
+    Conversion and transcription are timed as job stages when a job is given.
+    Recordings over the size or duration limits raise AudioLimitError before
+    anything is sent upstream (from the header when it has a duration, else
+    by decoding up to the limit); info is the result of an earlier
+    check_upload.
+    """
+    def stage(name):
+        return _stage(name, job)
+
+    if info is None:
+        with stage("upload_check"):
+            info = check_upload(source)
+
+    fmt = f"{info['container']}/{info['codec']}" if info else "unknown"
+    if is_long_recording(info, stream_size(source)):
+        # Long-consultation mode: overlapping segments decoded as a stream
+        # and transcribed in parallel (see long_recording.py).
+        UPLOADS.inc(format=fmt, path="long")
+        with stage("transcribe_long"):
+            return transcribe_long(source, _transcribe_long_segment, max_seconds=MAX_AUDIO_SECONDS,
+                                   duration=info and info['duration'])
+
+    if SEGMENTATION == "vad":
+        UPLOADS.inc(format=fmt, path="decode")
+        with stage("convert"):
+            audio = load_audio(source, max_seconds=MAX_AUDIO_SECONDS)
+            segments = vad_segments(audio, SEGMENT_MAX_SECONDS * 1000)
+        with stage("transcribe"):
+            # A recording without speech costs no API call at all.
+            texts = [transcribe_audio(*segment.encode(), segment.duration_s) for segment in segments]
+        return " ".join(text for text in texts if text)
+
+    # Probe the upload and either pass it through (already a compact codec
+    # the API accepts) or re-encode it to AUDIO_UPLOAD_FORMAT in memory.
+    # Nothing is written to disk unless it outgrows AUDIO_SPILL_THRESHOLD_BYTES.
+    with stage("convert"):
+        upload_buffer, upload_name, info = prepare_upload(source, info=info, max_seconds=MAX_AUDIO_SECONDS)
+    passthrough = PASSTHROUGH and info and (info["container"], info["codec"]) in PASSTHROUGH_CODECS
+    UPLOADS.inc(format=fmt, path="passthrough" if passthrough else "transcode")
+    try:
+        with stage("transcribe"):
+            return transcribe_audio(upload_buffer, upload_name, info and info["duration"])
+    finally:
+        upload_buffer.close()
+
+def _limit_response(e):
+    UPLOADS_REJECTED.inc(reason=e.reason)
+    return jsonify({'error': str(e)}), 413
+
+@app.errorhandler(413)
+def _request_too_large(e):
+    UPLOADS_REJECTED.inc(reason="size")
+    return jsonify({'error': f'Upload is too large; the limit is {MAX_UPLOAD_BYTES:,} bytes'}), 413
+
 @app.route('/')
 def index():
     return render_template('form.html')
 
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
-    if 'audio' not in request.files:
+    with metrics.stage("upload_read"):
+        has_audio = 'audio' in request.files
+    if not has_audio:
         return jsonify({'error': 'No audio file provided'}), 400
 
     file = request.files['audio']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.filename)[1], delete=False) as temp_audio_file:
-        temp_audio_file.write(file.read())
-        temp_audio_file_path = temp_audio_file.name
-
     try:
-        if not temp_audio_file_path.lower().endswith('.wav'):
-             wav_path = convert_to_wav(temp_audio_file_path)
-             try: os.remove(temp_audio_file_path)
-             except: pass
-        else:
-             wav_path = temp_audio_file_path
+        # 1. Transcribe audio
+        raw_text = transcribe_recording(file.stream)
+        if _wants_event_stream():
+            return correction_event_stream({'raw_transcription': raw_text}, request.form.get('field'))
 
-    except Exception as e:
-        if os.path.exists(temp_audio_file_path):
-            os.remove(temp_audio_file_path)
-        return jsonify({'error': 'Audio conversion failed: ' + str(e)}), 500
+        # 2. AI Correction, skipped for structured fields and clean text
+        with metrics.stage("correct"):
+            corrected_text = ai_correct_text(raw_text, request.form.get('field'))
 
-    try:
-        # 1. Transcribe audio
-        raw_text = transcribe_audio(wav_path)
-        
-        # 2. AI Correction (Optional, can be toggled via frontend in future)
-        # For now, let's provide it as part of the result
-        corrected_text = ai_correct_text(raw_text)
-        
+    except AudioLimitError as e:
+        return _limit_response(e)
     except Exception as e:
         return jsonify({'error': 'Processing failed: ' + str(e)}), 500
-    finally:
-        if os.path.exists(wav_path):
-            os.remove(wav_path)
 
     return jsonify({
         'raw_transcription': raw_text,
         'paraphrased_text': corrected_text 
     })
 
-@app.route('/submit', methods=['POST'])
-def submit():
-    data = request.json
-    excel_file = 'data.xlsx'
-    csv_file = 'data.csv'
-    headers = [
-        "Name", "Place", "Age", "Gender", "Symptoms", "Diagnosis", "Prescription"
-    ]
-    row_data = [
-        data.get('name'),
-        data.get('place'),
-        data.get('age'),
-        data.get('gender'),
-        data.get('symptoms'),
-        data.get('diagnosis'),
-        data.get('prescription')
-    ]
+@app.route('/transcribe/form', methods=['POST'])
+def transcribe_form():
+    """
+    Whole-form dictation: one recording, one transcription and one LLM call
+    fill every field. The response has the fields plus, per field, where the
+    value came from ("llm", "labels" or "empty").
+    """
+    file = request.files.get('audio')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No audio file provided'}), 400
+    try:
+        raw_text = transcribe_recording(file.stream)
+        with metrics.stage("extract"):
+            fields, sources = extract_form_fields(raw_text)
+    except AudioLimitError as e:
+        return _limit_response(e)
+    except Exception as e:
+        return jsonify({'error': 'Processing failed: ' + str(e)}), 500
+    return jsonify({'raw_transcription': raw_text, 'fields': fields, 'sources': sources})
+
+# --- Transcription jobs ---
+# POST /transcribe/jobs only buffers the upload and returns a job id; the
+# conversion, Whisper and correction calls run on a bounded worker pool.
+job_queue = JobQueue()
+
+def _run_transcription_job(job, upload, field, info):
+    try:
+        raw_text = transcribe_recording(upload, job, info)
+        with _stage("correct", job):
+            corrected_text = ai_correct_text(raw_text, field)
+    finally:
+        upload.close()
+    return {
+        'raw_transcription': raw_text,
+        'paraphrased_text': corrected_text
+    }
+
+@app.route('/transcribe/jobs', methods=['POST'])
+def create_transcription_job():
+    with metrics.stage("upload_read"):
+        has_audio = 'audio' in request.files
+    if not has_audio:
+        return jsonify({'error': 'No audio file provided'}), 400
+
+    file = request.files['audio']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+
+    # Oversized recordings are refused here rather than from the queue.
+    try:
+        with metrics.stage("upload_check"):
+            info = check_upload(file.stream)
+    except AudioLimitError as e:
+        return _limit_response(e)
+
+    upload = new_buffer()
+    with metrics.stage("upload_read"):
+        shutil.copyfileobj(file.stream, upload, COPY_CHUNK_SIZE)
+    upload.seek(0)
+    try:
+        job = job_queue.submit(_run_transcription_job, upload, request.form.get('field'), info)
+    except QueueFullError as e:
+        upload.close()
+        return jsonify({'error': 'Transcription queue is full: ' + str(e)}), 503
 
-    # --- Save to Excel ---
-    if not os.path.exists(excel_file):
-        wb = Workbook()
-        ws = wb.active
-        ws.append(headers)
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/transcribe/jobs/{job.id}'
+    }), 202
+
+@app.route('/transcribe/jobs/<job_id>')
+def get_transcription_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/transcribe/queue')
+def transcription_queue_stats():
+    return jsonify(job_queue.stats())
+
+# --- Streaming transcription ---
+# The browser posts recorder chunks as they are produced. Only the first chunk
+# carries the container header, so each session feeds its chunks to one
+# long-running ffmpeg decoder and keeps the PCM that has not been transcribed
+# yet. Once at least one segment is available, the audio up to the last pause
+# is sent, so cuts never fall mid-word.
+STREAM_SEGMENT_SECONDS = float(os.environ.get("STREAM_SEGMENT_SECONDS", "5"))
+STREAM_MIN_TAIL_MS = 300
+STREAM_SESSION_TTL = 600
+
+stream_sessions = {}
+stream_sessions_lock = threading.Lock()
+
+def _get_stream_session(session_id):
+    now = time.time()
+    with stream_sessions_lock:
+        expired = [sid for sid, s in stream_sessions.items() if now - s['updated'] > STREAM_SESSION_TTL]
+        for sid in expired:
+            _discard_stream_session(stream_sessions.pop(sid))
+        session = stream_sessions.get(session_id)
+        if session is None:
+            session = {
+                'decoder': None,
+                'bytes': 0,
+                'pcm': bytearray(),
+                'decoded_ms': 0,
+                'next_seq': 0,
+                'segments': [],
+                'lock': threading.Lock(),
+                'updated': now,
+            }
+            stream_sessions[session_id] = session
+        session['updated'] = now
+        return session
+
+def _discard_stream_session(session):
+    if session and session['decoder']:
+        session['decoder'].kill()
+
+def _close_stream_session(session_id):
+    with stream_sessions_lock:
+        _discard_stream_session(stream_sessions.pop(session_id, None))
+
+def _transcribe_stream_segment(session, final):
+    """
+    Decodes the newly received bytes and transcribes the untranscribed audio
+    up to its last pause once a full segment (or, on the final chunk, any
+    remaining audio) is available.
+    """
+    decoder = session['decoder']
+    if decoder is None:
+        return ""
+    with metrics.stage("convert"):
+        pcm = decoder.close() if final else decoder.read()
+    session['pcm'] += pcm
+    tail = DecodedAudio(bytes(session['pcm']), decoder.sample_rate, decoder.channels)
+    session['decoded_ms'] += DecodedAudio(pcm, decoder.sample_rate, decoder.channels).duration_ms
+    check_duration(session['decoded_ms'] / 1000, MAX_AUDIO_SECONDS)
+    pending = tail.duration_ms
+    if pending < STREAM_SEGMENT_SECONDS * 1000 and not (final and pending >= STREAM_MIN_TAIL_MS):
+        return ""
+
+    # Only regions followed by a pause are ready; the rest waits for the
+    # next chunk. With vad only speech is sent, otherwise everything up to
+    # the cut.
+    settled_ms = tail.duration_ms if final else tail.duration_ms - VAD_MIN_SILENCE_MS
+    regions = speech_regions(tail, SEGMENT_MAX_SECONDS * 1000)
+    ready_regions = [region for region in regions if region[1] <= settled_ms]
+    if ready_regions:
+        end_ms = ready_regions[-1][1]
+    elif not regions:
+        end_ms = max(settled_ms, 0)
     else:
-        wb = load_workbook(excel_file)
-        ws = wb.active
-    ws.append(row_data)
-    wb.save(excel_file)
+        return ""
+    if not ready_regions:
+        ready = []
+    elif SEGMENTATION == "vad":
+        ready = pack_regions(tail, ready_regions, SEGMENT_MAX_SECONDS * 1000)
+    else:
+        ready = [AudioChunk(tail, 0, end_ms)]
+
+    with metrics.stage("transcribe"):
+        texts = [transcribe_audio(*segment.encode(), segment.duration_s) for segment in ready]
+    text = " ".join(t for t in texts if t)
+    del session['pcm'][:len(tail.view(0, end_ms))]
+    if text:
+        session['segments'].append(text)
+    return text
+
+@app.route('/transcribe/stream', methods=['POST'])
+def transcribe_stream():
+    """
+    Accepts one recorder chunk per request and returns the incremental
+    transcript. The request with final=1 flushes the remaining audio, runs the
+    AI correction on the full transcript and closes the session.
+    """
+    session_id = request.form.get('session')
+    if not session_id:
+        return jsonify({'error': 'No session id provided'}), 400
+    try:
+        seq = int(request.form.get('seq', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid chunk sequence number'}), 400
+    final = request.form.get('final') == '1'
+
+    file = request.files.get('audio')
+    session = _get_stream_session(session_id)
+
+    with session['lock']:
+        if seq != session['next_seq']:
+            return jsonify({'error': f"Expected chunk {session['next_seq']}, got {seq}"}), 409
+        session['next_seq'] += 1
+        try:
+            if file:
+                # The whole session counts against the upload limit.
+                check_size(session['bytes'] + (stream_size(file.stream) or 0))
+                while True:
+                    block = file.stream.read(COPY_CHUNK_SIZE)
+                    if not block:
+                        break
+                    session['bytes'] += len(block)
+                    check_size(session['bytes'])
+                    if session['decoder'] is None:
+                        session['decoder'] = StreamDecoder()
+                    session['decoder'].feed(block)
+            segment_text = _transcribe_stream_segment(session, final)
+        except AudioLimitError as e:
+            _close_stream_session(session_id)
+            return _limit_response(e)
+        except Exception as e:
+            _close_stream_session(session_id)
+            return jsonify({'error': 'Processing failed: ' + str(e)}), 500
+
+        partial_text = " ".join(session['segments'])
+        result = {
+            'session': session_id,
+            'seq': seq,
+            'final': final,
+            'segment_text': segment_text,
+            'partial_text': partial_text,
+        }
+        if final:
+            _close_stream_session(session_id)
+            result['raw_transcription'] = partial_text
+            if _wants_event_stream():
+                return correction_event_stream(result, request.form.get('field'))
+            with metrics.stage("correct"):
+                result['paraphrased_text'] = ai_correct_text(partial_text, request.form.get('field'))
+
+    return jsonify(result)
+
+# --- Patient Records ---
+# sqlite is the system of record; data.xlsx and data.csv are exports.
+record_store = RecordStore()
+record_store.import_csv()
+record_exports = ExportScheduler(record_store)
 
-    # --- Save to CSV ---
-    file_exists = os.path.isfile(csv_file)
-    with open(csv_file, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(headers)
-        writer.writerow(row_data)
+@app.route('/submit', methods=['POST'])
+def submit():
+    data = request.json or {}
+    with metrics.stage("record_insert"):
+        record_id = record_store.insert(data)
+    record_exports.mark_dirty()
+    return jsonify({'message': 'Record saved successfully.', 'record_id': record_id})
+
+@app.route('/export/<fmt>')
+def export_records(fmt):
+    """Writes a fresh Excel or CSV export of all records and downloads it."""
+    from flask import send_file
+    if fmt not in ('xlsx', 'csv'):
+        return jsonify({'error': 'Unknown export format; use xlsx or csv'}), 404
+    with metrics.stage("export"):
+        if fmt == 'xlsx':
+            path = record_store.export_xlsx(EXCEL_EXPORT_PATH)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            path = record_store.export_csv(CSV_EXPORT_PATH)
+            mimetype = 'text/csv'
+    return send_file(os.path.abspath(path), as_attachment=True,
+                     download_name=f"patient_records.{fmt}", mimetype=mimetype)
 
-    return jsonify({'message': 'Data saved successfully to Excel and CSV.'})
+@app.route('/records/stats')
+def record_stats():
+    return jsonify({'records': record_store.count(), 'export': record_exports.stats()})
 
 @app.route('/generate_pdf', methods=['POST'])
 def generate_pdf():
     if not HAS_REPORTLAB:
         return jsonify({'error': 'PDF generation library (reportlab) is not installed on this system.'}), 501
-    
-    data = request.json
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    # --- Header ---
-    p.setFillColor(colors.HexColor("#0f172a")) # Primary Navy
-    p.rect(0, height-80, width, 80, fill=1)
-    
-    p.setFillColor(colors.white)
-    p.setFont("Helvetica-Bold", 24)
-    p.drawString(40, height-50, "MEDICAL PRESCRIPTION")
-    
-    p.setFont("Helvetica", 10)
-    p.drawString(width-180, height-30, "ClinicaSync Digital Scribe")
-    p.drawString(width-180, height-45, f"Date: {data.get('date', 'Today')}")
-
-    # --- Patient Info ---
-    p.setFillColor(colors.black)
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, height-120, "PATIENT INFORMATION")
-    p.line(40, height-125, 200, height-125)
-    
-    p.setFont("Helvetica", 12)
-    p.drawString(40, height-150, f"Name: {data.get('name', 'N/A')}")
-    p.drawString(40, height-170, f"Age: {data.get('age', 'N/A')}")
-    p.drawString(250, height-150, f"Gender: {data.get('gender', 'N/A')}")
-    p.drawString(250, height-170, f"Place: {data.get('place', 'N/A')}")
-
-    # --- Clinical Details ---
-    y = height - 220
-    sections = [
-        ("SYMPTOMS", data.get('symptoms', 'N/A')),
-        ("DIAGNOSIS", data.get('diagnosis', 'N/A')),
-        ("PRESCRIPTION", data.get('prescription', 'N/A'))
-    ]
 
-    for title, content in sections:
-        p.setFont("Helvetica-Bold", 12)
-        p.setFillColor(colors.HexColor("#0d9488")) # Secondary Teal
-        p.drawString(40, y, title)
-        y -= 20
-        p.setFillColor(colors.black)
-        p.setFont("Helvetica", 11)
-        
-        text_obj = p.beginText(40, y)
-        text_obj.setTextOrigin(40, y)
-        text_obj.setFont("Helvetica", 11)
-        
-        words = content.split()
-        line = ""
-        for word in words:
-            if p.stringWidth(line + " " + word) < width - 80:
-                line += " " + word
-            else:
-                text_obj.textLine(line.strip())
-                line = word
-                y -= 15
-        text_obj.textLine(line.strip())
-        p.drawText(text_obj)
-        y -= 40
-
-    p.setFont("Helvetica-Oblique", 9)
-    p.setFillColor(colors.gray)
-    p.drawCentredString(width/2, 40, "Digitally generated by ClinicaSync AI Medical Scribe")
-
-    p.showPage()
-    p.save()
-    
-    buffer.seek(0)
+    data = request.json or {}
+    with metrics.stage("pdf_render"):
+        buffer = BytesIO(render_prescription(data))
     from flask import send_file
-    return send_file(buffer, as_attachment=True, download_name=f"prescription_{data.get('name', 'patient')}.pdf", mimetype='application/pdf')
+    return send_file(buffer, as_attachment=True, download_name=pdf_filename(data), mimetype='application/pdf')
+
+@app.route('/generate_pdf/batch', methods=['GET', 'POST'])
+def generate_pdf_batch():
+    """
+    Renders many stored records at once, as one PDF or a ZIP of PDFs.
+    POST {"ids": [...], "date": "YYYY-MM-DD", "records": [...], "format": "pdf"|"zip"}
+    or GET ?date=YYYY-MM-DD&format=zip (ids as ?ids=1,2,3).
+    """
+    if not HAS_REPORTLAB:
+        return jsonify({'error': 'PDF generation library (reportlab) is not installed on this system.'}), 501
+
+    if request.method == 'POST':
+        body = request.json or {}
+    else:
+        body = dict(request.args)
+        if body.get('ids'):
+            body['ids'] = body['ids'].split(',')
+    fmt = body.get('format', 'pdf')
+    if fmt not in ('pdf', 'zip'):
+        return jsonify({'error': 'format must be pdf or zip'}), 400
+
+    try:
+        records = list(body.get('records') or [])
+        if body.get('ids') or body.get('date'):
+            stored = record_store.find(ids=body.get('ids'), day=body.get('date'))
+            for record in stored:
+                record['date'] = record_date(record['created_at'])
+            records.extend(stored)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid ids or date: {e}'}), 400
+    if not records:
+        return jsonify({'error': 'No records to render'}), 404
+    if len(records) > PDF_BATCH_LIMIT:
+        return jsonify({'error': f'At most {PDF_BATCH_LIMIT} records per batch'}), 413
+
+    with metrics.stage("pdf_batch_render"):
+        data, mimetype, ext = render_batch(records, fmt)
+    name = f"prescriptions_{body.get('date') or len(records)}.{ext}"
+    from flask import send_file
+    return send_file(BytesIO(data), as_attachment=True, download_name=name, mimetype=mimetype)
+
+@app.route('/correct', methods=['POST'])
+def correct_fields():
+    """
+    Corrects several form fields with one LLM request.
+    Body: {"fields": {"symptoms": "...", "diagnosis": "..."}}
+    """
+    fields = (request.json or {}).get('fields') or {}
+    if not isinstance(fields, dict):
+        return jsonify({'error': 'fields must be an object'}), 400
+    names = list(fields)
+    corrected = ai_correct_batch([str(fields[name] or '') for name in names], names)
+    return jsonify({'fields': dict(zip(names, corrected))})
+
+@app.route('/correction/stats')
+def correction_stats():
+    with correction_decisions_lock:
+        return jsonify(dict(correction_decisions))
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        'transcripts': transcript_cache.snapshot(),
+        'corrections': correction_cache.snapshot(),
+    })
+
+@app.route('/upstream/stats')
+def upstream_stats():
+    return jsonify(upstream.stats())
+
+# --- Metrics ---
+@app.before_request
+def _start_request_timing():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def _finish_request_timing(response):
+    seconds = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or 'unknown'
+    metrics.REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    BYTES.inc(request.content_length or 0, direction="in", kind="client")
+    if not response.is_streamed and response.content_length:
+        BYTES.inc(response.content_length, direction="out", kind="client")
+    # Stage timings for the browser's timing report (and devtools).
+    stages = metrics.request_stages() or {}
+    response.headers['Server-Timing'] = ", ".join(
+        [f"{name};dur={value * 1000:.1f}" for name, value in stages.items()] + [f"total;dur={seconds * 1000:.1f}"])
+    if TIMING_LOG and endpoint not in ('metrics_endpoint', 'static'):
+        print(json.dumps({
+            'event': 'request_timing',
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'seconds': round(seconds, 4),
+            'bytes_in': request.content_length or 0,
+            'bytes_out': response.content_length,
+            'stages': stages,
+        }))
+    return response
+
+@app.teardown_request
+def _end_request_timing(exc):
+    metrics.end_request()
+
+def _collect_app_metrics():
+    caches = {'transcripts': transcript_cache.snapshot(), 'corrections': correction_cache.snapshot()}
+    queue = job_queue.stats()
+    with correction_decisions_lock:
+        decisions = dict(correction_decisions)
+    endpoints = upstream.stats()['endpoints']
+    return [
+        ('app_cache_events_total', 'counter', 'Transcript/correction cache hits, misses and evictions',
+         [({'cache': name, 'event': event}, snap[event])
+          for name, snap in caches.items()
+          for event in ('memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions')]),
+        ('app_job_queue_depth', 'gauge', 'Transcription jobs waiting for a worker', [({}, queue['queue_depth'])]),
+        ('app_job_running', 'gauge', 'Transcription jobs running', [({}, queue['running'])]),
+        ('app_jobs_total', 'counter', 'Transcription jobs by outcome',
+         [({'outcome': k}, v) for k, v in queue['totals'].items()]),
+        ('app_correction_decisions_total', 'counter', 'LLM correction decisions by reason',
+         [({'reason': k}, v) for k, v in decisions.items()]),
+        ('app_upstream_events_total', 'counter', 'Upstream calls, errors, retries and circuit rejections',
+         [({'endpoint': name, 'event': event}, stats[event])
+          for name, stats in endpoints.items() for event in ('calls', 'errors', 'retries', 'rejected')]),
+        ('app_upstream_circuit_open', 'gauge', '1 while the endpoint circuit breaker is open',
+         [({'endpoint': name}, int(stats['circuit'] == 'open')) for name, stats in endpoints.items()]),
+        ('app_records', 'gauge', 'Stored patient records', [({}, record_store.count())]),
+    ]
+
+metrics.register_collector(_collect_app_metrics)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/client', methods=['POST'])
+def client_metrics():
+    """Timing report the browser sends after each recording (see script.js)."""
+    report = request.get_json(silent=True) or {}
+    codec = report.get('codec') if report.get('codec') in ('opus', 'flac', 'native') else 'other'
+    try:
+        audio_seconds = float(report.get('audio_seconds') or 0)
+        if report.get('encode_ms') is not None:
+            CLIENT_SECONDS.observe(float(report['encode_ms']) / 1000, codec=codec, phase='encode')
+        if report.get('stop_to_text_ms') is not None:
+            CLIENT_SECONDS.observe(float(report['stop_to_text_ms']) / 1000, codec=codec, phase='stop_to_text')
+        if audio_seconds > 0 and report.get('bytes'):
+            CLIENT_BITRATE.observe(float(report['bytes']) * 8 / audio_seconds / 1000, codec=codec)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid timing report'}), 400
+    return '', 204
 
 @app.route('/dashboard')
 def dashboard():
-    entries = []
-    csv_file = 'data.csv'
-    if os.path.exists(csv_file):
-        with open(csv_file, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            entries = list(reader)
-    return render_template('dashboard.html', entries=entries)
+    # Records are fetched page by page from /api/records.
+    return render_template('dashboard.html', page_size=PAGE_SIZE)
+
+@app.route('/api/records')
+def api_records():
+    """
+    GET ?q=search&sort=created|name|place|diagnosis&order=asc|desc&limit=N&cursor=...
+    """
+    try:
+        page = record_store.page(
+            search=request.args.get('q'),
+            sort=request.args.get('sort', 'created'),
+            order=request.args.get('order', 'desc'),
+            limit=request.args.get('limit', PAGE_SIZE),
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,704 @@
+"""
+In-Memory Audio Pipeline
+
+Converts uploaded audio by piping it through the ffmpeg binary shipped with
+imageio-ffmpeg (stdin -> stdout) instead of writing temporary files for
+pydub. Converted audio is kept in a spooled buffer that only moves to disk
+once it grows past AUDIO_SPILL_THRESHOLD_BYTES.
+
+Audio sent to the transcription API is encoded as 16 kHz mono in a compact
+format (AUDIO_UPLOAD_FORMAT) rather than PCM WAV, and recordings whose codec
+the API already accepts are passed through without re-encoding.
+
+mp4/mov/m4a files with their index at the end (not "faststart") cannot be
+demuxed from a pipe, so those uploads are decoded from a temporary file.
+
+Uploads are checked against MAX_UPLOAD_BYTES and MAX_AUDIO_SECONDS from
+their size and a header probe before any decoding (check_upload). When the
+header carries no duration (e.g. MediaRecorder webm), the recording is
+decoded once without keeping the audio, stopping just past the limit, before
+anything is sent (prepare_upload, decoded_seconds).
+"""
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from contextlib import contextmanager
+from io import BytesIO
+
+from core import ffmpeg_exe
+
+FFMPEG_EXE = ffmpeg_exe()
+
+# Buffers larger than this are spilled to a temporary file on disk.
+SPILL_THRESHOLD_BYTES = int(os.environ.get("AUDIO_SPILL_THRESHOLD_BYTES", 32 * 1024 * 1024))
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Target encoding for audio uploaded to the transcription API:
+# flac (lossless), opus (ogg), webm (opus in webm) or wav.
+UPLOAD_FORMAT = os.environ.get("AUDIO_UPLOAD_FORMAT", "flac").lower()
+# Skip re-encoding when the recording already uses a codec the API accepts.
+PASSTHROUGH = os.environ.get("AUDIO_PASSTHROUGH", "1") != "0"
+UPLOAD_SAMPLE_RATE = 16000
+PROBE_BYTES = 256 * 1024
+
+# Upload limits; 0 disables a limit. 25 MB is also the Whisper API's limit.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+MAX_AUDIO_SECONDS = float(os.environ.get("MAX_AUDIO_SECONDS", 1800))
+
+# format -> (ffmpeg codec, ffmpeg muxer, file extension, extra codec args)
+UPLOAD_FORMATS = {
+    "flac": ("flac", "flac", "flac", []),
+    "opus": ("libopus", "ogg", "ogg", ["-b:a", "24k", "-application", "voip"]),
+    "webm": ("libopus", "webm", "webm", ["-b:a", "24k", "-application", "voip"]),
+    "wav": ("pcm_s16le", "wav", "wav", []),
+}
+
+# (container, codec) pairs the Whisper endpoint decodes as-is, with the file
+# extension it expects for them.
+PASSTHROUGH_CODECS = {
+    ("matroska,webm", "opus"): "webm",
+    ("matroska,webm", "vorbis"): "webm",
+    ("ogg", "opus"): "ogg",
+    ("ogg", "vorbis"): "ogg",
+    ("flac", "flac"): "flac",
+    ("mp3", "mp3"): "mp3",
+    ("mov,mp4,m4a,3gp,3g2,mj2", "aac"): "m4a",
+}
+
+
+def new_buffer():
+    return tempfile.SpooledTemporaryFile(max_size=SPILL_THRESHOLD_BYTES)
+
+
+def _feed_stdin(proc, source):
+    try:
+        shutil.copyfileobj(source, proc.stdin, COPY_CHUNK_SIZE)
+    except (BrokenPipeError, OSError):
+        # ffmpeg exited early; the error is reported from its return code.
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+
+def _start_ffmpeg(input_args, output_args, source=None):
+    """
+    Starts ffmpeg writing to stdout. When source is given it is streamed to
+    ffmpeg's stdin from a thread so that reading stdout never deadlocks on a
+    full pipe. Returns (proc, threads, stderr_chunks).
+    """
+    cmd = [FFMPEG_EXE, "-hide_banner", "-loglevel", "error"]
+    if source is None:
+        cmd.append("-nostdin")
+    cmd += input_args + output_args + ["pipe:1"]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if source is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr_chunks = []
+    threads = [threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)]
+    if source is not None:
+        threads.append(threading.Thread(target=_feed_stdin, args=(proc, source), daemon=True))
+    for t in threads:
+        t.start()
+    return proc, threads, stderr_chunks
+
+
+class NoAudioError(RuntimeError):
+    """A recording decoded to no audio at all (damaged or unsupported file)."""
+
+
+_PROGRESS_RE = re.compile(r"\w+=")
+_OUT_TIME_RE = re.compile(r"^out_time_us=(\d+)$", re.MULTILINE)
+
+
+def _ffmpeg_error(proc, stderr_chunks):
+    lines = b"".join(stderr_chunks).decode("utf-8", "replace").splitlines()
+    message = "\n".join(line for line in lines if not _PROGRESS_RE.match(line)).strip()
+    return RuntimeError(f"ffmpeg failed ({proc.returncode}): {message}")
+
+
+def _run_ffmpeg(input_args, output_args, source=None, progress=False):
+    """
+    Runs ffmpeg and returns its output in a spooled buffer. With progress,
+    returns (buffer, seconds) with the duration of audio ffmpeg wrote.
+    """
+    if progress:
+        input_args = ["-progress", "pipe:2", "-nostats"] + input_args
+    proc, threads, stderr_chunks = _start_ffmpeg(input_args, output_args, source)
+    output = new_buffer()
+    try:
+        shutil.copyfileobj(proc.stdout, output, COPY_CHUNK_SIZE)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        for t in threads:
+            t.join()
+
+    if proc.returncode != 0:
+        output.close()
+        raise _ffmpeg_error(proc, stderr_chunks)
+    output.seek(0)
+    if progress:
+        out_times = _OUT_TIME_RE.findall(b"".join(stderr_chunks).decode("utf-8", "replace"))
+        return output, int(out_times[-1]) / 1e6 if out_times else 0.0
+    return output
+
+
+def _stream_ffmpeg(input_args, output_args, source=None):
+    """
+    Runs ffmpeg and yields its output in COPY_CHUNK_SIZE blocks as they are
+    produced. Closing the generator early stops ffmpeg.
+    """
+    proc, threads, stderr_chunks = _start_ffmpeg(input_args, output_args, source)
+    completed = False
+    try:
+        while True:
+            block = proc.stdout.read(COPY_CHUNK_SIZE)
+            if not block:
+                break
+            yield block
+        completed = True
+    finally:
+        if not completed:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        for t in threads:
+            t.join()
+    if proc.returncode != 0:
+        raise _ffmpeg_error(proc, stderr_chunks)
+
+
+def _fix_wav_header(buffer):
+    """
+    ffmpeg cannot seek back on a pipe, so the RIFF and data chunk sizes it
+    writes are placeholders. Rewrite them from the actual buffer length.
+    """
+    buffer.seek(0, os.SEEK_END)
+    total = buffer.tell()
+    buffer.seek(0)
+    header = buffer.read(12)
+    if total < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        buffer.seek(0)
+        return buffer
+    buffer.seek(4)
+    buffer.write(struct.pack("<I", min(total - 8, 0xFFFFFFFF)))
+
+    pos = 12
+    while pos + 8 <= total:
+        buffer.seek(pos)
+        chunk_id, size = struct.unpack("<4sI", buffer.read(8))
+        if chunk_id == b"data":
+            buffer.seek(pos + 4)
+            buffer.write(struct.pack("<I", min(total - pos - 8, 0xFFFFFFFF)))
+            break
+        pos += 8 + size + (size & 1)
+    buffer.seek(0)
+    return buffer
+
+
+_INPUT_RE = re.compile(r"Input #0, (.+?), from")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_AUDIO_RE = re.compile(r"Stream #0:\d+\S*: Audio: (\w+)[^,]*, (\d+) Hz, ([^,]+)")
+
+
+def probe_audio(data):
+    """
+    Reads container, codec, sample rate, channels and (when the header has
+    it) duration from the first bytes of a recording (or from a file path)
+    by running `ffmpeg -i` on them. Returns None if ffmpeg cannot identify
+    the stream.
+    """
+    if isinstance(data, (str, os.PathLike)):
+        args, data = ["-i", os.fspath(data)], None
+    else:
+        args = ["-i", "pipe:0"]
+    proc = subprocess.run(
+        [FFMPEG_EXE, "-hide_banner"] + args,
+        input=data, stdin=None if data is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    info = proc.stderr.decode("utf-8", "replace")
+    container = _INPUT_RE.search(info)
+    stream = _AUDIO_RE.search(info)
+    if not container or not stream:
+        return None
+    duration = _DURATION_RE.search(info)
+    channels = stream.group(3).strip()
+    return {
+        "container": container.group(1),
+        "codec": stream.group(1),
+        "sample_rate": int(stream.group(2)),
+        "channels": 1 if channels == "mono" else 2 if channels == "stereo" else channels,
+        "duration": (int(duration.group(1)) * 3600 + int(duration.group(2)) * 60
+                     + float(duration.group(3))) if duration else None,
+    }
+
+
+class AudioLimitError(ValueError):
+    """A recording is larger or longer than the configured limits."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def stream_size(stream):
+    """Bytes from the current position to the end of a seekable stream, else None."""
+    try:
+        if not stream.seekable():
+            return None
+        pos = stream.tell()
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def check_size(size, max_bytes=MAX_UPLOAD_BYTES):
+    if max_bytes and size is not None and size > max_bytes:
+        raise AudioLimitError(
+            f"Recording is {size:,} bytes; the limit is {max_bytes:,} bytes", "size")
+
+
+def check_duration(seconds, max_seconds=MAX_AUDIO_SECONDS):
+    if max_seconds and seconds is not None and seconds > max_seconds:
+        raise AudioLimitError(
+            f"Recording is {seconds:.0f} s long; the limit is {max_seconds:.0f} s", "duration")
+
+
+def check_upload(source, max_bytes=MAX_UPLOAD_BYTES, max_seconds=MAX_AUDIO_SECONDS):
+    """
+    Rejects a seekable upload that is too large, or whose header gives a
+    duration over the limit, without decoding it. Returns the probe info
+    (None if ffmpeg cannot identify the stream) for prepare_upload; the
+    stream is left where it was.
+    """
+    check_size(stream_size(source), max_bytes)
+    pos = source.tell()
+    head = source.read(PROBE_BYTES)
+    source.seek(pos)
+    info = probe_audio(head)
+    if info is None and index_at_end(head):
+        # The header is at the end of the file; probe a seekable copy.
+        with seekable_copy(source) as path:
+            info = probe_audio(path)
+        source.seek(pos)
+    if info is not None:
+        check_duration(info["duration"], max_seconds)
+    return info
+
+
+class _PrefixedStream:
+    """Replays already-read bytes before the rest of a non-seekable stream."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = BytesIO(prefix)
+        self._stream = stream
+
+    def read(self, size=-1):
+        data = self._prefix.read(size)
+        if size is None or size < 0:
+            return data + self._stream.read()
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+
+def index_at_end(head):
+    """
+    Whether the first bytes of a recording are an mp4/mov/m4a file whose
+    index (the moov box) comes after the audio data (not "faststart").
+    ffmpeg cannot seek back to it on a pipe, so it finds no audio stream
+    and exits cleanly with no output. Fragmented mp4 (Safari's
+    MediaRecorder) has the moov box first and streams fine.
+    """
+    if head[4:8] != b"ftyp":
+        return False
+    pos = 0
+    while pos + 8 <= len(head):
+        size, kind = struct.unpack(">I4s", head[pos:pos + 8])
+        if kind == b"moov":
+            return False
+        if kind == b"mdat" or size == 0:
+            return True
+        if size == 1:
+            if pos + 16 > len(head):
+                break
+            size = struct.unpack(">Q", head[pos + 8:pos + 16])[0]
+        if size < 8:
+            break
+        pos += size
+    # No moov box among the boxes that start in the first bytes.
+    return True
+
+
+@contextmanager
+def seekable_copy(source):
+    """Copies a binary file object to a temporary file and yields its path."""
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        shutil.copyfileobj(source, temp_file, COPY_CHUNK_SIZE)
+        temp_path = temp_file.name
+    try:
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+@contextmanager
+def _ffmpeg_input(source):
+    """
+    Yields (input_args, stdin source) for decoding a path or a binary file
+    object. File objects are piped to ffmpeg, except mp4 recordings with the
+    index at the end (index_at_end), which are decoded from a temporary file.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield ["-i", os.fspath(source)], None
+        return
+    head = source.read(PROBE_BYTES)
+    if getattr(source, "seekable", lambda: False)():
+        source.seek(-len(head), os.SEEK_CUR)
+        stream = source
+    else:
+        stream = _PrefixedStream(head, source)
+    if not index_at_end(head):
+        yield ["-i", "pipe:0"], stream
+        return
+    with seekable_copy(stream) as path:
+        yield ["-i", path], None
+
+
+def encode_audio(source, fmt=None):
+    """
+    Encodes source (path or binary file object) to 16 kHz mono in the given
+    upload format. Returns (buffer, filename) ready for the API. Raises
+    NoAudioError rather than return a file without audio.
+    """
+    fmt = fmt or UPLOAD_FORMAT
+    codec, muxer, ext, extra = UPLOAD_FORMATS[fmt]
+    output_args = ["-vn", "-ar", str(UPLOAD_SAMPLE_RATE), "-ac", "1", "-c:a", codec] + extra + ["-f", muxer]
+    with _ffmpeg_input(source) as (input_args, stdin):
+        buffer, seconds = _run_ffmpeg(input_args, output_args, source=stdin, progress=True)
+    if seconds <= 0:
+        buffer.close()
+        raise NoAudioError("The recording contains no audio that could be decoded")
+    if fmt == "wav":
+        _fix_wav_header(buffer)
+    return buffer, f"audio.{ext}"
+
+
+def decoded_seconds(source, max_seconds=None, sample_rate=8000):
+    """
+    Decodes a recording (path or binary file object) without keeping the
+    audio and returns its length in seconds, for containers whose header
+    has no duration. With max_seconds, decoding stops just past the limit
+    and a longer recording raises AudioLimitError. A recording that decodes
+    to no audio raises NoAudioError rather than passing as 0 s.
+    """
+    output_args = _pcm_args(sample_rate, 1, max_seconds)
+    with _ffmpeg_input(source) as (input_args, stdin):
+        decoded = sum(len(block) for block in _stream_ffmpeg(input_args, output_args, source=stdin))
+    if not decoded:
+        raise NoAudioError("The recording contains no audio that could be decoded")
+    seconds = decoded / 2 / sample_rate
+    if max_seconds and seconds > max_seconds:
+        raise AudioLimitError(f"Recording is longer than the {max_seconds:.0f} s limit", "duration")
+    return seconds
+
+
+def prepare_upload(source, fmt=None, passthrough=None, info=None, max_seconds=None):
+    """
+    Probes the start of a recording and returns (buffer, filename, info).
+    Recordings the API accepts as-is are copied through untouched; anything
+    else is re-encoded to the upload format. Pass the info check_upload
+    returned to skip probing again. With max_seconds, a recording whose
+    header has no duration is measured first and rejected with
+    AudioLimitError if it is too long, before anything is converted.
+    """
+    passthrough = PASSTHROUGH if passthrough is None else passthrough
+    head = source.read(PROBE_BYTES)
+    if info is None:
+        info = probe_audio(head)
+    if source.seekable():
+        source.seek(-len(head), os.SEEK_CUR)
+        stream = source
+    else:
+        stream = _PrefixedStream(head, source)
+
+    spooled = None
+    try:
+        if max_seconds and not (info and info["duration"]):
+            if stream is not source:
+                # Keep a copy so the recording can be read twice.
+                stream = spooled = new_buffer()
+                shutil.copyfileobj(_PrefixedStream(head, source), spooled, COPY_CHUNK_SIZE)
+                spooled.seek(0)
+            start = stream.tell()
+            decoded_seconds(stream, max_seconds)
+            stream.seek(start)
+
+        ext = PASSTHROUGH_CODECS.get((info["container"], info["codec"])) if info else None
+        if passthrough and ext:
+            buffer = new_buffer()
+            shutil.copyfileobj(stream, buffer, COPY_CHUNK_SIZE)
+            buffer.seek(0)
+            return buffer, f"audio.{ext}", info
+
+        buffer, filename = encode_audio(stream, fmt)
+        return buffer, filename, info
+    finally:
+        if spooled is not None:
+            spooled.close()
+
+
+class AudioChunk:
+    """A view of [start_ms, end_ms) of a DecodedAudio; no samples are copied."""
+
+    def __init__(self, audio, start_ms, end_ms):
+        self.audio = audio
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+
+    @property
+    def pcm(self):
+        return self.audio.view(self.start_ms, self.end_ms)
+
+    @property
+    def duration_s(self):
+        return (self.end_ms - self.start_ms) / 1000
+
+    def wav(self):
+        return self.audio.wav(self.start_ms, self.end_ms)
+
+    def encode(self, fmt=None):
+        """Encodes the chunk in memory; returns (buffer, filename)."""
+        if (fmt or UPLOAD_FORMAT) == "wav":
+            return self.wav(), "audio.wav"
+        return encode_audio(self.wav(), fmt)
+
+
+class DecodedAudio:
+    """
+    A whole recording decoded once to 16-bit PCM in a single buffer. Chunks
+    are memoryview slices of that buffer and are only encoded when sent.
+    """
+
+    def __init__(self, pcm, sample_rate, channels=1):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = 2 * channels
+
+    @property
+    def duration_ms(self):
+        return len(self.pcm) // self.frame_size * 1000 / self.sample_rate
+
+    def _offset(self, ms):
+        frame = int(ms * self.sample_rate / 1000)
+        return min(frame * self.frame_size, len(self.pcm))
+
+    def view(self, start_ms, end_ms=None):
+        end = len(self.pcm) if end_ms is None else self._offset(end_ms)
+        return memoryview(self.pcm)[self._offset(start_ms):end]
+
+    def wav(self, start_ms=0, end_ms=None):
+        out = BytesIO()
+        with wave.open(out, "wb") as dst:
+            dst.setnchannels(self.channels)
+            dst.setsampwidth(2)
+            dst.setframerate(self.sample_rate)
+            dst.writeframes(self.view(start_ms, end_ms))
+        out.seek(0)
+        return out
+
+    def chunks(self, chunk_ms):
+        """Fixed-length chunks; the last one may be shorter (like make_chunks)."""
+        total = self.duration_ms
+        bounds = []
+        start = 0
+        while start < total:
+            bounds.append(AudioChunk(self, start, min(start + chunk_ms, total)))
+            start += chunk_ms
+        return bounds
+
+
+def load_audio(source, sample_rate=UPLOAD_SAMPLE_RATE, channels=1, max_seconds=None):
+    """
+    Decodes a recording (path or binary file object) straight to raw PCM at
+    the upload sample rate. Already-decoded audio is returned unchanged.
+    With max_seconds, decoding stops just past the limit and a longer
+    recording raises AudioLimitError.
+    """
+    if isinstance(source, DecodedAudio):
+        check_duration(source.duration_ms / 1000, max_seconds)
+        return source
+    output_args = _pcm_args(sample_rate, channels, max_seconds)
+    with _ffmpeg_input(source) as (input_args, stdin):
+        buffer = _run_ffmpeg(input_args, output_args, source=stdin)
+    try:
+        pcm = buffer.read()
+    finally:
+        buffer.close()
+    audio = DecodedAudio(pcm, sample_rate, channels)
+    if max_seconds and audio.duration_ms / 1000 > max_seconds:
+        # Decoding stopped at the limit, so the real length is unknown.
+        raise AudioLimitError(f"Recording is longer than the {max_seconds:.0f} s limit", "duration")
+    return audio
+
+
+def _pcm_args(sample_rate, channels, max_seconds):
+    output_args = ["-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels)]
+    if max_seconds:
+        output_args = ["-t", str(max_seconds + 1)] + output_args
+    return output_args
+
+
+class StreamDecoder:
+    """
+    Decodes a recording that arrives in pieces (recorder chunks) with one
+    long-running ffmpeg process: feed() writes the new bytes to its stdin and
+    read() returns the PCM decoded since the last call, so every byte is
+    decoded once however long the session runs. close() flushes the rest.
+    """
+
+    # read() returns once ffmpeg has produced nothing for IDLE_SECONDS, or
+    # after READ_TIMEOUT_SECONDS at most.
+    IDLE_SECONDS = 0.05
+    READ_TIMEOUT_SECONDS = 1.0
+
+    def __init__(self, sample_rate=UPLOAD_SAMPLE_RATE, channels=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # The recorder header describes the stream, so skip ffmpeg's long
+        # probe and flush every packet instead of waiting for a full buffer.
+        cmd = [FFMPEG_EXE, "-hide_banner", "-loglevel", "error", "-probesize", "32768", "-analyzeduration", "0",
+               "-i", "pipe:0"] + _pcm_args(sample_rate, channels, None) + ["-flush_packets", "1", "pipe:1"]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._pcm = bytearray()
+        self._activity = time.monotonic()
+        self._eof = False
+        self._cond = threading.Condition()
+        self._stderr_chunks = []
+        self._threads = [
+            threading.Thread(target=lambda: self._stderr_chunks.append(self._proc.stderr.read()), daemon=True),
+            threading.Thread(target=self._drain, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _drain(self):
+        while True:
+            block = self._proc.stdout.read1(COPY_CHUNK_SIZE)
+            with self._cond:
+                if not block:
+                    self._eof = True
+                else:
+                    self._pcm += block
+                    self._activity = time.monotonic()
+                self._cond.notify_all()
+            if not block:
+                return
+
+    def _take(self):
+        pcm = bytes(self._pcm)
+        self._pcm.clear()
+        return pcm
+
+    def feed(self, data):
+        with self._cond:
+            self._activity = time.monotonic()
+        try:
+            self._proc.stdin.write(data)
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise RuntimeError("ffmpeg stopped decoding the stream")
+
+    def read(self):
+        """PCM decoded since the last call, once ffmpeg has caught up."""
+        deadline = time.monotonic() + self.READ_TIMEOUT_SECONDS
+        with self._cond:
+            while not self._eof:
+                now = time.monotonic()
+                idle_until = self._activity + self.IDLE_SECONDS
+                if now >= idle_until or now >= deadline:
+                    break
+                self._cond.wait(min(idle_until, deadline) - now)
+            return self._take()
+
+    def close(self):
+        """Ends the input and returns the remaining PCM; raises if ffmpeg failed."""
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        self._proc.wait()
+        for t in self._threads:
+            t.join()
+        self._proc.stdout.close()
+        if self._proc.returncode != 0:
+            raise _ffmpeg_error(self._proc, self._stderr_chunks)
+        with self._cond:
+            return self._take()
+
+    def kill(self):
+        """Stops ffmpeg and discards anything not yet read."""
+        if self._proc.poll() is None:
+            self._proc.kill()
+        try:
+            self.close()
+        except RuntimeError:
+            pass
+
+
+def overlapping_segments(source, segment_ms, overlap_ms, sample_rate=UPLOAD_SAMPLE_RATE, max_seconds=None,
+                         min_tail_ms=1000):
+    """
+    Decodes a recording (path or binary file object) as a stream and yields
+    DecodedAudio segments of segment_ms, each starting overlap_ms before the
+    previous one ended. Only the PCM of about one segment is held at a time,
+    however long the recording. A last piece shorter than min_tail_ms is
+    added to the segment before it. Past max_seconds, AudioLimitError is
+    raised and decoding stops.
+    """
+    def to_bytes(ms):
+        return int(ms * sample_rate / 1000) * 2
+
+    segment_bytes = to_bytes(segment_ms)
+    step_bytes = segment_bytes - to_bytes(overlap_ms)
+    if step_bytes <= 0:
+        raise ValueError("The overlap must be shorter than the segment")
+    limit_bytes = to_bytes(max_seconds * 1000) if max_seconds else None
+    pending = bytearray()
+    decoded = 0
+    new_since_yield = False
+    with _ffmpeg_input(source) as (input_args, stdin):
+        blocks = _stream_ffmpeg(input_args, _pcm_args(sample_rate, 1, max_seconds), source=stdin)
+        try:
+            for block in blocks:
+                pending += block
+                decoded += len(block)
+                new_since_yield = True
+                if limit_bytes and decoded > limit_bytes:
+                    raise AudioLimitError(f"Recording is longer than the {max_seconds:.0f} s limit", "duration")
+                # Hold back a short tail so the last segment can absorb it.
+                while len(pending) >= segment_bytes + to_bytes(min_tail_ms):
+                    yield DecodedAudio(bytes(pending[:segment_bytes]), sample_rate)
+                    del pending[:step_bytes]
+                    new_since_yield = len(pending) > segment_bytes - step_bytes
+        finally:
+            blocks.close()
+    if pending and new_since_yield:
+        yield DecodedAudio(bytes(pending), sample_rate)
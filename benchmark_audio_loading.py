@@ -0,0 +1,138 @@
+"""
+Benchmark Audio Loading Script
+
+Compares the old benchmark loading path (convert_to_wav, decode the WAV to
+count chunks, decode it again and export every chunk to a temp file) with
+the decode-once path (one ffmpeg decode into a PCM buffer, chunk views
+encoded in memory). Each path runs in its own process so peak RSS is
+measured separately.
+
+Usage: python benchmark_audio_loading.py [audio_file] [--minutes N] [--chunk-len S]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from audio_pipeline import FFMPEG_EXE, load_audio
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(usage / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def legacy_load(audio_path, chunk_len):
+    from pydub.utils import make_chunks
+    from core import audio_segment
+    AudioSegment = audio_segment()
+
+    audio = AudioSegment.from_file(audio_path)
+    wav_path = audio_path + ".wav"
+    audio.export(wav_path, format="wav")
+    try:
+        audio = AudioSegment.from_file(wav_path)
+        n_chunks = len(make_chunks(audio, chunk_len * 1000))
+
+        audio = AudioSegment.from_file(wav_path)
+        upload_bytes = 0
+        for chunk in make_chunks(audio, chunk_len * 1000):
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+                chunk.export(temp_file.name, format="wav")
+                temp_path = temp_file.name
+            with open(temp_path, "rb") as f:
+                upload_bytes += len(f.read())
+            os.remove(temp_path)
+    finally:
+        os.remove(wav_path)
+    return n_chunks, upload_bytes
+
+
+def decode_once_load(audio_path, chunk_len):
+    audio = load_audio(audio_path)
+    chunks = audio.chunks(chunk_len * 1000)
+    upload_bytes = 0
+    for chunk in chunks:
+        upload, _ = chunk.encode("wav")
+        upload_bytes += len(upload.getvalue())
+    return len(chunks), upload_bytes
+
+
+MODES = {
+    "legacy (3 decodes + temp files)": legacy_load,
+    "decode once (in-memory views)": decode_once_load,
+}
+
+
+def run_mode(mode, audio_path, chunk_len):
+    start = time.perf_counter()
+    n_chunks, upload_bytes = MODES[mode](audio_path, chunk_len)
+    print(json.dumps({
+        "seconds": time.perf_counter() - start,
+        "chunks": n_chunks,
+        "upload_bytes": upload_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def make_long_file(minutes):
+    path = os.path.join(tempfile.gettempdir(), f"benchmark_loading_{minutes}min.opus")
+    if not os.path.exists(path):
+        subprocess.run([
+            FFMPEG_EXE, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"anoisesrc=color=pink:duration={minutes * 60}:sample_rate=48000",
+            "-ac", "1", "-c:a", "libopus", "-b:a", "32k", path
+        ], check=True)
+    return path
+
+
+def run(audio_path, chunk_len=15):
+    rows = []
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, audio_path, str(chunk_len)],
+            stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f"{mode} failed")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        rows.append([
+            mode,
+            result["chunks"],
+            round(result["seconds"], 2),
+            result["peak_rss_mb"],
+            round(result["upload_bytes"] / 1e6, 2),
+        ])
+
+    df = pd.DataFrame(rows, columns=["Path", "#Chunks", "Time (s)", "Peak RSS (MB)", "Chunk Bytes (MB)"])
+    print(f"{os.path.basename(audio_path)}, {chunk_len}s chunks")
+    print(df.to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "--child":
+        run_mode(args[1], args[2], int(args[3]))
+        sys.exit(0)
+
+    minutes = 30
+    chunk_len = 15
+    if "--minutes" in args:
+        i = args.index("--minutes")
+        minutes = float(args[i + 1])
+        del args[i:i + 2]
+    if "--chunk-len" in args:
+        i = args.index("--chunk-len")
+        chunk_len = int(args[i + 1])
+        del args[i:i + 2]
+    run(args[0] if args else make_long_file(minutes), chunk_len)
@@ -0,0 +1,108 @@
+"""
+Benchmark Audio Pipeline Script
+
+Measures per-request latency, peak Python memory and disk writes of the
+legacy temp-file conversion path (upload -> temp file -> pydub decode ->
+WAV export -> reopen) against the in-memory ffmpeg pipe used by /transcribe.
+No API calls are made; the converted audio is read once the same way the
+transcription client would send it.
+
+Usage: python benchmark_audio_pipeline.py [minutes ...]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from core import audio_segment
+from audio_pipeline import FFMPEG_EXE, encode_audio
+
+RUNS = 3
+
+
+def make_test_upload(minutes):
+    """
+    Generates a speech-like opus/webm recording, similar to what the
+    browser's MediaRecorder uploads.
+    """
+    result = subprocess.run([
+        FFMPEG_EXE, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:duration={minutes * 60}:sample_rate=48000",
+        "-ac", "1", "-c:a", "libopus", "-b:a", "32k", "-f", "webm", "pipe:1"
+    ], stdout=subprocess.PIPE, check=True)
+    return result.stdout
+
+
+def legacy_path(upload):
+    disk_bytes = 0
+    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_audio_file:
+        temp_audio_file.write(BytesIO(upload).read())
+        temp_path = temp_audio_file.name
+    disk_bytes += len(upload)
+
+    audio = audio_segment().from_file(temp_path)
+    wav_path = temp_path + ".wav"
+    audio.export(wav_path, format="wav")
+    disk_bytes += os.path.getsize(wav_path)
+    os.remove(temp_path)
+
+    with open(wav_path, "rb") as audio_file:
+        while audio_file.read(64 * 1024):
+            pass
+    os.remove(wav_path)
+    return disk_bytes
+
+
+def in_memory_path(upload):
+    buffer, _ = encode_audio(BytesIO(upload))
+    spilled = getattr(buffer, "_rolled", False)
+    buffer.seek(0, os.SEEK_END)
+    size = buffer.tell()
+    buffer.seek(0)
+    while buffer.read(64 * 1024):
+        pass
+    buffer.close()
+    return size if spilled else 0
+
+
+def measure(fn, upload):
+    timings, peaks = [], []
+    disk_bytes = 0
+    for _ in range(RUNS):
+        tracemalloc.start()
+        start = time.perf_counter()
+        disk_bytes = fn(upload)
+        timings.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(timings), max(peaks), disk_bytes
+
+
+def run(minutes_list):
+    rows = []
+    for minutes in minutes_list:
+        upload = make_test_upload(minutes)
+        for name, fn in (("temp files + pydub", legacy_path), ("in-memory ffmpeg pipe", in_memory_path)):
+            latency, peak, disk_bytes = measure(fn, upload)
+            rows.append([
+                minutes,
+                round(len(upload) / 1e6, 2),
+                name,
+                round(latency * 1000, 1),
+                round(peak / 1e6, 2),
+                round(disk_bytes / 1e6, 2),
+            ])
+
+    df = pd.DataFrame(rows, columns=[
+        "Minutes", "Upload (MB)", "Path", "Latency (ms)", "Peak Py Mem (MB)", "Disk Written (MB)"])
+    print(df.to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    run([float(m) for m in sys.argv[1:]] or [1, 5, 20])
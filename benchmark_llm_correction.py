@@ -4,144 +4,246 @@ Benchmark LLM Correction Script
 This script uses the OpenAI Whisper API to transcribe audio and then uses
 an LLM (e.g., GPT-3.5/4) to correct the transcription. It benchmarks
 both raw and corrected quality.
+
+Files and references come from a manifest (--manifest corpus.csv, see
+benchmark_runner.py); transcripts and corrections are checkpointed per
+chunk under --run-dir and a rerun resumes where the last one stopped.
 """
 import os
-import tempfile
+import sys
 import pandas as pd
-from jiwer import wer
-from openai import OpenAI
-from dotenv import load_dotenv
-import imageio_ffmpeg
-
-load_dotenv()
 
-# Configure pydub to use imageio-ffmpeg BEFORE importing pydub
-from pydub import AudioSegment
-from pydub.utils import make_chunks
-AudioSegment.converter = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffprobe = imageio_ffmpeg.get_ffmpeg_exe()
+# Loads .env before the modules below read their settings.
+from core import API_KEY, BASE_URL, LazyClient
+# Audio is decoded once per file by the shared ffmpeg pipeline; chunks are
+# views of that buffer encoded in memory for upload.
+from audio_pipeline import UPLOAD_FORMAT, load_audio
+from cache import TieredCache, make_key, prompt_version
+from segmentation import SEGMENTATION, segment_audio
+from correction_policy import BATCH_INSTRUCTIONS, batch_messages, parse_batch_response
+from parallel import BENCHMARK_CONCURRENCY, call_with_backoff, map_ordered, set_api_concurrency
+from upstream import transcription_timeout
+from wer_scoring import score_segments
+from benchmark_runner import load_manifest, run_benchmark
 
 # --- Configuration ---
-API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_API_KEY_HERE")
-BASE_URL = os.environ.get("OPENAI_BASE_URL", "YOUR_BASE_URL_HERE")
-
-client = OpenAI(
-    api_key=API_KEY,
-    base_url=BASE_URL
-)
-
-def convert_to_wav(input_path):
-    audio = AudioSegment.from_file(input_path)
-    wav_path = input_path + ".wav"
-    audio.export(wav_path, format="wav")
-    return wav_path
-
-def split_text_by_chunks(text, n_chunks):
-    words = text.split()
-    if n_chunks == 0:
-        return []
-    chunk_size = len(words) // n_chunks
-    remainder = len(words) % n_chunks
-    chunks = []
-    start = 0
-    for i in range(n_chunks):
-        extra = 1 if i < remainder else 0
-        end = start + chunk_size + extra
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        start = end
-    return chunks
-
-def llm_correction(raw_text, model_name="gpt-3.5-turbo"):
+# Pooled HTTP client with deadlines; retries are done by call_with_backoff.
+# It is built (and the SDK imported) on the first API call.
+client = LazyClient(API_KEY, BASE_URL)
+
+# Reruns over the same corpus reuse transcripts and corrections from earlier
+# runs. Set BENCHMARK_CACHE_DB="" to always call the API.
+BENCHMARK_CACHE_DB = os.environ.get("BENCHMARK_CACHE_DB", "benchmark_cache.sqlite")
+transcript_cache = TieredCache("transcripts", db_path=BENCHMARK_CACHE_DB)
+correction_cache = TieredCache("corrections", db_path=BENCHMARK_CACHE_DB)
+
+CORRECTION_SYSTEM_PROMPT = "You are a helpful assistant that corrects audio transcripts."
+CORRECTION_USER_PROMPT = "Correct the following transcript to closely match human language and ground truth:\n\n"
+CORRECTION_PROMPT_VERSION = prompt_version(CORRECTION_SYSTEM_PROMPT, CORRECTION_USER_PROMPT)
+
+def llm_correction(raw_text, model_name="gpt-3.5-turbo", raise_errors=False):
     """
     Corrects the transcript using the configured OpenAI-compatible API.
+    On failure the raw text is returned, or the error raised with raise_errors.
     """
     if not raw_text.strip():
         return ""
 
-    prompt = f"Correct the following transcript to closely match human language and ground truth:\n\n{raw_text}"
+    cache_key = make_key(raw_text, model_name, CORRECTION_PROMPT_VERSION)
+    cached = correction_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = CORRECTION_USER_PROMPT + raw_text
     try:
-        response = client.chat.completions.create(
+        response = call_with_backoff(
+            client.chat.completions.create,
             model=model_name, # Use a model name likely to be supported or configurable
             messages=[
-                {"role": "system", "content": "You are a helpful assistant that corrects audio transcripts."},
+                {"role": "system", "content": CORRECTION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
         )
-        return response.choices[0].message.content.strip()
+        corrected = response.choices[0].message.content.strip()
     except Exception as e:
         print(f"LLM correction failed: {e}")
+        if raise_errors:
+            raise
         return raw_text
 
-def transcribe_and_correct(audio_path, chunk_len=15):
+    correction_cache.set(cache_key, corrected)
+    return corrected
+
+# Chunks per chat completion; 1 keeps one correction request per chunk.
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", 1))
+CORRECTION_BATCH_PROMPT_VERSION = prompt_version(CORRECTION_SYSTEM_PROMPT, CORRECTION_USER_PROMPT, BATCH_INSTRUCTIONS)
+
+def llm_correction_batch(raw_texts, model_name="gpt-3.5-turbo", raise_errors=False):
+    """
+    Corrects several chunk transcripts with one chat completion and splits
+    the reply back into per-chunk texts. Falls back to llm_correction per
+    chunk if the reply does not match up.
+    """
+    results = [""] * len(raw_texts)
+    pending = []
+    for i, raw_text in enumerate(raw_texts):
+        if not raw_text.strip():
+            continue
+        cached = correction_cache.get(make_key(raw_text, model_name, CORRECTION_BATCH_PROMPT_VERSION))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    corrections = None
+    if len(pending) > 1:
+        system_prompt = CORRECTION_SYSTEM_PROMPT + " " + CORRECTION_USER_PROMPT.strip()
+        try:
+            response = call_with_backoff(
+                client.chat.completions.create,
+                model=model_name,
+                messages=batch_messages(system_prompt, [raw_texts[i] for i in pending])
+            )
+            corrections = parse_batch_response(response.choices[0].message.content, len(pending))
+        except Exception as e:
+            print(f"LLM batch correction failed: {e}")
+        if corrections is None:
+            print("LLM batch reply could not be split; correcting chunk by chunk")
+
+    for n, i in enumerate(pending):
+        if corrections is None:
+            results[i] = llm_correction(raw_texts[i], model_name, raise_errors)
+        else:
+            results[i] = corrections[n]
+            correction_cache.set(make_key(raw_texts[i], model_name, CORRECTION_BATCH_PROMPT_VERSION), corrections[n])
+    return results
+
+def transcribe_chunk(chunk, model="whisper-1"):
+    """
+    Transcribes one AudioChunk, reusing cached transcripts of identical
+    audio from earlier runs.
+    """
+    cache_key = make_key(chunk.pcm, model, UPLOAD_FORMAT)
+    text = transcript_cache.get(cache_key)
+    if text is not None:
+        return text
+
+    # upload chunks as compact 16 kHz mono (AUDIO_UPLOAD_FORMAT), not PCM WAV
+    upload, filename = chunk.encode()
+
+    def request():
+        upload.seek(0)
+        return client.audio.transcriptions.create(
+            model=model,
+            file=(filename, upload),
+            response_format="text",
+            timeout=transcription_timeout(chunk.duration_s)
+        )
+
+    try:
+        text = call_with_backoff(request).strip()
+    finally:
+        upload.close()
+
+    transcript_cache.set(cache_key, text)
+    return text
+
+def transcribe_and_correct(audio_path, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, audio=None, segmentation=SEGMENTATION, batch_size=LLM_BATCH_SIZE, progress=None):
     """
     Transcribes and corrects audio using OpenAI API.
+    Chunks are processed concurrently and reassembled in order. Pass the
+    already decoded `audio` to avoid decoding audio_path again.
+    segmentation selects fixed-length chunks or silence-aware (VAD) segments.
+    With batch_size > 1, that many chunk transcripts share one correction request.
+    With a checkpoint `progress` (benchmark_runner.FileProgress), finished
+    transcripts and corrections are reused and new ones saved as they complete.
     """
-    audio = AudioSegment.from_file(audio_path)
+    audio = audio if audio is not None else load_audio(audio_path)
     chunk_ms = chunk_len * 1000
-    chunks = make_chunks(audio, chunk_ms)
-    transcripts, transcripts_corrected, durations, word_counts = [], [], [], []
+    # "fixed" chunk_len-second chunks or "vad" speech segments of at most chunk_len
+    chunks = segment_audio(audio, chunk_ms, segmentation)
 
     print(f"Processing {os.path.basename(audio_path)} in {len(chunks)} chunks...")
 
-    for i, chunk in enumerate(chunks):
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            chunk.export(temp_file.name, format="wav")
-            temp_path = temp_file.name
-        
+    # You might want to change the model parameter if your provider requires a specific one
+    # For standard OpenAI, "gpt-3.5-turbo" or "gpt-4" works. 
+    # If using a local LLM via API (e.g. Llama), update the model name below.
+    model_name = "llama2" if "localhost" in BASE_URL else "gpt-3.5-turbo"
+
+    def process(item):
+        i, chunk = item
+        text = progress.get(i, "transcript") if progress is not None else None
+        text_corrected = progress.get(i, "correction") if progress is not None else None
         try:
             # 1. Transcribe
-            with open(temp_path, "rb") as audio_file:
-                transcript_resp = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
-                )
-                text = transcript_resp.strip()
+            if text is None:
+                text = transcribe_chunk(chunk)
+                if progress is not None:
+                    progress.put(i, "transcript", text)
             
             # 2. Correct with LLM (using the same API client)
-            # You might want to change the model parameter if your provider requires a specific one
-            # For standard OpenAI, "gpt-3.5-turbo" or "gpt-4" works. 
-            # If using a local LLM via API (e.g. Llama), update the model name below.
-            text_corrected = llm_correction(text, model_name="llama2" if "localhost" in BASE_URL else "gpt-3.5-turbo")
+            if batch_size <= 1 and text_corrected is None:
+                text_corrected = llm_correction(text, model_name=model_name, raise_errors=progress is not None)
+                if progress is not None:
+                    progress.put(i, "correction", text_corrected)
 
         except Exception as e:
             print(f"Error processing chunk {i}: {e}")
+            if progress is not None:
+                progress.failed(i, "transcript" if text is None else "correction")
             text = ""
             text_corrected = ""
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-        transcripts.append(text)
-        transcripts_corrected.append(text_corrected)
-        durations.append(len(chunk) / 1000)
-        word_counts.append(len(text_corrected.split()))
+
+        return text, text_corrected
+
+    results = map_ordered(process, enumerate(chunks), concurrency)
+    transcripts = [r[0] for r in results]
+    transcripts_corrected = [r[1] for r in results]
+
+    if batch_size > 1:
+        pending = [i for i, text in enumerate(transcripts_corrected) if text is None]
+        batches = [pending[k:k + batch_size] for k in range(0, len(pending), batch_size)]
+
+        def correct(batch):
+            try:
+                texts = llm_correction_batch([transcripts[i] for i in batch], model_name,
+                                             raise_errors=progress is not None)
+            except Exception as e:
+                print(f"Error correcting chunks {batch[0]}-{batch[-1]}: {e}")
+                if progress is not None:
+                    for i in batch:
+                        progress.failed(i, "correction")
+                return [""] * len(batch)
+            if progress is not None:
+                for i, text in zip(batch, texts):
+                    # Chunks whose transcription failed are corrected again on resume.
+                    if progress.get(i, "transcript") is not None:
+                        progress.put(i, "correction", text)
+            return texts
+
+        for batch, texts in zip(batches, map_ordered(correct, batches, concurrency)):
+            for i, text in zip(batch, texts):
+                transcripts_corrected[i] = text
+
+    durations = [chunk.duration_s for chunk in chunks]
+    word_counts = [len(text.split()) for text in transcripts_corrected]
         
+    print(f"Transcript cache: {transcript_cache.snapshot()}")
+    print(f"Correction cache: {correction_cache.snapshot()}")
     return transcripts, transcripts_corrected, durations, word_counts
 
-def calculate_table_for_audio_llm(audio_path, reference_text, chunk_len=15):
+def calculate_table_for_audio_llm(audio_path, reference_text, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, segmentation=SEGMENTATION, progress=None):
     results = []
-    created_wav = False
-    if not audio_path.lower().endswith(".wav"):
-        try:
-            wav_path = convert_to_wav(audio_path)
-            created_wav = True
-        except Exception as e:
-             print(f"Error converting {audio_path}: {e}")
-             return []
-    else:
-        wav_path = audio_path
-
+    # Decode once; chunk counting and transcription share the same buffer
     try:
-        audio = AudioSegment.from_file(wav_path)
-        chunk_ms = chunk_len * 1000
-        n_chunks = len(make_chunks(audio, chunk_ms))
-        gt_chunks = split_text_by_chunks(reference_text, n_chunks)
+        audio = load_audio(audio_path)
+    except Exception as e:
+        print(f"Error decoding {audio_path}: {e}")
+        return []
 
+    try:
         # Process
-        hyps, hyps_corrected, durs, wrds = transcribe_and_correct(wav_path, chunk_len)
+        hyps, hyps_corrected, durs, wrds = transcribe_and_correct(audio_path, chunk_len, concurrency, audio=audio, segmentation=segmentation, progress=progress)
 
         if not hyps:
              print(f"No results for {audio_path}")
@@ -152,27 +254,13 @@ def calculate_table_for_audio_llm(audio_path, reference_text, chunk_len=15):
         avg_dur = sum(durs) / seg_count if seg_count > 0 else 0
         avg_words = sum(wrds) / seg_count if seg_count > 0 else 0
 
-        # Calculate metrics for Raw Transcription
-        wers = []
-        for gt, hyp in zip(gt_chunks, hyps):
-            try: wers.append(wer(gt, hyp))
-            except: wers.append(1.0)
-        
-        avg_wer = sum(wers) / seg_count * 100 if seg_count > 0 else 0
-        std_wer = pd.Series(wers).std() * 100 if seg_count > 1 else 0
-        
-        tot_wrds_gt = sum(len(gt.split()) for gt in gt_chunks)
-        wer_wrd = sum((wer(gt, hyp) * len(gt.split())) for gt, hyp in zip(gt_chunks, hyps)) / tot_wrds_gt * 100 if tot_wrds_gt > 0 else 0
+        # Metrics for the raw and the corrected transcripts, each from one
+        # alignment against the whole reference.
+        raw = score_segments(reference_text, hyps)
+        avg_wer, std_wer, wer_wrd = raw.avg_wer * 100, raw.std_wer * 100, raw.wer_wrd * 100
 
-        # Calculate metrics for LLM Corrected
-        wers_corr = []
-        for gt, hyp in zip(gt_chunks, hyps_corrected):
-            try: wers_corr.append(wer(gt, hyp))
-            except: wers_corr.append(1.0)
-
-        avg_wer_corr = sum(wers_corr) / seg_count * 100 if seg_count > 0 else 0
-        std_wer_corr = pd.Series(wers_corr).std() * 100 if seg_count > 1 else 0
-        wer_wrd_corr = sum((wer(gt, hyp) * len(gt.split())) for gt, hyp in zip(gt_chunks, hyps_corrected)) / tot_wrds_gt * 100 if tot_wrds_gt > 0 else 0
+        corrected = score_segments(reference_text, hyps_corrected)
+        avg_wer_corr, std_wer_corr, wer_wrd_corr = corrected.avg_wer * 100, corrected.std_wer * 100, corrected.wer_wrd * 100
 
         results.append([
             os.path.basename(audio_path),
@@ -191,31 +279,38 @@ def calculate_table_for_audio_llm(audio_path, reference_text, chunk_len=15):
 
     except Exception as e:
          print(f"Error evaluating {audio_path}: {e}")
-    finally:
-        if created_wav and os.path.exists(wav_path):
-            os.remove(wav_path)
             
     return results
 
-def process_multiple_audios_llm(audio_paths, ref_texts, chunk_len=15):
-    all_results = []
-    for audio_path, ref_text in zip(audio_paths, ref_texts):
-        if os.path.exists(audio_path):
-            results = calculate_table_for_audio_llm(audio_path, ref_text, chunk_len)
-            all_results.extend(results)
-        else:
-            print(f"File not found: {audio_path}")
-            
-    df = pd.DataFrame(all_results, columns=[
-        "Audio File", "Model", "#Seg.", "Total Dur. (h)", "Avg. Dur.",
-        "Avg. #Wrd.", "Avg. WER", "Std. Dev. of WER", "WER_wrd",
-        "Avg. WER LLM", "Std. Dev. WER LLM", "WER_wrd LLM"
-    ])
+RESULT_COLUMNS = [
+    "Audio File", "Model", "#Seg.", "Total Dur. (h)", "Avg. Dur.",
+    "Avg. #Wrd.", "Avg. WER", "Std. Dev. of WER", "WER_wrd",
+    "Avg. WER LLM", "Std. Dev. WER LLM", "WER_wrd LLM"
+]
+
+def process_multiple_audios_llm(audio_paths, ref_texts, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, segmentation=SEGMENTATION, run_dir=None, fresh=False):
+    def score(audio_path, ref_text, progress):
+        return calculate_table_for_audio_llm(audio_path, ref_text, chunk_len, concurrency, segmentation, progress)
+
+    # Files run concurrently too; the shared API slots keep the total number
+    # of requests in flight at `concurrency`.
+    set_api_concurrency(concurrency)
+    settings = {
+        "benchmark": "llm_correction",
+        "chunk_len": chunk_len,
+        "segmentation": segmentation,
+        "upload_format": UPLOAD_FORMAT,
+        "model": "llama2" if "localhost" in BASE_URL else "gpt-3.5-turbo",
+        "prompt_version": CORRECTION_BATCH_PROMPT_VERSION if LLM_BATCH_SIZE > 1 else CORRECTION_PROMPT_VERSION,
+    }
+    df = run_benchmark("llm_correction", audio_paths, ref_texts, score, RESULT_COLUMNS, settings,
+                       concurrency, run_dir, fresh)
     output_file = "benchmark_llm_correction_stats.xlsx"
     df.to_excel(output_file, index=False)
     print(df)
     print(f"Saved results to {output_file}")
 
+# Example corpus, used when no --manifest is given
 audio_paths = [
     r"C:\Users\linge\OneDrive\Desktop\audio\audio1.opus",
     r"C:\Users\linge\OneDrive\Desktop\audio\audio2.opus",
@@ -229,4 +324,14 @@ ref_texts = [
 ]
 
 if __name__ == "__main__":
-    process_multiple_audios_llm(audio_paths, ref_texts)
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    manifest = option("--manifest")
+    if manifest:
+        audio_paths, ref_texts = load_manifest(manifest)
+    process_multiple_audios_llm(audio_paths, ref_texts, run_dir=option("--run-dir"), fresh="--fresh" in args)
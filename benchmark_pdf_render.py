@@ -0,0 +1,126 @@
+"""
+Benchmark PDF Rendering Script
+
+Compares the old per-request prescription drawing (letterhead redrawn for
+every document, quadratic stringWidth wrapping) with pdf_render: single
+prescriptions, one combined PDF for a batch (shared letterhead form) and a
+ZIP batch rendered in the process pool.
+
+Usage: python benchmark_pdf_render.py [--records N] [--words W]
+"""
+import sys
+import time
+from io import BytesIO
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from pdf_render import render_batch, render_prescription
+
+WORDS = ("patient reports intermittent fever with chills productive cough and mild "
+         "breathlessness on exertion for the past five days").split()
+
+
+def sample_record(i, words):
+    text = " ".join(WORDS[j % len(WORDS)] for j in range(words))
+    return {
+        "name": f"Patient {i}", "age": "42", "gender": "Female", "place": "Chennai",
+        "symptoms": text, "diagnosis": "Community acquired pneumonia",
+        "prescription": text, "date": "2024-01-01",
+    }
+
+
+def legacy_render(data):
+    """The previous generate_pdf drawing code (single page, no overflow handling)."""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    p.setFillColor(colors.HexColor("#0f172a"))
+    p.rect(0, height - 80, width, 80, fill=1)
+    p.setFillColor(colors.white)
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(40, height - 50, "MEDICAL PRESCRIPTION")
+    p.setFont("Helvetica", 10)
+    p.drawString(width - 180, height - 30, "ClinicaSync Digital Scribe")
+    p.drawString(width - 180, height - 45, f"Date: {data.get('date', 'Today')}")
+    p.setFillColor(colors.black)
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, height - 120, "PATIENT INFORMATION")
+    p.line(40, height - 125, 200, height - 125)
+    p.setFont("Helvetica", 12)
+    p.drawString(40, height - 150, f"Name: {data.get('name', 'N/A')}")
+    p.drawString(40, height - 170, f"Age: {data.get('age', 'N/A')}")
+    p.drawString(250, height - 150, f"Gender: {data.get('gender', 'N/A')}")
+    p.drawString(250, height - 170, f"Place: {data.get('place', 'N/A')}")
+    y = height - 220
+    for title, field in [("SYMPTOMS", "symptoms"), ("DIAGNOSIS", "diagnosis"), ("PRESCRIPTION", "prescription")]:
+        p.setFont("Helvetica-Bold", 12)
+        p.setFillColor(colors.HexColor("#0d9488"))
+        p.drawString(40, y, title)
+        y -= 20
+        p.setFillColor(colors.black)
+        p.setFont("Helvetica", 11)
+        text_obj = p.beginText(40, y)
+        text_obj.setFont("Helvetica", 11)
+        line = ""
+        for word in data.get(field, 'N/A').split():
+            if p.stringWidth(line + " " + word) < width - 80:
+                line += " " + word
+            else:
+                text_obj.textLine(line.strip())
+                line = word
+                y -= 15
+        text_obj.textLine(line.strip())
+        p.drawText(text_obj)
+        y -= 40
+    p.setFont("Helvetica-Oblique", 9)
+    p.setFillColor(colors.gray)
+    p.drawCentredString(width / 2, 40, "Digitally generated by ClinicaSync AI Medical Scribe")
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n_records=200, words=150):
+    records = [sample_record(i, words) for i in range(n_records)]
+    rows = []
+
+    seconds, pdfs = timed(lambda: [legacy_render(r) for r in records])
+    rows.append(["legacy, one request per record", n_records, round(seconds, 3),
+                 round(seconds / n_records * 1000, 2), round(sum(len(p) for p in pdfs) / 1e6, 2)])
+
+    seconds, pdfs = timed(lambda: [render_prescription(r) for r in records])
+    rows.append(["pdf_render, one request per record", n_records, round(seconds, 3),
+                 round(seconds / n_records * 1000, 2), round(sum(len(p) for p in pdfs) / 1e6, 2)])
+
+    for fmt in ("pdf", "zip"):
+        render_batch(records[:8], fmt)  # start the worker processes outside the timing
+        seconds, (data, _, _) = timed(render_batch, records, fmt)
+        rows.append([f"pdf_render batch ({fmt})", n_records, round(seconds, 3),
+                     round(seconds / n_records * 1000, 2), round(len(data) / 1e6, 2)])
+
+    df = pd.DataFrame(rows, columns=["Path", "#Records", "Total (s)", "Per Record (ms)", "Output (MB)"])
+    print(f"{words} words per section")
+    print(df.to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    n_records = 200
+    words = 150
+    if "--records" in args:
+        i = args.index("--records")
+        n_records = int(args[i + 1])
+    if "--words" in args:
+        i = args.index("--words")
+        words = int(args[i + 1])
+    run(n_records, words)
@@ -0,0 +1,157 @@
+"""
+Benchmark Record Store Script
+
+Measures per-submit latency of the sqlite record store against the old
+load_workbook / append / save path at growing numbers of stored records.
+The store should stay flat; the workbook path grows with every row.
+Dashboard page latency (/api/records: first page, a page deep into the
+history, sorted by name, and a search) is measured on the same stores.
+
+Usage: python benchmark_record_store.py [--sizes 0,10000,100000] [--submits N] [--legacy-max ROWS]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from records import FIELDS, HEADERS, RecordStore
+
+SAMPLE_RECORD = {
+    "name": "Asha Kumar",
+    "place": "Chennai",
+    "age": "42",
+    "gender": "Female",
+    "symptoms": "Fever and dry cough for three days, mild headache",
+    "diagnosis": "Viral upper respiratory tract infection",
+    "prescription": "Paracetamol 500 mg three times daily for three days",
+}
+
+
+NAMES = ["Asha Kumar", "Ravi Menon", "Priya Nair", "John Thomas", "Meena Iyer", "Arjun Das"]
+PLACES = ["Chennai", "Kochi", "Madurai", "Bengaluru"]
+DIAGNOSES = ["Viral fever", "Hypertension", "Type 2 diabetes", "Migraine", "Gastritis"]
+
+
+def sample_rows(n):
+    row = [SAMPLE_RECORD[field] for field in FIELDS]
+    for i in range(n):
+        # Vary the searchable/sortable columns so indexes see realistic data.
+        row[0] = f"{NAMES[i % len(NAMES)]} {i}"
+        row[1] = PLACES[i % len(PLACES)]
+        row[5] = DIAGNOSES[i % len(DIAGNOSES)]
+        yield list(row)
+
+
+def open_store(workdir, size):
+    store = RecordStore(os.path.join(workdir, f"records_{size}.sqlite"))
+    if not store.count():
+        store.insert_many(sample_rows(size))
+    return store
+
+
+def store_latencies(workdir, size, submits):
+    store = open_store(workdir, size)
+    latencies = []
+    for _ in range(submits):
+        start = time.perf_counter()
+        store.insert(SAMPLE_RECORD)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def page_latencies(workdir, size, repeats=20):
+    """Seconds per dashboard page for a few typical requests."""
+    store = open_store(workdir, size)
+    deep = {"cursor": None}
+    for _ in range(min(20, size // 25)):
+        deep["cursor"] = store.page(cursor=deep["cursor"])["next_cursor"]
+    requests = {
+        "first page": {},
+        "page 21": deep,
+        "sorted by name": {"sort": "name", "order": "asc"},
+        "search": {"search": "asha chennai"},
+    }
+    results = {}
+    for name, kwargs in requests.items():
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            store.page(**kwargs)
+            latencies.append(time.perf_counter() - start)
+        results[name] = latencies
+    return results
+
+
+def legacy_latencies(workdir, size, submits):
+    from openpyxl import Workbook, load_workbook
+
+    excel_file = os.path.join(workdir, f"data_{size}.xlsx")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(HEADERS)
+    for row in sample_rows(size):
+        ws.append(row)
+    wb.save(excel_file)
+
+    row_data = [SAMPLE_RECORD[field] for field in FIELDS]
+    latencies = []
+    for _ in range(submits):
+        start = time.perf_counter()
+        wb = load_workbook(excel_file)
+        ws = wb.active
+        ws.append(row_data)
+        wb.save(excel_file)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(sizes, submits=200, legacy_max=10000, legacy_submits=5):
+    rows = []
+    page_rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            for name, latencies in page_latencies(workdir, size).items():
+                ms = np.array(latencies) * 1000
+                page_rows.append([name, size, round(float(np.percentile(ms, 50)), 3),
+                                  round(float(np.percentile(ms, 95)), 3)])
+            paths = [("sqlite store", store_latencies, submits)]
+            if size <= legacy_max:
+                paths.append(("workbook rewrite", legacy_latencies, legacy_submits))
+            for name, measure, n in paths:
+                ms = np.array(measure(workdir, size, n)) * 1000
+                rows.append([
+                    name, size, n,
+                    round(float(np.percentile(ms, 50)), 3),
+                    round(float(np.percentile(ms, 95)), 3),
+                    round(float(ms.max()), 3),
+                ])
+                print(f"{name}: {size} rows done")
+
+    df = pd.DataFrame(rows, columns=["Path", "Stored Rows", "#Submits", "p50 (ms)", "p95 (ms)", "Max (ms)"])
+    print(df.to_string(index=False))
+    pages = pd.DataFrame(page_rows, columns=["Dashboard Request", "Stored Rows", "p50 (ms)", "p95 (ms)"])
+    print(pages.to_string(index=False))
+    return df, pages
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sizes = [0, 10000, 100000]
+    submits = 200
+    legacy_max = 10000
+    if "--sizes" in args:
+        i = args.index("--sizes")
+        sizes = [int(s) for s in args[i + 1].split(",")]
+        del args[i:i + 2]
+    if "--submits" in args:
+        i = args.index("--submits")
+        submits = int(args[i + 1])
+        del args[i:i + 2]
+    if "--legacy-max" in args:
+        i = args.index("--legacy-max")
+        legacy_max = int(args[i + 1])
+        del args[i:i + 2]
+    run(sizes, submits, legacy_max)
@@ -0,0 +1,195 @@
+"""
+Resumable Benchmark Runs
+
+Reads the corpus from a manifest instead of hardcoded lists and checkpoints
+a run as it goes, so a crash or a rate-limit storm halfway through a large
+corpus loses no paid-for API calls:
+
+- every chunk transcript and correction is appended to
+  <run dir>/checkpoint.jsonl as soon as it completes
+- a rerun with the same run directory skips finished files and reuses the
+  checkpointed chunks of unfinished ones
+- each finished file's row is appended to results.csv and results.jsonl;
+  the xlsx is rendered from all rows at the end
+
+A file with failed chunks gets no result row; the next run retries only
+the failed chunks. The run directory records the settings that shape the
+chunks (chunk length, segmentation, upload format, models); resuming with
+different settings is refused rather than mixing results.
+
+Manifest formats (relative paths are resolved against the manifest):
+
+- CSV with an "audio" column and a "reference" (text) or "reference_file"
+  column
+- JSONL with the same keys per line
+"""
+import csv
+import json
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+from parallel import map_ordered
+
+BENCHMARK_RUNS_DIR = os.environ.get("BENCHMARK_RUNS_DIR", "benchmark_runs")
+
+
+def load_manifest(path):
+    """Returns (audio_paths, ref_texts) listed in a CSV or JSONL manifest."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = list(csv.DictReader(f))
+
+    audio_paths, ref_texts = [], []
+    for n, entry in enumerate(entries, 1):
+        audio = (entry.get("audio") or "").strip()
+        if not audio:
+            raise ValueError(f"{path}: entry {n} has no audio path")
+        if entry.get("reference_file"):
+            with open(os.path.join(base, entry["reference_file"]), encoding="utf-8") as ref:
+                reference = ref.read()
+        elif entry.get("reference") is not None:
+            reference = entry["reference"]
+        else:
+            raise ValueError(f"{path}: entry {n} has no reference or reference_file")
+        audio_paths.append(os.path.join(base, audio))
+        ref_texts.append(reference.strip())
+    return audio_paths, ref_texts
+
+
+class FileProgress:
+    """One file's view of the checkpoint, handed to the chunk loops."""
+
+    def __init__(self, run, file_id):
+        self.run = run
+        self.file_id = file_id
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def get(self, index, kind):
+        return self.run._chunks.get((self.file_id, index, kind))
+
+    def put(self, index, kind, text):
+        self.run._append({"type": "chunk", "file": self.file_id, "chunk": index, "kind": kind, "text": text})
+        self.run._chunks[(self.file_id, index, kind)] = text
+
+    def failed(self, index, kind):
+        with self._lock:
+            self.failures += 1
+        print(f"{os.path.basename(self.file_id)}: {kind} of chunk {index} failed; it is retried on resume")
+
+
+class BenchmarkRun:
+    def __init__(self, run_dir, settings, columns, fresh=False):
+        self.run_dir = run_dir
+        self.columns = list(columns)
+        self.checkpoint_path = os.path.join(run_dir, "checkpoint.jsonl")
+        self.csv_path = os.path.join(run_dir, "results.csv")
+        self.jsonl_path = os.path.join(run_dir, "results.jsonl")
+        self._lock = threading.Lock()
+        self._chunks = {}
+        self._results = {}
+
+        if fresh and os.path.isdir(run_dir):
+            shutil.rmtree(run_dir)
+        os.makedirs(run_dir, exist_ok=True)
+
+        settings_path = os.path.join(run_dir, "settings.json")
+        settings = json.loads(json.dumps(settings))
+        if os.path.exists(settings_path):
+            with open(settings_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved != settings:
+                raise SystemExit(
+                    f"{run_dir} was started with {saved}, not {settings}; "
+                    f"use another run directory or --fresh")
+        else:
+            with open(settings_path, "w", encoding="utf-8") as f:
+                json.dump(settings, f, indent=2)
+
+        if os.path.exists(self.checkpoint_path):
+            self._load()
+        self._checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if entry["type"] == "chunk":
+                    self._chunks[(entry["file"], entry["chunk"], entry["kind"])] = entry["text"]
+                elif entry["type"] == "result":
+                    self._results[entry["file"]] = entry["rows"]
+        print(f"Resuming {self.run_dir}: {len(self._results)} files done, {len(self._chunks)} chunks checkpointed")
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._checkpoint.write(line)
+            self._checkpoint.flush()
+            os.fsync(self._checkpoint.fileno())
+
+    def done(self, file_id):
+        return file_id in self._results
+
+    def save_result(self, file_id, rows):
+        """Checkpoints a finished file and streams its rows to CSV and JSONL."""
+        self._append({"type": "result", "file": file_id, "rows": rows})
+        with self._lock:
+            self._results[file_id] = rows
+            new_csv = not os.path.exists(self.csv_path)
+            with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_csv:
+                    writer.writerow(self.columns)
+                writer.writerows(rows)
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n")
+
+    def table(self, file_ids):
+        rows = [row for file_id in file_ids for row in self._results.get(file_id, [])]
+        return pd.DataFrame(rows, columns=self.columns)
+
+    def close(self):
+        self._checkpoint.close()
+
+
+def run_benchmark(name, audio_paths, ref_texts, score_file, columns, settings,
+                  concurrency, run_dir=None, fresh=False):
+    """
+    Runs score_file(audio_path, ref_text, progress) -> rows for every file not
+    finished in an earlier run and returns the table of all files, in
+    manifest order.
+    """
+    run = BenchmarkRun(run_dir or os.path.join(BENCHMARK_RUNS_DIR, name), settings, columns, fresh)
+
+    def process(item):
+        audio_path, ref_text = item
+        if run.done(audio_path):
+            return
+        if not os.path.exists(audio_path):
+            print(f"File not found: {audio_path}")
+            return
+        progress = FileProgress(run, audio_path)
+        rows = score_file(audio_path, ref_text, progress)
+        if progress.failures:
+            print(f"{os.path.basename(audio_path)}: {progress.failures} chunk(s) failed; rerun to resume")
+        elif rows:
+            run.save_result(audio_path, rows)
+
+    try:
+        map_ordered(process, zip(audio_paths, ref_texts), concurrency)
+    finally:
+        run.close()
+    remaining = sum(not run.done(path) for path in audio_paths)
+    if remaining:
+        print(f"{remaining} of {len(audio_paths)} files unfinished; rerun to resume {run.run_dir}")
+    return run.table(audio_paths)
@@ -0,0 +1,152 @@
+"""
+Benchmark Startup Script
+
+Measures the cold start of each entry point in a fresh interpreter, as a
+gunicorn worker or a CLI run pays it: import wall time, RSS after the
+import, the packages with the most import time (python -X importtime) and,
+for the app, the latency of the first request and the peak RSS once the
+background warm-up (OpenAI SDK) has finished. Heavy optional modules
+(openai, reportlab, openpyxl, pandas, pydub) are listed when the import
+itself loaded them.
+
+With --baseline FILE the results are compared against an earlier run saved
+with --save FILE, and entries that got more than --tolerance (default 20%)
+slower exit with status 1.
+
+Usage: python benchmark_startup.py [--runs 5] [--modules app,benchmark_transcription]
+       [--save startup.json] [--baseline startup.json] [--tolerance 0.2]
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ["app", "benchmark_transcription", "benchmark_llm_correction"]
+HEAVY_MODULES = ["openai", "reportlab", "openpyxl", "pandas", "pydub"]
+
+# Runs in the child interpreter; prints one JSON line on stdout.
+CHILD = r"""
+import json, resource, sys, time
+
+def rss_mb():
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (kb // 1024 if sys.platform == "darwin" else kb) / 1024
+
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter() - start
+heavy = [name for name in json.loads(sys.argv[2]) if name in sys.modules]
+import_rss = rss_mb()
+first_request = None
+if sys.argv[1] == "app":
+    start = time.perf_counter()
+    module.app.test_client().get("/")
+    first_request = time.perf_counter() - start
+    # Older trees build the client during import and have nothing to warm.
+    warm = getattr(module.upstream, "warm", None)
+    if warm:
+        warm()
+print(json.dumps({"import_s": imported, "first_request_s": first_request, "import_rss_mb": import_rss,
+                  "rss_mb": rss_mb(), "heavy": heavy}))
+"""
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def run_child(module, workdir, importtime=False):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BASE_DIR, os.environ.get("PYTHONPATH")])),
+               # Keep the app's stores and exports out of the working tree.
+               RECORDS_DB_PATH=os.path.join(workdir, "records.sqlite"),
+               CSV_EXPORT_PATH=os.path.join(workdir, "data.csv"),
+               EXCEL_EXPORT_PATH=os.path.join(workdir, "data.xlsx"),
+               BENCHMARK_CACHE_DB="", EXPORT_INTERVAL_SECONDS="0")
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD, module,
+                                                                            json.dumps(HEAVY_MODULES)]
+    proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["top_imports"] = top_imports(proc.stderr)
+    return result
+
+
+def top_imports(importtime_log, n=5):
+    """Top-level packages by total self import time (ms) of their modules."""
+    totals = {}
+    for self_us, _, _, name in _IMPORTTIME_RE.findall(importtime_log):
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:n]
+    return ", ".join(f"{name} {us / 1000:.0f}" for name, us in ranked)
+
+
+def measure(modules, runs=5):
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for module in modules:
+            profile = run_child(module, workdir, importtime=True)  # also warms the OS file cache
+            samples = [run_child(module, workdir) for _ in range(runs)]
+            imports = [s["import_s"] for s in samples]
+            first = [s["first_request_s"] for s in samples if s["first_request_s"] is not None]
+            rows.append({
+                "Module": module,
+                "Import p50 (ms)": round(statistics.median(imports) * 1000, 1),
+                "Import max (ms)": round(max(imports) * 1000, 1),
+                "First request (ms)": round(statistics.median(first) * 1000, 1) if first else None,
+                "RSS after import (MB)": round(statistics.median(s["import_rss_mb"] for s in samples), 1),
+                "Peak RSS (MB)": round(statistics.median(s["rss_mb"] for s in samples), 1),
+                "Heavy modules loaded": ", ".join(samples[0]["heavy"]) or "-",
+                "Slowest imports (ms)": profile["top_imports"],
+            })
+    return pd.DataFrame(rows)
+
+
+def compare(df, baseline, tolerance):
+    """Rows whose median import time grew by more than tolerance."""
+    regressions = []
+    for row in df.to_dict("records"):
+        before = baseline.get(row["Module"])
+        if before is None:
+            continue
+        after = row["Import p50 (ms)"]
+        change = after / before["Import p50 (ms)"] - 1 if before["Import p50 (ms)"] else 0
+        print(f"{row['Module']}: import {before['Import p50 (ms)']} -> {after} ms ({change:+.0%}), "
+              f"RSS after import {before['RSS after import (MB)']} -> {row['RSS after import (MB)']} MB")
+        if change > tolerance:
+            regressions.append(row["Module"])
+    return regressions
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    modules = option("--modules", ",".join(DEFAULT_MODULES)).split(",")
+    df = measure(modules, int(option("--runs", 5)))
+    print(df.to_string(index=False))
+
+    save_path = option("--save")
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump({row["Module"]: row for row in df.to_dict("records")}, f, indent=2)
+        print(f"Saved results to {save_path}")
+
+    baseline_path = option("--baseline")
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(df, baseline, float(option("--tolerance", 0.2)))
+        if regressions:
+            print(f"Slower than baseline: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,338 @@
+"""
+Benchmark Sweep Script
+
+Times every transcription and correction call over a grid of settings
+(chunk length, Whisper model, upload format, concurrency, correction model)
+so configurations can be compared on latency, throughput and cost next to
+WER:
+
+- each API call is logged (calls.csv) with its wall time, bytes uploaded,
+  seconds of audio and, for the LLM, prompt and completion tokens
+- each configuration gets one summary row: WER before and after
+  correction, p50/p95 call latency, real-time factor, audio seconds per
+  wall second, upload kbit/s, tokens per second and estimated cost
+- one comparison table per swept parameter averages the summary over the
+  other settings
+- --save stores the summary as a baseline; --baseline compares against one
+  and exits with status 1 when a configuration regressed (p95 latency or
+  throughput worse by more than --tolerance, or WER up by more than
+  --wer-tolerance points)
+
+Caches are bypassed so every call is a real one. The corpus comes from a
+manifest (see benchmark_runner.py) or the example corpus in
+benchmark_transcription.py; point OPENAI_BASE_URL at mock_openai_server.py
+to measure the client side alone.
+
+Usage: python benchmark_sweep.py [--manifest corpus.csv] [--chunk-len 10,15,30]
+       [--model whisper-1] [--format flac,opus,wav] [--concurrency 1,4]
+       [--llm-model gpt-3.5-turbo,llama2|none] [--out-dir benchmark_runs/sweep]
+       [--save sweep.json] [--baseline sweep.json] [--tolerance 0.2] [--wer-tolerance 1.0]
+"""
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from core import API_KEY, BASE_URL, LazyClient
+from audio_pipeline import load_audio
+from segmentation import SEGMENTATION, segment_audio
+from parallel import call_with_backoff, map_ordered, set_api_concurrency
+from upstream import transcription_timeout
+from wer_scoring import align
+from benchmark_runner import BENCHMARK_RUNS_DIR, load_manifest
+from benchmark_llm_correction import CORRECTION_SYSTEM_PROMPT, CORRECTION_USER_PROMPT
+
+client = LazyClient(API_KEY, BASE_URL)
+
+SWEEP_PARAMETERS = ["chunk_len", "model", "format", "concurrency", "llm_model"]
+DEFAULT_GRID = {
+    "chunk_len": [15],
+    "model": ["whisper-1"],
+    "format": ["flac"],
+    "concurrency": [1, 4],
+    "llm_model": ["gpt-3.5-turbo"],
+}
+
+# USD list prices for the cost column; models not listed (a self-hosted
+# llama2) count as free. --prices FILE replaces them (JSON, same shape).
+PRICES = {
+    "whisper-1": {"audio_minute": 0.006},
+    "gpt-3.5-turbo": {"prompt_1k": 0.0005, "completion_1k": 0.0015},
+}
+
+CALL_COLUMNS = ["config", "file", "chunk", "op", "seconds", "encode_s", "bytes", "audio_s",
+                "prompt_tokens", "completion_tokens", "error"]
+
+
+def config_name(config):
+    return " ".join(f"{key}={config[key]}" for key in SWEEP_PARAMETERS)
+
+
+def timed_transcription(chunk, model, fmt):
+    """Encodes and transcribes one chunk; returns (text, call record)."""
+    start = time.perf_counter()
+    upload, filename = chunk.encode(fmt)
+    encode_s = time.perf_counter() - start
+    upload.seek(0, os.SEEK_END)
+    size = upload.tell()
+
+    def request():
+        upload.seek(0)
+        return client.audio.transcriptions.create(
+            model=model,
+            file=(filename, upload),
+            response_format="text",
+            timeout=transcription_timeout(chunk.duration_s)
+        )
+
+    start = time.perf_counter()
+    text, error = "", ""
+    try:
+        text = str(call_with_backoff(request)).strip()
+    except Exception as e:
+        error = type(e).__name__
+        print(f"Transcription failed: {e}")
+    finally:
+        upload.close()
+    return text, {"op": "transcribe", "seconds": time.perf_counter() - start, "encode_s": encode_s,
+                  "bytes": size, "audio_s": chunk.duration_s, "prompt_tokens": 0, "completion_tokens": 0,
+                  "error": error}
+
+
+def timed_correction(text, llm_model):
+    """
+    One correction request, as benchmark_llm_correction sends it. Empty
+    transcripts are not sent (the call record is None).
+    """
+    if not text:
+        return "", None
+    call = {"op": "correct", "seconds": 0.0, "encode_s": 0.0, "bytes": 0, "audio_s": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "error": ""}
+    start = time.perf_counter()
+    try:
+        response = call_with_backoff(
+            client.chat.completions.create,
+            model=llm_model,
+            messages=[
+                {"role": "system", "content": CORRECTION_SYSTEM_PROMPT},
+                {"role": "user", "content": CORRECTION_USER_PROMPT + text}
+            ]
+        )
+        corrected = response.choices[0].message.content.strip()
+        usage = getattr(response, "usage", None)
+        call["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        call["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+    except Exception as e:
+        call["error"] = type(e).__name__
+        print(f"LLM correction failed: {e}")
+        corrected = text
+    call["seconds"] = time.perf_counter() - start
+    return corrected, call
+
+
+def run_config(files, config, prices=None):
+    """
+    Transcribes (and corrects) every chunk of every file with one
+    configuration. Returns (call records, summary row).
+    """
+    set_api_concurrency(config["concurrency"])
+    items = [(f, i, chunk)
+             for f, (_, audio, _) in enumerate(files)
+             for i, chunk in enumerate(segment_audio(audio, config["chunk_len"] * 1000, SEGMENTATION))]
+
+    def process(item):
+        f, i, chunk = item
+        text, call = timed_transcription(chunk, config["model"], config["format"])
+        calls = [call]
+        corrected = text
+        if config["llm_model"] != "none":
+            corrected, call = timed_correction(text, config["llm_model"])
+            if call is not None:
+                calls.append(call)
+        for call in calls:
+            call.update(config=config_name(config), file=files[f][0], chunk=i)
+        return f, text, corrected, calls
+
+    start = time.perf_counter()
+    results = map_ordered(process, items, config["concurrency"])
+    wall = time.perf_counter() - start
+
+    calls = [call for *_, chunk_calls in results for call in chunk_calls]
+    raw_errors = corrected_errors = ref_words = 0
+    for f, (_, _, reference) in enumerate(files):
+        raw = " ".join(text for g, text, _, _ in results if g == f)
+        corrected = " ".join(text for g, _, text, _ in results if g == f)
+        raw_alignment = align(reference, raw)
+        raw_errors += raw_alignment.errors
+        ref_words += raw_alignment.n_ref
+        corrected_errors += align(reference, corrected).errors
+    return calls, summarize(config, calls, wall, raw_errors, corrected_errors, ref_words, prices)
+
+
+def estimate_cost(config, transcribe, correct, prices):
+    whisper = prices.get(config["model"], {})
+    llm = prices.get(config["llm_model"], {})
+    return (transcribe["audio_s"].sum() / 60 * whisper.get("audio_minute", 0)
+            + correct["prompt_tokens"].sum() / 1000 * llm.get("prompt_1k", 0)
+            + correct["completion_tokens"].sum() / 1000 * llm.get("completion_1k", 0))
+
+
+def summarize(config, calls, wall, raw_errors, corrected_errors, ref_words, prices=None):
+    df = pd.DataFrame(calls, columns=CALL_COLUMNS)
+    transcribe = df[df["op"] == "transcribe"]
+    correct = df[df["op"] == "correct"]
+    audio_s = transcribe["audio_s"].sum()
+    tokens = correct["prompt_tokens"].sum() + correct["completion_tokens"].sum()
+
+    def pct(series, q):
+        return round(float(np.percentile(series, q)) * 1000, 1) if len(series) else None
+
+    return dict(
+        config,
+        **{
+            "Calls": len(df),
+            "Errors": int((df["error"] != "").sum()),
+            "Audio (s)": round(audio_s, 1),
+            "Wall (s)": round(wall, 2),
+            "RTF": round(wall / audio_s, 3) if audio_s else None,
+            "Audio s / Wall s": round(audio_s / wall, 2) if wall else None,
+            "Transcribe p50 (ms)": pct(transcribe["seconds"], 50),
+            "Transcribe p95 (ms)": pct(transcribe["seconds"], 95),
+            "Encode p50 (ms)": pct(transcribe["encode_s"], 50),
+            "Upload kbit/s": round(transcribe["bytes"].sum() * 8 / audio_s / 1000, 1) if audio_s else None,
+            "Correct p50 (ms)": pct(correct["seconds"], 50),
+            "Correct p95 (ms)": pct(correct["seconds"], 95),
+            "Prompt tokens": int(correct["prompt_tokens"].sum()),
+            "Completion tokens": int(correct["completion_tokens"].sum()),
+            "Tokens / s": round(tokens / correct["seconds"].sum(), 1) if tokens else None,
+            "Cost ($)": round(estimate_cost(config, transcribe, correct, prices or PRICES), 4),
+            "WER raw": round(raw_errors / ref_words * 100, 2) if ref_words else None,
+            "WER corrected": round(corrected_errors / ref_words * 100, 2) if ref_words else None,
+        })
+
+
+def sweep(audio_paths, ref_texts, grid, prices=None):
+    """Runs every combination in grid; returns (calls, summary) DataFrames."""
+    files = []
+    for audio_path, ref_text in zip(audio_paths, ref_texts):
+        if not os.path.exists(audio_path):
+            print(f"File not found: {audio_path}")
+            continue
+        # Decoded once; every configuration chunks and encodes the same PCM.
+        files.append((os.path.basename(audio_path), load_audio(audio_path), ref_text))
+
+    client.get()  # keep the SDK import and client setup out of the first call's time
+    all_calls, rows = [], []
+    for values in itertools.product(*(grid[key] for key in SWEEP_PARAMETERS)):
+        config = dict(zip(SWEEP_PARAMETERS, values))
+        print(f"Running {config_name(config)}")
+        calls, row = run_config(files, config, prices)
+        all_calls.extend(calls)
+        rows.append(row)
+    return pd.DataFrame(all_calls, columns=CALL_COLUMNS), pd.DataFrame(rows)
+
+
+COMPARE_METRICS = ["Audio s / Wall s", "RTF", "Transcribe p95 (ms)", "Correct p95 (ms)", "Upload kbit/s",
+                   "Tokens / s", "Cost ($)", "WER raw", "WER corrected"]
+
+
+def comparison_tables(summary, grid):
+    """One table per parameter that takes more than one value."""
+    return {
+        key: summary.groupby(key)[COMPARE_METRICS].mean().round(dict.fromkeys(COMPARE_METRICS, 2) | {"Cost ($)": 4})
+        for key in SWEEP_PARAMETERS if len(grid[key]) > 1
+    }
+
+
+# metric -> direction in which it gets worse
+REGRESSION_CHECKS = {
+    "Transcribe p95 (ms)": "up",
+    "Correct p95 (ms)": "up",
+    "Audio s / Wall s": "down",
+}
+
+
+def compare(summary, baseline, tolerance=0.2, wer_tolerance=1.0):
+    """
+    Configurations (present in both runs) that got slower, lost throughput
+    or lost accuracy. Returns a list of human-readable regressions.
+    """
+    regressions = []
+    for row in summary.to_dict("records"):
+        name = config_name(row)
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric, worse in REGRESSION_CHECKS.items():
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None or pd.isna(new):
+                continue
+            change = new / old - 1
+            if (change if worse == "up" else -change) > tolerance:
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+        for metric in ("WER raw", "WER corrected"):
+            old, new = before.get(metric), row.get(metric)
+            if old is not None and new is not None and new - old > wer_tolerance:
+                regressions.append(f"{name}: {metric} {old}% -> {new}%")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    grid = {}
+    for key in SWEEP_PARAMETERS:
+        values = option("--" + key.replace("_", "-"))
+        values = values.split(",") if values else DEFAULT_GRID[key]
+        grid[key] = [int(v) for v in values] if key in ("chunk_len", "concurrency") else values
+
+    manifest = option("--manifest")
+    if manifest:
+        audio_paths, ref_texts = load_manifest(manifest)
+    else:
+        from benchmark_transcription import audio_paths, ref_texts
+
+    prices = None
+    if option("--prices"):
+        with open(option("--prices"), encoding="utf-8") as f:
+            prices = json.load(f)
+
+    calls, summary = sweep(audio_paths, ref_texts, grid, prices)
+    out_dir = option("--out-dir", os.path.join(BENCHMARK_RUNS_DIR, "sweep"))
+    os.makedirs(out_dir, exist_ok=True)
+    calls.to_csv(os.path.join(out_dir, "calls.csv"), index=False)
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary.to_string(index=False))
+        for key, table in comparison_tables(summary, grid).items():
+            print(f"\nBy {key}:")
+            print(table.to_string())
+    print(f"\nSaved calls and summary to {out_dir}")
+
+    save_path = option("--save")
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump({config_name(row): row for row in summary.to_dict("records")}, f, indent=2, default=str)
+        print(f"Saved baseline to {save_path}")
+
+    baseline_path = option("--baseline")
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, float(option("--tolerance", 0.2)),
+                              float(option("--wer-tolerance", 1.0)))
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
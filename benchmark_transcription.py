@@ -3,120 +3,136 @@ Benchmark Transcription Script
 
 This script uses the OpenAI Whisper API to transcribe a list of audio files
 and benchmarks the performance (WER, duration, etc.) against ground truth text.
+
+Files and references come from a manifest (--manifest corpus.csv, see
+benchmark_runner.py); runs are checkpointed per chunk under --run-dir and
+resume where they stopped.
+
+With --compare-backends it transcribes the same files with the remote API
+and the local faster-whisper backend and compares WER, real-time factor and
+throughput per CPU core.
 """
 import os
-import tempfile
+import sys
+import time
 import pandas as pd
-from openpyxl import Workbook
-from jiwer import wer
-from openai import OpenAI
-from dotenv import load_dotenv
-import imageio_ffmpeg
-
-load_dotenv()
 
-# Configure pydub to use imageio-ffmpeg BEFORE importing pydub
-from pydub import AudioSegment
-from pydub.utils import make_chunks
-AudioSegment.converter = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
-AudioSegment.ffprobe = imageio_ffmpeg.get_ffmpeg_exe()
+# Loads .env before the modules below read their settings.
+from core import API_KEY, BASE_URL, LazyClient
+# Audio is decoded once per file by the shared ffmpeg pipeline; chunks are
+# views of that buffer encoded in memory for upload.
+from audio_pipeline import UPLOAD_FORMAT, load_audio
+from cache import TieredCache, make_key
+from segmentation import SEGMENTATION, segment_audio
+from parallel import BENCHMARK_CONCURRENCY, call_with_backoff, map_ordered, set_api_concurrency
+from upstream import transcription_timeout
+from transcription_backends import LocalWhisperBackend
+from benchmark_runner import load_manifest, run_benchmark
+from wer_scoring import score_segments, wer
 
 # --- Configuration ---
-API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_API_KEY_HERE")
-BASE_URL = os.environ.get("OPENAI_BASE_URL", "YOUR_BASE_URL_HERE")
-
-client = OpenAI(
-    api_key=API_KEY,
-    base_url=BASE_URL
-)
-
-def convert_to_wav(input_path):
-    audio = AudioSegment.from_file(input_path)
-    wav_path = input_path + ".wav"
-    audio.export(wav_path, format="wav")
-    return wav_path
-
-def split_text_by_chunks(text, n_chunks):
-    words = text.split()
-    if n_chunks == 0:
-        return []
-    chunk_size = len(words) // n_chunks
-    remainder = len(words) % n_chunks
-    chunks = []
-    start = 0
-    for i in range(n_chunks):
-        extra = 1 if i < remainder else 0
-        end = start + chunk_size + extra
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        start = end
-    return chunks
-
-def transcribe_with_api(audio_path, chunk_len=15):
+# Pooled HTTP client with deadlines; retries are done by call_with_backoff.
+# It is built (and the SDK imported) on the first API call.
+client = LazyClient(API_KEY, BASE_URL)
+
+# Reruns over the same corpus reuse transcripts from earlier runs.
+# Set BENCHMARK_CACHE_DB="" to always call the API.
+BENCHMARK_CACHE_DB = os.environ.get("BENCHMARK_CACHE_DB", "benchmark_cache.sqlite")
+transcript_cache = TieredCache("transcripts", db_path=BENCHMARK_CACHE_DB)
+
+
+def transcribe_chunk(chunk, model="whisper-1", backend=None, use_cache=True):
+    """
+    Transcribes one AudioChunk, reusing cached transcripts of identical
+    audio from earlier runs. backend=None calls the remote API; pass a
+    transcription_backends backend (e.g. LocalWhisperBackend) to use it instead.
+    """
+    if backend is not None:
+        cache_key = make_key(chunk.pcm, backend.model_id)
+    else:
+        cache_key = make_key(chunk.pcm, model, UPLOAD_FORMAT)
+    text = transcript_cache.get(cache_key) if use_cache else None
+    if text is not None:
+        return text
+
+    if backend is not None:
+        text = backend.transcribe_chunk(chunk).strip()
+        transcript_cache.set(cache_key, text)
+        return text
+
+    # upload chunks as compact 16 kHz mono (AUDIO_UPLOAD_FORMAT), not PCM WAV
+    upload, filename = chunk.encode()
+
+    def request():
+        upload.seek(0)
+        # Call OpenAI API
+        return client.audio.transcriptions.create(
+            model=model, 
+            file=(filename, upload),
+            response_format="text",
+            timeout=transcription_timeout(chunk.duration_s)
+        )
+
+    try:
+        text = call_with_backoff(request).strip()
+    finally:
+        upload.close()
+
+    transcript_cache.set(cache_key, text)
+    return text
+
+def transcribe_with_api(audio_path, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, audio=None, segmentation=SEGMENTATION, backend=None, use_cache=True, progress=None):
     """
     Transcribes audio using the OpenAI API, chunk by chunk.
+    Chunks are sent concurrently and reassembled in order. Pass the already
+    decoded `audio` to avoid decoding audio_path again.
+    segmentation selects fixed-length chunks or silence-aware (VAD) segments.
+    With a checkpoint `progress` (benchmark_runner.FileProgress), finished
+    chunks are reused and new transcripts are saved as they complete.
     """
-    audio = AudioSegment.from_file(audio_path)
+    audio = audio if audio is not None else load_audio(audio_path)
     chunk_ms = chunk_len * 1000
-    chunks = make_chunks(audio, chunk_ms)
-    transcripts, durations, word_counts = [], [], []
+    # "fixed" chunk_len-second chunks or "vad" speech segments of at most chunk_len
+    chunks = segment_audio(audio, chunk_ms, segmentation)
 
     print(f"Transcribing {os.path.basename(audio_path)} in {len(chunks)} chunks...")
 
-    for i, chunk in enumerate(chunks):
-        # export chunk to temp file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            chunk.export(temp_file.name, format="wav")
-            temp_path = temp_file.name
-        
-        try:
-            with open(temp_path, "rb") as audio_file:
-                # Call OpenAI API
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file,
-                    response_format="text"
-                )
-                text = transcript.strip()
-        except Exception as e:
-            print(f"Error transcribing chunk {i}: {e}")
-            text = ""
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-        transcripts.append(text)
-        durations.append(len(chunk) / 1000)
-        word_counts.append(len(text.split()))
+    def process(item):
+        i, chunk = item
+        text = progress.get(i, "transcript") if progress is not None else None
+        if text is None:
+            try:
+                text = transcribe_chunk(chunk, backend=backend, use_cache=use_cache)
+                if progress is not None:
+                    progress.put(i, "transcript", text)
+            except Exception as e:
+                print(f"Error transcribing chunk {i}: {e}")
+                if progress is not None:
+                    progress.failed(i, "transcript")
+                text = ""
+        return text, chunk.duration_s, len(text.split())
+
+    results = map_ordered(process, enumerate(chunks), concurrency)
+    transcripts = [text for text, _, _ in results]
+    durations = [dur for _, dur, _ in results]
+    word_counts = [wrd for _, _, wrd in results]
         
+    print(f"Transcript cache: {transcript_cache.snapshot()}")
     return transcripts, durations, word_counts
 
-def calculate_table_for_audio(audio_path, reference_text, chunk_len=15):
+def calculate_table_for_audio(audio_path, reference_text, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, segmentation=SEGMENTATION, backend=None, progress=None):
     results = []
     
-    # Ensure wav format
-    created_wav = False
-    if not audio_path.lower().endswith(".wav"):
-        try:
-            wav_path = convert_to_wav(audio_path)
-            created_wav = True
-        except Exception as e:
-            print(f"Error converting {audio_path}: {e}")
-            return []
-    else:
-        wav_path = audio_path
+    # Decode once; chunk counting and transcription share the same buffer
+    try:
+        audio = load_audio(audio_path)
+    except Exception as e:
+        print(f"Error decoding {audio_path}: {e}")
+        return []
 
     try:
-        audio = AudioSegment.from_file(wav_path)
-        chunk_ms = chunk_len * 1000
-        n_chunks = len(make_chunks(audio, chunk_ms))
-        
-        # Split ground truth text into chunks to match audio chunks
-        gt_chunks = split_text_by_chunks(reference_text, n_chunks)
-        
         # Transcribe
-        hyps, durs, wrds = transcribe_with_api(wav_path, chunk_len)
+        hyps, durs, wrds = transcribe_with_api(audio_path, chunk_len, concurrency, audio=audio, segmentation=segmentation, backend=backend, progress=progress)
         
         # Verification: Handle case where API fails or returns empty
         if not hyps:
@@ -128,26 +144,16 @@ def calculate_table_for_audio(audio_path, reference_text, chunk_len=15):
         avg_dur = sum(durs) / seg_count if seg_count > 0 else 0
         avg_words = sum(wrds) / seg_count if seg_count > 0 else 0
         
-        # Calculate WER
-        wers = []
-        for gt, hyp in zip(gt_chunks, hyps):
-            try:
-                wers.append(wer(gt, hyp))
-            except:
-                wers.append(1.0) # Penalty for error
-
-        avg_wer = sum(wers) / seg_count * 100 if seg_count > 0 else 0
-        std_wer = pd.Series(wers).std() * 100 if seg_count > 1 else 0
-        
-        total_gt_words = sum(len(gt.split()) for gt in gt_chunks)
-        if total_gt_words > 0:
-            wer_wrd = sum(wer(gt, hyp) * len(gt.split()) for gt, hyp in zip(gt_chunks, hyps)) / total_gt_words * 100
-        else:
-            wer_wrd = 0
+        # One alignment of all chunk transcripts against the whole reference;
+        # each chunk is scored against the reference words aligned to it.
+        scores = score_segments(reference_text, hyps)
+        avg_wer = scores.avg_wer * 100
+        std_wer = scores.std_wer * 100
+        wer_wrd = scores.wer_wrd * 100
 
         results.append([
             os.path.basename(audio_path),
-            "openai-whisper",
+            backend.model_id if backend is not None else "openai-whisper",
             seg_count,
             round(total_dur_h, 2),
             round(avg_dur, 2),
@@ -159,31 +165,85 @@ def calculate_table_for_audio(audio_path, reference_text, chunk_len=15):
 
     except Exception as e:
         print(f"Error processing {audio_path}: {e}")
-    finally:
-        if created_wav and os.path.exists(wav_path):
-            os.remove(wav_path)
             
     return results
 
-def process_multiple_audios(audio_paths, ref_texts, chunk_len=15):
-    all_results = []
-    for audio_path, ref_text in zip(audio_paths, ref_texts):
-        if os.path.exists(audio_path):
-            results = calculate_table_for_audio(audio_path, ref_text, chunk_len)
-            all_results.extend(results)
-        else:
-            print(f"File not found: {audio_path}")
+RESULT_COLUMNS = [
+    "Audio File", "Model", "#Seg.", "Total Dur. (h)", "Avg. Dur.",
+    "Avg. #Wrd.", "Avg. WER", "Std. Dev. of WER", "WER_wrd"]
 
-    df = pd.DataFrame(all_results, columns=[
-        "Audio File", "Model", "#Seg.", "Total Dur. (h)", "Avg. Dur.",
-        "Avg. #Wrd.", "Avg. WER", "Std. Dev. of WER", "WER_wrd"])
+def process_multiple_audios(audio_paths, ref_texts, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, segmentation=SEGMENTATION, backend=None, run_dir=None, fresh=False):
+    def score(audio_path, ref_text, progress):
+        return calculate_table_for_audio(audio_path, ref_text, chunk_len, concurrency, segmentation, backend, progress)
+
+    # Files run concurrently too; the shared API slots keep the total number
+    # of requests in flight at `concurrency`.
+    set_api_concurrency(concurrency)
+    settings = {
+        "benchmark": "transcription",
+        "chunk_len": chunk_len,
+        "segmentation": segmentation,
+        "upload_format": UPLOAD_FORMAT,
+        "model": backend.model_id if backend is not None else "whisper-1",
+    }
+    df = run_benchmark("transcription", audio_paths, ref_texts, score, RESULT_COLUMNS, settings,
+                       concurrency, run_dir, fresh)
     
     output_file = "benchmark_transcription_stats.xlsx"
     df.to_excel(output_file, index=False)
     print(df)
     print(f"Saved results to {output_file}")
 
-# Example Usage
+def compare_backends(audio_paths, ref_texts, chunk_len=15, concurrency=BENCHMARK_CONCURRENCY, segmentation=SEGMENTATION, local_backend=None):
+    """
+    Transcribes every file with the remote API and the local backend,
+    bypassing the transcript cache, and reports per backend and file:
+    whole-file WER, real-time factor (processing time / audio time),
+    audio seconds per wall second, and, for the local backend, audio
+    seconds per core-second. Process CPU time is shown for both; for the
+    remote API it only covers the client side.
+    """
+    local_backend = local_backend or LocalWhisperBackend()
+    local_backend.warm()  # keep model loading out of the timings
+    cores = local_backend.cpu_threads or os.cpu_count() or 1
+
+    rows = []
+    for audio_path, ref_text in zip(audio_paths, ref_texts):
+        if not os.path.exists(audio_path):
+            print(f"File not found: {audio_path}")
+            continue
+        audio = load_audio(audio_path)
+        audio_seconds = audio.duration_ms / 1000
+        for label, backend, workers in (("remote API", None, concurrency),
+                                        (local_backend.model_id, local_backend, local_backend.workers)):
+            set_api_concurrency(workers)
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            hyps, _, _ = transcribe_with_api(audio_path, chunk_len, workers, audio=audio,
+                                             segmentation=segmentation, backend=backend, use_cache=False)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rows.append([
+                os.path.basename(audio_path),
+                label,
+                round(audio_seconds, 1),
+                f"{round(wer(ref_text, ' '.join(hyps)) * 100, 2)}%",
+                round(wall, 2),
+                round(wall / audio_seconds, 3) if audio_seconds else None,
+                round(audio_seconds / wall, 2) if wall else None,
+                round(cpu, 2),
+                round(audio_seconds / (wall * cores), 2) if backend is not None and wall else None,
+            ])
+
+    df = pd.DataFrame(rows, columns=[
+        "Audio File", "Backend", "Audio (s)", "WER", "Wall (s)", "RTF",
+        "Audio s / Wall s", "CPU (s)", "Audio s / Core s"])
+    output_file = "benchmark_backend_comparison.xlsx"
+    df.to_excel(output_file, index=False)
+    print(df)
+    print(f"Saved results to {output_file}")
+    return df
+
+# Example corpus, used when no --manifest is given
 audio_paths = [
     r"C:\Users\linge\OneDrive\Desktop\audio\audio1.opus",
     r"C:\Users\linge\OneDrive\Desktop\audio\audio2.opus",
@@ -197,4 +257,17 @@ ref_texts = [
 ]
 
 if __name__ == "__main__":
-    process_multiple_audios(audio_paths, ref_texts)
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    manifest = option("--manifest")
+    if manifest:
+        audio_paths, ref_texts = load_manifest(manifest)
+    if "--compare-backends" in args:
+        compare_backends(audio_paths, ref_texts)
+    else:
+        process_multiple_audios(audio_paths, ref_texts, run_dir=option("--run-dir"), fresh="--fresh" in args)
@@ -0,0 +1,95 @@
+"""
+Benchmark Upload Formats Script
+
+Compares the audio upload formats (PCM WAV, FLAC, Opus, WebM and passthrough
+of the original recording) by bytes sent to the transcription endpoint and
+end-to-end latency (encode + upload + transcription).
+
+Usage: python benchmark_upload_formats.py [--no-api] audio_file [audio_file ...]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+from core import API_KEY, BASE_URL, LazyClient
+from audio_pipeline import UPLOAD_FORMATS, encode_audio, prepare_upload
+
+client = LazyClient(API_KEY, BASE_URL)
+
+
+def prepare(audio_path, fmt):
+    if fmt == "passthrough":
+        with open(audio_path, "rb") as f:
+            buffer, filename, _ = prepare_upload(f, passthrough=True)
+    else:
+        buffer, filename = encode_audio(audio_path, fmt)
+    return buffer, filename
+
+
+def benchmark_file(audio_path, use_api=True):
+    rows = []
+    for fmt in list(UPLOAD_FORMATS) + ["passthrough"]:
+        start = time.perf_counter()
+        buffer, filename = prepare(audio_path, fmt)
+        encode_s = time.perf_counter() - start
+        buffer.seek(0, os.SEEK_END)
+        size = buffer.tell()
+        buffer.seek(0)
+
+        words = None
+        if use_api:
+            try:
+                transcript = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=(filename, buffer),
+                    response_format="text"
+                )
+                words = len(str(transcript).split())
+            except Exception as e:
+                print(f"Error transcribing {audio_path} as {fmt}: {e}")
+        total_s = time.perf_counter() - start
+        buffer.close()
+
+        rows.append([
+            os.path.basename(audio_path),
+            fmt,
+            filename.rsplit(".", 1)[-1],
+            size,
+            round(encode_s * 1000, 1),
+            round(total_s * 1000, 1) if use_api else None,
+            words,
+        ])
+    return rows
+
+
+def run(audio_paths, use_api=True):
+    all_rows = []
+    for audio_path in audio_paths:
+        if os.path.exists(audio_path):
+            all_rows.extend(benchmark_file(audio_path, use_api))
+        else:
+            print(f"File not found: {audio_path}")
+
+    df = pd.DataFrame(all_rows, columns=[
+        "Audio File", "Format", "Ext", "Bytes Sent", "Encode (ms)", "End-to-end (ms)", "#Wrd."])
+    if not df.empty:
+        wav_bytes = df[df["Format"] == "wav"].set_index("Audio File")["Bytes Sent"]
+        df["vs WAV"] = (df["Bytes Sent"] / df["Audio File"].map(wav_bytes)).round(3)
+
+    output_file = "benchmark_upload_formats_stats.xlsx"
+    df.to_excel(output_file, index=False)
+    print(df.to_string(index=False))
+    print(f"Saved results to {output_file}")
+    return df
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    use_api = "--no-api" not in args
+    paths = [a for a in args if a != "--no-api"]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    run(paths, use_api)
@@ -0,0 +1,156 @@
+"""
+Transcription and Correction Cache
+
+Content-addressed cache for Whisper transcripts and LLM corrections.
+Entries live in an in-memory LRU tier and, when a database path is
+configured, in an on-disk sqlite tier that is trimmed back under a size
+budget (least recently used first). Hit/miss counters are kept per cache for
+monitoring.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 512))
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "")
+CACHE_MAX_DISK_BYTES = int(os.environ.get("CACHE_MAX_DISK_BYTES", 100 * 1024 * 1024))
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def make_key(*parts):
+    """
+    Builds a cache key from strings/bytes, e.g. a content hash plus the
+    model name and prompt version.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+def hash_file(f):
+    """
+    SHA-256 of a binary file object's contents; the position is restored.
+    """
+    pos = f.tell()
+    f.seek(0)
+    h = hashlib.sha256()
+    for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+        h.update(block)
+    f.seek(pos)
+    return h.hexdigest()
+
+
+def prompt_version(*prompt_parts):
+    """Short fingerprint of a prompt so edits to it invalidate old entries."""
+    return make_key(*prompt_parts)[:12]
+
+
+class TieredCache:
+    def __init__(self, name, max_entries=CACHE_MAX_ENTRIES, db_path=CACHE_DB_PATH,
+                 max_disk_bytes=CACHE_MAX_DISK_BYTES):
+        self.name = name
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT, key TEXT, value TEXT, size INTEGER, accessed REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed)")
+            self._db.commit()
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (name,)).fetchone()
+            self._disk_bytes = row[0]
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ?", (self.name, key)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                        (time.time(), self.name, key))
+                    self._db.commit()
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self.stats["sets"] += 1
+            self._remember(key, value)
+            if self._db is not None:
+                self._store(key, value)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _store(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        old = self._db.execute(
+            "SELECT size FROM cache WHERE namespace = ? AND key = ?", (self.name, key)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+            (self.name, key, value, size, time.time()))
+        self._disk_bytes += size - (old[0] if old else 0)
+
+        # Trim least recently used rows until the namespace fits its budget.
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed LIMIT 64",
+                (self.name,)).fetchall()
+            if not rows:
+                break
+            for old_key, old_size in rows:
+                self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.name, old_key))
+                self._disk_bytes -= old_size
+                self.stats["disk_evictions"] += 1
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+        self._db.commit()
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = lookups - self.stats["misses"]
+            return dict(
+                self.stats,
+                memory_entries=len(self._memory),
+                disk_bytes=self._disk_bytes if self._db is not None else None,
+                hit_rate=round(hits / lookups, 4) if lookups else None,
+            )
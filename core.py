@@ -0,0 +1,63 @@
+"""
+Shared Setup
+
+Loads .env once and holds the setup app.py and the scripts used to repeat
+on their own: API settings, the ffmpeg binary, pydub configuration and the
+OpenAI client.
+
+Nothing heavy is imported here. The OpenAI SDK (most of a cold start) is
+imported when a client is first used, pydub only by the legacy comparison
+benchmarks, and reportlab/openpyxl by the PDF and export code when they
+run. benchmark_startup.py tracks import time and memory per entry point.
+"""
+import os
+import threading
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# REPLACE THESE WITH YOUR ACTUAL VALUES OR SET ENVIRONMENT VARIABLES
+API_KEY = os.environ.get("OPENAI_API_KEY", "YOUR_API_KEY_HERE")
+BASE_URL = os.environ.get("OPENAI_BASE_URL", "YOUR_BASE_URL_HERE")
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_exe():
+    """Path of the ffmpeg binary shipped with imageio-ffmpeg."""
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def audio_segment():
+    """pydub's AudioSegment, pointed at the bundled ffmpeg."""
+    from pydub import AudioSegment
+    AudioSegment.converter = ffmpeg_exe()
+    AudioSegment.ffmpeg = ffmpeg_exe()
+    AudioSegment.ffprobe = ffmpeg_exe()
+    return AudioSegment
+
+
+class LazyClient:
+    """
+    Stands in for an OpenAI client and builds it (importing the SDK) on first
+    attribute access, so importing a module that holds one stays cheap.
+    """
+
+    def __init__(self, api_key=API_KEY, base_url=BASE_URL):
+        self._api_key = api_key
+        self._base_url = base_url
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from upstream import make_client
+                    self._client = make_client(self._api_key, self._base_url)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,117 @@
+"""
+LLM Correction Policy
+
+Decides when a transcript is worth sending to the LLM for correction and
+packs several texts into a single chat completion.
+
+- Per-field rules: short structured fields (name, age, gender, place) are
+  never corrected.
+- Lexicon pre-check: a short transcript whose words are all known
+  (medical_lexicon.txt plus any LEXICON_PATHS word lists) is left as-is.
+- Batching: multiple chunks/fields are sent as one JSON request and the
+  corrections are split back out.
+"""
+import json
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# field id -> "skip" (never correct) or "correct" (apply the pre-check)
+FIELD_POLICIES = {
+    "name": "skip",
+    "age": "skip",
+    "gender": "skip",
+    "place": "skip",
+    "symptoms": "correct",
+    "diagnosis": "correct",
+    "prescription": "correct",
+}
+
+# Transcripts up to this many words skip the LLM when every word is known.
+LEXICON_SKIP_MAX_WORDS = int(os.environ.get("LEXICON_SKIP_MAX_WORDS", 20))
+LEXICON_PATHS = [os.path.join(BASE_DIR, "medical_lexicon.txt")] + [
+    p for p in os.environ.get("LEXICON_PATHS", "").split(os.pathsep) if p
+]
+
+_WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?|\d+(?:\.\d+)?")
+
+_lexicon = None
+
+
+def load_lexicon():
+    global _lexicon
+    if _lexicon is None:
+        words = set()
+        for path in LEXICON_PATHS:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    words.update(
+                        line.strip().lower() for line in f
+                        if line.strip() and not line.startswith("#")
+                    )
+            except OSError as e:
+                print(f"Lexicon not loaded from {path}: {e}")
+        _lexicon = words
+    return _lexicon
+
+
+def unknown_words(text):
+    lexicon = load_lexicon()
+    return [
+        word for word in _WORD_RE.findall(text)
+        if not word[0].isdigit() and word.lower() not in lexicon
+        and word.lower().split("'")[0] not in lexicon
+    ]
+
+
+def needs_correction(text, field=None):
+    """
+    Returns (should_correct, reason).
+    """
+    if not text or len(text) < 3:
+        return False, "too_short"
+    if FIELD_POLICIES.get(field) == "skip":
+        return False, "field_rule"
+    words = _WORD_RE.findall(text)
+    if words and all(word[0].isdigit() for word in words):
+        return False, "numeric"
+    if len(words) <= LEXICON_SKIP_MAX_WORDS and not unknown_words(text):
+        return False, "lexicon"
+    return True, "needs_llm"
+
+
+BATCH_INSTRUCTIONS = (
+    "You will receive a JSON object {\"items\": [...]} of separate transcripts. "
+    "Apply the instructions above to each item independently and reply with only "
+    "a JSON object {\"items\": [...]} holding the corrected texts in the same order "
+    "and with the same number of items."
+)
+
+
+def batch_messages(system_prompt, texts):
+    return [
+        {"role": "system", "content": system_prompt + "\n\n" + BATCH_INSTRUCTIONS},
+        {"role": "user", "content": json.dumps({"items": list(texts)}, ensure_ascii=False)},
+    ]
+
+
+def parse_batch_response(content, expected):
+    """
+    Returns the list of corrected texts, or None if the reply is not a JSON
+    list of the expected length (callers then fall back to single calls).
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{"):] if "{" in content else content
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return None
+    items = parsed.get("items") if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list) or len(items) != expected:
+        return None
+    if not all(isinstance(item, str) for item in items):
+        return None
+    return [item.strip() for item in items]
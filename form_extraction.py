@@ -0,0 +1,140 @@
+"""
+Whole-Form Extraction
+
+Turns the transcript of one recording that covers the whole consultation
+("Name John Smith, 45 years old, male, from Pune, complains of ...") into
+the form fields with a single chat completion, instead of one recording,
+transcription and correction per field.
+
+- The LLM replies with one JSON object keyed by the form fields (the
+  columns in records.FIELDS), correcting medical terms as it goes.
+- Every value is validated: age must be a plausible whole number, gender
+  one of the form's options, text fields strings of bounded length.
+- Per-field fallback: a field that is missing or invalid in the reply (or
+  every field, when the call fails or the reply is not JSON) is taken from
+  the transcript itself when it was dictated after its spoken label
+  ("age 45", "diagnosis: ..."), and otherwise left empty for the user.
+"""
+import json
+import re
+
+from records import FIELDS
+
+EXTRACTION_PROMPT = (
+    "You are a professional medical scribe. The user message is the transcript of a doctor dictating "
+    "one patient's record. Reply with only a JSON object with exactly these keys: "
+    + ", ".join(f'"{field}"' for field in FIELDS) + ". "
+    "\"age\" is a whole number of years or null; \"gender\" is \"Male\", \"Female\", \"Other\" or null. "
+    "\"symptoms\", \"diagnosis\" and \"prescription\" hold the dictated text with grammar and medical "
+    "spelling corrected, without changing its meaning. Use null for anything that was not said; "
+    "never guess."
+)
+
+GENDERS = {"male": "Male", "m": "Male", "man": "Male", "boy": "Male",
+           "female": "Female", "f": "Female", "woman": "Female", "girl": "Female",
+           "other": "Other"}
+MAX_AGE = 130
+MAX_FIELD_CHARS = {"name": 100, "place": 100, "age": 3, "gender": 6}
+MAX_TEXT_CHARS = 2000
+
+# Spoken labels that start a field when the record is dictated in order
+# ("name ..., age ..., symptoms ...").
+FIELD_LABELS = {
+    "name": ["patient name", "name"],
+    "place": ["place", "location", "city", "village"],
+    "age": ["age", "aged"],
+    "gender": ["gender", "sex"],
+    "symptoms": ["symptoms", "complaints", "complains of", "presenting with"],
+    "diagnosis": ["diagnosis", "diagnosed with", "impression"],
+    "prescription": ["prescription", "prescribed", "medications", "medicines", "rx"],
+}
+_LABEL_RE = re.compile(
+    r"\b(" + "|".join(sorted((re.escape(label) for labels in FIELD_LABELS.values() for label in labels),
+                             key=len, reverse=True)) + r")\b\s*(?:(?:is|are|of)\b|[:-])?\s*",
+    re.IGNORECASE)
+_LABEL_FIELDS = {label: field for field, labels in FIELD_LABELS.items() for label in labels}
+_AGE_RE = re.compile(r"\d{1,3}")
+_FIRST_WORD_RE = re.compile(r"[a-z]+", re.IGNORECASE)
+
+
+def extraction_messages(transcript):
+    return [
+        {"role": "system", "content": EXTRACTION_PROMPT},
+        {"role": "user", "content": transcript},
+    ]
+
+
+def clean_value(field, value):
+    """The validated form value for a field, or None if value is unusable."""
+    if value is None or isinstance(value, (dict, list, bool)):
+        return None
+    if field == "age":
+        match = _AGE_RE.search(str(value))
+        age = int(match.group()) if match else None
+        return str(age) if age is not None and 0 < age <= MAX_AGE else None
+    text = " ".join(str(value).split()).strip(" ,.;:")
+    if field == "gender":
+        # Dictated values run on ("male, from Pune"); the first word decides.
+        match = _FIRST_WORD_RE.search(text)
+        return GENDERS.get(match.group().lower()) if match else None
+    if not text or text.lower() in ("null", "none", "n/a", "unknown", "not mentioned"):
+        return None
+    if len(text) > MAX_FIELD_CHARS.get(field, MAX_TEXT_CHARS):
+        return None
+    return text
+
+
+def parse_extraction(content):
+    """
+    Returns {field: validated value or None} from the LLM reply, or None if
+    the reply is not a JSON object.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{"):] if "{" in content else content
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    parsed = {str(key).lower(): value for key, value in parsed.items()}
+    return {field: clean_value(field, parsed.get(field)) for field in FIELDS}
+
+
+def split_by_labels(transcript):
+    """
+    {field: value} for the fields dictated after a spoken label, each value
+    running up to the next label. Validated like the LLM's values.
+    """
+    matches = list(_LABEL_RE.finditer(transcript))
+    values = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        field = _LABEL_FIELDS[" ".join(match.group(1).lower().split())]
+        if field in values:
+            continue
+        end = following.start() if following else len(transcript)
+        value = clean_value(field, transcript[match.end():end])
+        if value is not None:
+            values[field] = value
+    return values
+
+
+def merge_fields(extracted, transcript):
+    """
+    Combines the LLM values (None when the call failed) with the label
+    fallback. Returns (fields, sources): every field gets a value ("" when
+    nothing usable was found) and a source of "llm", "labels" or "empty".
+    """
+    fallback = split_by_labels(transcript)
+    fields, sources = {}, {}
+    for field in FIELDS:
+        value = extracted.get(field) if extracted else None
+        if value is not None:
+            fields[field], sources[field] = value, "llm"
+        elif field in fallback:
+            fields[field], sources[field] = fallback[field], "labels"
+        else:
+            fields[field], sources[field] = "", "empty"
+    return fields, sources
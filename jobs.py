@@ -0,0 +1,143 @@
+"""
+Transcription Job Queue
+
+Runs transcription jobs on a bounded thread pool so a Flask worker only has
+to accept the upload and hand back a job id. Clients poll the job for its
+result. Queue depth, wait time and per-stage timings are tracked for
+monitoring.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 64))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 900))
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.stages = {}
+        self.result = None
+        self.error = None
+
+    @contextmanager
+    def stage(self, name):
+        """Times one processing stage of the job, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - start, 4)
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "wait_seconds": round((self.started or time.time()) - self.created, 4),
+            "stages": dict(self.stages),
+        }
+        if self.finished:
+            data["total_seconds"] = round(self.finished - self.created, 4)
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "error":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT, ttl=JOB_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._totals = {"submitted": 0, "rejected": 0, "done": 0, "error": 0}
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+        self._stage_sums = {}
+        self._stage_counts = {}
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(job, *args); its return value becomes the job result.
+        Raises QueueFullError when max_pending jobs are already waiting.
+        """
+        job = Job()
+        with self._lock:
+            self._expire()
+            if self._queued >= self.max_pending:
+                self._totals["rejected"] += 1
+                raise QueueFullError(f"{self._queued} jobs already queued")
+            self._queued += 1
+            self._totals["submitted"] += 1
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            job.started = time.time()
+            job.status = "running"
+            wait = job.started - job.created
+            self._wait_sum += wait
+            self._wait_max = max(self._wait_max, wait)
+        try:
+            job.result = fn(job, *args)
+            job.status = "done"
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._running -= 1
+                self._totals[job.status] += 1
+                for name, seconds in job.stages.items():
+                    self._stage_sums[name] = self._stage_sums.get(name, 0.0) + seconds
+                    self._stage_counts[name] = self._stage_counts.get(name, 0) + 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            started = self._totals["done"] + self._totals["error"] + self._running
+            return {
+                "workers": self.max_workers,
+                "queue_limit": self.max_pending,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "totals": dict(self._totals),
+                "avg_wait_seconds": round(self._wait_sum / started, 4) if started else None,
+                "max_wait_seconds": round(self._wait_max, 4),
+                "avg_stage_seconds": {
+                    name: round(total / self._stage_counts[name], 4)
+                    for name, total in self._stage_sums.items()
+                },
+            }
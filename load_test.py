@@ -0,0 +1,238 @@
+"""
+Load Test Script
+
+Drives /transcribe and /submit of a running app at a target concurrency and
+reports throughput and p50/p95/p99 latency per endpoint.
+
+With --start-stack it starts mock_openai_server.py and the app itself (on
+free ports, with a throwaway record database and the transcript cache
+off), so runs are reproducible and cost no API quota. Otherwise it targets
+--url; note that the app caches transcripts of identical audio, so a plain
+run against a live app measures mostly cache hits after the first request.
+
+Usage: python load_test.py [--start-stack] [--url http://127.0.0.1:5000]
+       [--target transcribe,submit] [--concurrency 1,4,16] [--requests 200]
+       [--duration SECONDS] [--audio file] [--mock-args "--error-rate 0.02"]
+"""
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from audio_pipeline import FFMPEG_EXE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST_TIMEOUT = 120
+
+SAMPLE_RECORD = {
+    "name": "Load Test", "place": "Chennai", "age": "42", "gender": "Female",
+    "symptoms": "Fever and dry cough for three days", "diagnosis": "Viral fever",
+    "prescription": "Paracetamol 500 mg three times daily",
+}
+
+
+def sample_audio(seconds=5):
+    """A short opus/webm recording, like the browser sends."""
+    proc = subprocess.run([
+        FFMPEG_EXE, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-ac", "1", "-c:a", "libopus", "-b:a", "24k", "-f", "webm", "pipe:1",
+    ], stdout=subprocess.PIPE, check=True)
+    return proc.stdout
+
+
+def multipart(fields, files):
+    """Encodes form fields and (name, filename, bytes, mimetype) files."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data, mimetype in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def make_request(base_url, target, audio):
+    if target == "transcribe":
+        body, content_type = multipart({"field": "symptoms"}, [("audio", "recording.webm", audio, "audio/webm")])
+    elif target == "submit":
+        body, content_type = json.dumps(SAMPLE_RECORD).encode(), "application/json"
+    else:
+        raise ValueError(f"Unknown target: {target}")
+    return urllib.request.Request(f"{base_url}/{target}", data=body, method="POST",
+                                  headers={"Content-Type": content_type})
+
+
+def run_load(base_url, target, concurrency, n_requests=None, duration=None, audio=None):
+    """
+    Sends requests from `concurrency` threads until n_requests are done or
+    duration seconds have passed. Returns (latencies of successful requests,
+    error count, wall seconds).
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        while True:
+            with lock:
+                if n_requests is not None and issued[0] >= n_requests:
+                    return
+                issued[0] += 1
+            if deadline and time.perf_counter() >= deadline:
+                return
+            req = make_request(base_url, target, audio)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError) as e:
+                ok = False
+                error = str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    wall = time.perf_counter() - start
+    if errors:
+        print(f"{target}: {len(errors)} errors, e.g. {errors[0]}")
+    return latencies, len(errors), wall
+
+
+def summarize(target, concurrency, latencies, errors, wall):
+    ms = np.array(latencies) * 1000 if latencies else np.array([np.nan])
+    done = len(latencies)
+    return [
+        target, concurrency, done + errors, errors,
+        round(done / wall, 2) if wall else None,
+        round(float(np.percentile(ms, 50)), 1),
+        round(float(np.percentile(ms, 95)), 1),
+        round(float(np.percentile(ms, 99)), 1),
+        round(float(np.max(ms)), 1),
+    ]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url, proc, timeout=60):
+    end = time.time() + timeout
+    while time.time() < end:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def start_stack(workdir, mock_args=""):
+    """Starts the mock server and the app; returns (app url, processes)."""
+    mock_port, app_port = _free_port(), _free_port()
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "mock_openai_server.py"), "--port", str(mock_port)]
+        + shlex.split(mock_args), cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        OPENAI_API_KEY="mock",
+        RECORDS_DB_PATH=os.path.join(workdir, "records.sqlite"),
+        CSV_EXPORT_PATH=os.path.join(workdir, "data.csv"),
+        EXCEL_EXPORT_PATH=os.path.join(workdir, "data.xlsx"),
+        CACHE_MAX_ENTRIES="0",
+        CACHE_DB_PATH="",
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", os.path.join(BASE_DIR, "app.py"), "run",
+         "--port", str(app_port), "--with-threads", "--no-reload", "--no-debugger"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    procs = [mock, app]
+    try:
+        _wait_until_up(f"http://127.0.0.1:{mock_port}/v1/models", mock)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/", app)
+    except Exception:
+        for proc in procs:
+            proc.terminate()
+        raise
+    return f"http://127.0.0.1:{app_port}", procs
+
+
+def run(base_url, targets, concurrencies, n_requests=200, duration=None, audio=None):
+    audio = audio or sample_audio()
+    rows = []
+    for target in targets:
+        for concurrency in concurrencies:
+            latencies, errors, wall = run_load(base_url, target, concurrency, None if duration else n_requests,
+                                               duration, audio)
+            rows.append(summarize(target, concurrency, latencies, errors, wall))
+            print(f"{target} @ {concurrency}: done")
+    df = pd.DataFrame(rows, columns=[
+        "Target", "Concurrency", "#Requests", "#Errors", "Throughput (req/s)",
+        "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"])
+    print(df.to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    url = option("--url", "http://127.0.0.1:5000")
+    targets = option("--target", "transcribe,submit").split(",")
+    concurrencies = [int(c) for c in option("--concurrency", "1,4,16").split(",")]
+    n_requests = int(option("--requests", 200))
+    duration = option("--duration")
+    audio_path = option("--audio")
+    mock_args = option("--mock-args", "")
+    audio = None
+    if audio_path:
+        with open(audio_path, "rb") as f:
+            audio = f.read()
+
+    if "--start-stack" in args:
+        with tempfile.TemporaryDirectory() as workdir:
+            url, procs = start_stack(workdir, mock_args)
+            try:
+                run(url, targets, concurrencies, n_requests, float(duration) if duration else None, audio)
+            finally:
+                for proc in procs:
+                    proc.terminate()
+                    proc.wait()
+    else:
+        run(url, targets, concurrencies, n_requests, float(duration) if duration else None, audio)
@@ -0,0 +1,113 @@
+"""
+Long-Consultation Mode
+
+Recordings of LONG_RECORDING_SECONDS or more (or, when the header has no
+duration, LONG_RECORDING_BYTES or more) are not sent as one upload:
+
+- ffmpeg decodes the recording as a stream into LONG_SEGMENT_SECONDS
+  segments that overlap by LONG_OVERLAP_SECONDS, so memory holds a few
+  segments however long the consultation is
+- a recording whose header has no duration is first decoded once, without
+  keeping the audio, to check MAX_AUDIO_SECONDS, so a recording over the
+  limit is rejected before any segment is sent
+- segments are encoded and transcribed on up to LONG_CONCURRENCY threads
+  of the request's own (parallel.map_bounded) while decoding continues; a
+  request never has more than LONG_CONCURRENCY segments in flight
+- the transcripts are stitched back together: the words both sides of an
+  overlap transcribed are found by matching the end of one transcript
+  against the start of the next, and kept once; without a match at the
+  seam the transcripts are simply joined, so no words are ever dropped
+  from the middle of a transcript
+
+Each request stays under the API's file-size limit and the wall-clock time
+shrinks roughly with LONG_CONCURRENCY.
+"""
+import os
+import re
+
+from audio_pipeline import decoded_seconds, overlapping_segments
+from parallel import map_bounded
+
+LONG_RECORDING_SECONDS = float(os.environ.get("LONG_RECORDING_SECONDS", 300))
+LONG_RECORDING_BYTES = int(os.environ.get("LONG_RECORDING_BYTES", 2 * 1024 * 1024))
+LONG_SEGMENT_SECONDS = float(os.environ.get("LONG_SEGMENT_SECONDS", 120))
+LONG_OVERLAP_SECONDS = float(os.environ.get("LONG_OVERLAP_SECONDS", 3))
+LONG_CONCURRENCY = int(os.environ.get("LONG_CONCURRENCY", 4))
+
+# An overlap is a run of at least MIN_OVERLAP_WORDS words that ends one
+# transcript and starts the next, at most this many words per second of
+# overlap long (speech runs at 2-3 words per second). Up to
+# SEAM_TOLERANCE_WORDS words cut off at a segment edge (and so transcribed
+# differently, or only on one side) may sit between the run and the seam.
+OVERLAP_WORDS_PER_SECOND = 5
+MIN_OVERLAP_WORDS = 2
+SEAM_TOLERANCE_WORDS = 1
+
+_NORMALIZE_RE = re.compile(r"[^\w']+")
+
+
+def is_long_recording(info, size=None):
+    """Whether a probed upload (check_upload info, byte size) takes long mode."""
+    duration = info and info.get("duration")
+    if duration:
+        return duration >= LONG_RECORDING_SECONDS
+    return size is not None and size >= LONG_RECORDING_BYTES
+
+
+def _normalize(word):
+    return _NORMALIZE_RE.sub("", word.lower())
+
+
+def stitch_pair(left, right, window):
+    """
+    Joins two word lists whose ends overlap. The overlap is the longest run
+    of up to `window` words (compared case and punctuation insensitively)
+    that ends left and starts right, give or take SEAM_TOLERANCE_WORDS at
+    either edge; it is kept once, along with nothing past it on the left or
+    before it on the right. Without such a run the lists are concatenated.
+    """
+    left_norm = [_normalize(w) for w in left[-(window + SEAM_TOLERANCE_WORDS):]]
+    right_norm = [_normalize(w) for w in right[:window + SEAM_TOLERANCE_WORDS]]
+    for size in range(min(window, len(left_norm), len(right_norm)), MIN_OVERLAP_WORDS - 1, -1):
+        for left_skip in range(SEAM_TOLERANCE_WORDS + 1):
+            end = len(left_norm) - left_skip
+            if end < size:
+                break
+            for right_skip in range(min(SEAM_TOLERANCE_WORDS, len(right_norm) - size) + 1):
+                if left_norm[end - size:end] == right_norm[right_skip:right_skip + size]:
+                    return left[:len(left) - left_skip] + right[right_skip + size:]
+    return left + right
+
+
+def stitch_transcripts(texts, overlap_seconds=LONG_OVERLAP_SECONDS):
+    """Joins the transcripts of consecutive overlapping segments."""
+    window = int(overlap_seconds * OVERLAP_WORDS_PER_SECOND) + MIN_OVERLAP_WORDS
+    words = []
+    for text in texts:
+        words = stitch_pair(words, text.split(), window)
+    return " ".join(words)
+
+
+def transcribe_long(source, transcribe_segment, max_seconds=None, duration=None,
+                    segment_seconds=LONG_SEGMENT_SECONDS, overlap_seconds=LONG_OVERLAP_SECONDS,
+                    concurrency=LONG_CONCURRENCY):
+    """
+    Transcribes a recording (path or seekable binary file object) segment by
+    segment: transcribe_segment(DecodedAudio) -> text runs for up to
+    `concurrency` segments at a time while the next ones are decoded.
+    Without a known duration (from the header), a recording longer than
+    max_seconds raises AudioLimitError before any segment is transcribed.
+    The first failed segment's error is raised and the rest are cancelled.
+    """
+    if max_seconds and not duration:
+        start = None if isinstance(source, (str, os.PathLike)) else source.tell()
+        decoded_seconds(source, max_seconds)
+        if start is not None:
+            source.seek(start)
+    segments = overlapping_segments(source, segment_seconds * 1000, overlap_seconds * 1000,
+                                    max_seconds=max_seconds)
+    try:
+        texts = map_bounded(transcribe_segment, segments, concurrency)
+    finally:
+        segments.close()
+    return stitch_transcripts(texts, overlap_seconds)
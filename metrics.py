@@ -0,0 +1,196 @@
+"""
+Latency and Throughput Metrics
+
+Counters and histograms for the hot paths (upload read, conversion,
+transcription, correction, record storage, PDF rendering), rendered in the
+Prometheus text format for the /metrics endpoint. Other components expose
+their own counters (caches, job queue, upstream) through collectors that
+are read at scrape time.
+
+stage() also collects per-request stage timings, which app.py writes as
+one JSON log line per request when TIMING_LOG=1.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TIMING_LOG = os.environ.get("TIMING_LOG", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _format_labels(key + (("le", _format_value(float(bound))),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(round(total, 6))}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name, help_text, labelnames=()):
+    metric = Counter(name, help_text, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(fn):
+    """
+    fn() returns [(name, type, help, [(labels dict, value), ...]), ...]
+    describing values owned by another component; called on every scrape.
+    """
+    _collectors.append(fn)
+
+
+STAGE_SECONDS = histogram("app_stage_seconds", "Time spent per processing stage", ["stage"])
+STAGE_ERRORS = counter("app_stage_errors_total", "Exceptions raised per processing stage", ["stage"])
+REQUEST_SECONDS = histogram("app_http_request_seconds", "HTTP request latency", ["endpoint"])
+REQUESTS = counter("app_http_requests_total", "HTTP requests", ["endpoint", "status"])
+BYTES = counter("app_bytes_total", "Bytes received from clients (in) and sent upstream (out)",
+                ["direction", "kind"])
+AUDIO_SECONDS = counter("app_audio_seconds_total", "Seconds of audio sent for transcription")
+UPLOADS_REJECTED = counter("app_uploads_rejected_total", "Uploads rejected by the size and duration limits",
+                           ["reason"])
+UPLOADS = counter("app_uploads_total", "Recordings by detected container/codec and whether they were passed "
+                  "through to the API or decoded/re-encoded first", ["format", "path"])
+CLIENT_SECONDS = histogram("app_client_seconds", "Browser-reported capture timings (encode, stop_to_text)",
+                           ["codec", "phase"])
+CLIENT_BITRATE = histogram("app_client_upload_kbps", "Browser-reported upload bitrate (kbit per second of audio)",
+                           ["codec"], buckets=(8, 16, 24, 32, 48, 64, 128, 256, 512))
+CORRECTION_STREAM_SECONDS = histogram("app_correction_stream_seconds",
+                                      "Streamed LLM correction: time to first token and total time", ["phase"])
+FORM_FIELDS = counter("app_form_fields_total", "Whole-form dictation fields by where the value came from",
+                      ["field", "source"])
+UPSTREAM_SECONDS = histogram("app_upstream_seconds", "Upstream API call latency",
+                             ["op", "endpoint", "outcome"])
+
+_request = threading.local()
+
+
+def start_request():
+    _request.stages = {}
+
+
+def request_stages():
+    """Stage timings of the current request so far, or None outside one."""
+    return getattr(_request, "stages", None)
+
+
+def end_request():
+    stages = request_stages()
+    _request.stages = None
+    return stages
+
+
+@contextmanager
+def stage(name):
+    """Times a block as one stage (histogram, error counter, request log)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        stages = request_stages()
+        if stages is not None:
+            stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,245 @@
+"""
+Mock OpenAI Server
+
+A local stand-in for the OpenAI endpoints the app and benchmarks call, for
+load tests and for measuring our own overhead without spending quota:
+
+- POST /v1/audio/transcriptions (multipart, response_format text or json)
+- POST /v1/chat/completions (also the batched {"items": [...]} requests)
+- GET  /v1/models
+- GET  /mock/stats
+
+Latency is drawn per request from a distribution, e.g. "fixed:0.2",
+"uniform:0.1:0.5", "normal:0.8:0.2", "lognormal:0.8:0.5" (median, sigma) or
+"exp:0.5" (mean); transcription latency can also grow per second of audio.
+A share of requests fail with 500 or 429 (with Retry-After). Responses are
+canned text or an echo of the input. Chat requests with "stream": true get
+server-sent chunks, one word every --token-interval seconds after the chat
+latency (which then plays the part of the time to first token).
+
+Usage: python mock_openai_server.py [--port 8090] [--transcribe-latency SPEC]
+       [--chat-latency SPEC] [--per-audio-second S] [--error-rate R]
+       [--rate-limit-rate R] [--token-interval S] [--mode canned|echo]
+Then point the app at it: OPENAI_BASE_URL=http://127.0.0.1:8090/v1
+"""
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+CANNED_TRANSCRIPT = ("patient reports fever and dry cough for three days with mild headache "
+                     "and body ache no breathlessness")
+
+config = {
+    "transcribe_latency": os.environ.get("MOCK_TRANSCRIBE_LATENCY", "lognormal:0.8:0.4"),
+    "chat_latency": os.environ.get("MOCK_CHAT_LATENCY", "lognormal:0.6:0.4"),
+    # Extra transcription latency per second of uploaded audio (estimated
+    # from the upload size when the audio cannot be probed cheaply).
+    "per_audio_second": float(os.environ.get("MOCK_PER_AUDIO_SECOND", 0.0)),
+    "error_rate": float(os.environ.get("MOCK_ERROR_RATE", 0.0)),
+    "rate_limit_rate": float(os.environ.get("MOCK_RATE_LIMIT_RATE", 0.0)),
+    "token_interval": float(os.environ.get("MOCK_TOKEN_INTERVAL", 0.02)),
+    "mode": os.environ.get("MOCK_MODE", "canned"),
+}
+
+# Rough compressed bitrate used to turn upload bytes into audio seconds.
+ASSUMED_BYTES_PER_SECOND = 4000
+
+app = Flask(__name__)
+
+stats = {"transcriptions": 0, "chat_completions": 0, "errors": 0, "rate_limited": 0, "busy_max": 0}
+_busy = 0
+stats_lock = threading.Lock()
+
+
+def sample_latency(spec):
+    """Seconds to wait for one request, drawn from a distribution spec."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":") if v]
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return random.uniform(values[0], values[1])
+    if kind == "normal":
+        return max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp":
+        return random.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _injected_error():
+    """A 429 or 500 response for the configured share of requests, else None."""
+    roll = random.random()
+    if roll < config["rate_limit_rate"]:
+        with stats_lock:
+            stats["rate_limited"] += 1
+        response = jsonify({"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}})
+        response.status_code = 429
+        response.headers["Retry-After"] = "1"
+        return response
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        with stats_lock:
+            stats["errors"] += 1
+        response = jsonify({"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+        response.status_code = 500
+        return response
+    return None
+
+
+def _wait(seconds):
+    global _busy
+    with stats_lock:
+        _busy += 1
+        stats["busy_max"] = max(stats["busy_max"], _busy)
+    try:
+        time.sleep(seconds)
+    finally:
+        with stats_lock:
+            _busy -= 1
+
+
+@app.route("/v1/audio/transcriptions", methods=["POST"])
+def transcriptions():
+    with stats_lock:
+        stats["transcriptions"] += 1
+    upload = request.files.get("file")
+    size = len(upload.read()) if upload else 0
+    _wait(sample_latency(config["transcribe_latency"])
+          + config["per_audio_second"] * size / ASSUMED_BYTES_PER_SECOND)
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    if config["mode"] == "echo":
+        text = f"{upload.filename if upload else 'audio'} {size} bytes"
+    else:
+        text = CANNED_TRANSCRIPT
+    if request.form.get("response_format", "json") == "text":
+        return Response(text + "\n", mimetype="text/plain")
+    return jsonify({"text": text})
+
+
+def _reply_for(messages):
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    try:
+        items = json.loads(user).get("items")
+    except (ValueError, AttributeError):
+        items = None
+    if isinstance(items, list):
+        # Batched correction request: answer in the same JSON shape.
+        corrected = items if config["mode"] == "echo" else [item.strip().capitalize() for item in items]
+        return json.dumps({"items": corrected})
+    if config["mode"] == "echo":
+        return user
+    return user.strip().capitalize().rstrip(".") + "." if user.strip() else ""
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    with stats_lock:
+        stats["chat_completions"] += 1
+    body = request.get_json(silent=True) or {}
+    _wait(sample_latency(config["chat_latency"]))
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    messages = body.get("messages") or []
+    content = _reply_for(messages)
+    if body.get("stream"):
+        return Response(_stream_chunks(body.get("model", "mock"), content), mimetype="text/event-stream")
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+    completion_tokens = len(content.split())
+    return jsonify({
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    })
+
+
+def _stream_chunks(model, content):
+    chunk_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+
+    def chunk(delta, finish_reason=None):
+        return "data: " + json.dumps({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            time.sleep(config["token_interval"])
+        yield chunk({"content": word if i == len(words) - 1 else word + " "})
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.route("/v1/models")
+def models():
+    return jsonify({"object": "list", "data": [
+        {"id": "whisper-1", "object": "model", "owned_by": "mock"},
+        {"id": "gpt-3.5-turbo", "object": "model", "owned_by": "mock"},
+    ]})
+
+
+@app.route("/mock/stats")
+def mock_stats():
+    with stats_lock:
+        return jsonify(dict(stats, busy=_busy, config=config))
+
+
+def parse_args(args):
+    port = 8090
+    options = {
+        "--transcribe-latency": ("transcribe_latency", str),
+        "--chat-latency": ("chat_latency", str),
+        "--per-audio-second": ("per_audio_second", float),
+        "--error-rate": ("error_rate", float),
+        "--rate-limit-rate": ("rate_limit_rate", float),
+        "--token-interval": ("token_interval", float),
+        "--mode": ("mode", str),
+    }
+    i = 0
+    while i < len(args):
+        if args[i] == "--port":
+            port = int(args[i + 1])
+        elif args[i] in options:
+            key, cast = options[args[i]]
+            config[key] = cast(args[i + 1])
+        else:
+            raise SystemExit(f"Unknown option: {args[i]}")
+        i += 2
+    # Fail on a bad spec now rather than on the first request.
+    sample_latency(config["transcribe_latency"])
+    sample_latency(config["chat_latency"])
+    return port
+
+
+if __name__ == "__main__":
+    port = parse_args(sys.argv[1:])
+    print(f"Mock OpenAI server on http://127.0.0.1:{port}/v1 with {config}")
+    app.run(host="127.0.0.1", port=port, threaded=True)
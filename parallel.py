@@ -0,0 +1,93 @@
+"""
+Parallel API Calls for the Benchmarks
+
+Runs benchmark work (files and chunks) on thread pools while a shared
+semaphore caps the number of API requests in flight. Results are returned in
+input order so metrics match a sequential run. Rate-limited and transient
+failures are retried with jittered exponential backoff, honouring the
+server's Retry-After header when present.
+
+map_bounded also serves the app's long-consultation mode: each request gets
+its own slots, so one long recording never holds up another user's calls.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from upstream import backoff_delay, is_retryable, retry_after
+
+BENCHMARK_CONCURRENCY = int(os.environ.get("BENCHMARK_CONCURRENCY", 4))
+MAX_RETRIES = int(os.environ.get("BENCHMARK_MAX_RETRIES", 5))
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# At most BENCHMARK_CONCURRENCY API requests run at once, however the work is
+# split between files and chunks.
+api_slots = threading.BoundedSemaphore(BENCHMARK_CONCURRENCY)
+
+
+def set_api_concurrency(concurrency):
+    """Changes the cap on in-flight API requests (call before starting work)."""
+    global api_slots
+    api_slots = threading.BoundedSemaphore(max(1, concurrency))
+
+
+def map_ordered(fn, items, concurrency=BENCHMARK_CONCURRENCY):
+    """
+    Like map(fn, items) but on up to `concurrency` threads; the result list
+    keeps the order of items.
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+def map_bounded(fn, items, concurrency=BENCHMARK_CONCURRENCY):
+    """
+    Like map_ordered, but draws items lazily and holds a slot per item until
+    fn returns: at most `concurrency` items (e.g. decoded audio segments) are
+    taken from the iterator and in flight at once. The first error stops
+    drawing items, cancels the ones not started and is raised.
+    """
+    slots = threading.BoundedSemaphore(max(1, concurrency))
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        try:
+            for item in items:
+                slots.acquire()
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                future = executor.submit(fn, item)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def call_with_backoff(fn, *args, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Calls fn while holding an API slot, retrying rate-limit and transient
+    errors. The slot is released while sleeping so other calls can proceed.
+    """
+    attempt = 0
+    while True:
+        with api_slots:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    raise
+                error = e
+        delay = retry_after(error)
+        if delay is None:
+            delay = backoff_delay(attempt, BASE_DELAY, MAX_DELAY)
+        attempt += 1
+        print(f"Retrying after {type(error).__name__} (attempt {attempt}/{max_retries}, {delay:.1f}s)")
+        time.sleep(delay)
@@ -0,0 +1,298 @@
+"""
+Prescription PDF Rendering
+
+Draws prescriptions with reportlab. The static letterhead (navy header bar,
+title, footer) is defined once per document as a form XObject and stamped
+on every page, so a batch of prescriptions stores it only once. Text is
+wrapped in a single pass using cached per-glyph widths, and sections that
+run past the bottom margin continue on a new page.
+
+Batches (e.g. a whole day from the dashboard) render in a process pool:
+one PDF per record packed into a ZIP, or one combined PDF.
+
+reportlab is imported on the first render, not when the app starts.
+"""
+import importlib.util
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+HAS_REPORTLAB = importlib.util.find_spec("reportlab") is not None
+colors = letter = stringWidth = canvas = None
+
+
+def _load_reportlab():
+    global colors, letter, stringWidth, canvas
+    if canvas is None:
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.pdfgen import canvas
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_BATCH_LIMIT = int(os.environ.get("PDF_BATCH_LIMIT", 500))
+# Batches up to this size are rendered in the request thread.
+PDF_INLINE_MAX = 4
+
+PAGE_WIDTH, PAGE_HEIGHT = 612.0, 792.0  # US letter
+MARGIN = 40
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+BODY_FONT = "Helvetica"
+BODY_SIZE = 11
+LEADING = 15
+# Lowest baseline for body text; the footer sits below it.
+CONTENT_BOTTOM = 70
+SECTION_GAP = 25
+
+NAVY = "#0f172a"  # Primary Navy
+TEAL = "#0d9488"  # Secondary Teal
+LETTERHEAD = "letterhead"
+
+SECTIONS = [("SYMPTOMS", "symptoms"), ("DIAGNOSIS", "diagnosis"), ("PRESCRIPTION", "prescription")]
+
+
+class FontMetrics:
+    """Widths of one font at one size, cached per glyph."""
+
+    def __init__(self, font, size):
+        self.font = font
+        self.size = size
+        self._glyphs = {}
+        _load_reportlab()
+        self.space = self.width(" ")
+
+    def width(self, text):
+        glyphs = self._glyphs
+        total = 0.0
+        for ch in text:
+            w = glyphs.get(ch)
+            if w is None:
+                w = glyphs[ch] = stringWidth(ch, self.font, self.size)
+            total += w
+        return total
+
+
+_metrics = {}
+
+
+def font_metrics(font=BODY_FONT, size=BODY_SIZE):
+    key = (font, size)
+    if key not in _metrics:
+        _metrics[key] = FontMetrics(font, size)
+    return _metrics[key]
+
+
+def _split_word(word, metrics, max_width):
+    """Breaks a word wider than max_width into pieces that fit."""
+    pieces, piece, width = [], "", 0.0
+    for ch in word:
+        w = metrics.width(ch)
+        if piece and width + w > max_width:
+            pieces.append(piece)
+            piece, width = "", 0.0
+        piece += ch
+        width += w
+    pieces.append(piece)
+    return pieces
+
+
+def wrap_text(text, max_width=TEXT_WIDTH, font=BODY_FONT, size=BODY_SIZE):
+    """
+    Greedy word wrap in one pass over the words, keeping a running line
+    width. Line breaks in the text start a new paragraph.
+    """
+    metrics = font_metrics(font, size)
+    lines = []
+    for paragraph in str(text).splitlines() or [""]:
+        line, line_width = [], 0.0
+        for word in paragraph.split():
+            w = metrics.width(word)
+            if w > max_width:
+                pieces = _split_word(word, metrics, max_width)
+                if line:
+                    lines.append(" ".join(line))
+                lines.extend(pieces[:-1])
+                word = pieces[-1]
+                line, line_width = [word], metrics.width(word)
+                continue
+            if line and line_width + metrics.space + w > max_width:
+                lines.append(" ".join(line))
+                line, line_width = [word], w
+            elif line:
+                line.append(word)
+                line_width += metrics.space + w
+            else:
+                line, line_width = [word], w
+        lines.append(" ".join(line))
+    return lines
+
+
+class PrescriptionDocument:
+    """
+    One PDF holding one or more prescriptions, each starting on a new page.
+    """
+
+    def __init__(self, buffer):
+        _load_reportlab()
+        self.canvas = canvas.Canvas(buffer, pagesize=letter)
+        self.canvas.setTitle("Medical Prescription")
+        self._define_letterhead()
+        self._page_open = False
+
+    def _define_letterhead(self):
+        p = self.canvas
+        p.beginForm(LETTERHEAD)
+        p.setFillColor(colors.HexColor(NAVY))
+        p.rect(0, PAGE_HEIGHT - 80, PAGE_WIDTH, 80, stroke=0, fill=1)
+        p.setFillColor(colors.white)
+        p.setFont("Helvetica-Bold", 24)
+        p.drawString(MARGIN, PAGE_HEIGHT - 50, "MEDICAL PRESCRIPTION")
+        p.setFont("Helvetica", 10)
+        p.drawString(PAGE_WIDTH - 180, PAGE_HEIGHT - 30, "ClinicaSync Digital Scribe")
+        p.setFont("Helvetica-Oblique", 9)
+        p.setFillColor(colors.gray)
+        p.drawCentredString(PAGE_WIDTH / 2, 40, "Digitally generated by ClinicaSync AI Medical Scribe")
+        p.endForm()
+
+    def _start_page(self, date):
+        p = self.canvas
+        if self._page_open:
+            p.showPage()
+        self._page_open = True
+        p.doForm(LETTERHEAD)
+        p.setFillColor(colors.white)
+        p.setFont("Helvetica", 10)
+        p.drawString(PAGE_WIDTH - 180, PAGE_HEIGHT - 45, f"Date: {date}")
+        p.setFillColor(colors.black)
+
+    def _continue_page(self, data, date):
+        """Starts a continuation page; returns the first baseline."""
+        self._start_page(date)
+        p = self.canvas
+        p.setFont("Helvetica-Oblique", 10)
+        p.drawString(MARGIN, PAGE_HEIGHT - 105, f"{data.get('name', 'N/A')} (continued)")
+        return PAGE_HEIGHT - 135
+
+    def add(self, data):
+        p = self.canvas
+        date = data.get('date') or 'Today'
+        self._start_page(date)
+
+        # --- Patient Info ---
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(MARGIN, PAGE_HEIGHT - 120, "PATIENT INFORMATION")
+        p.line(MARGIN, PAGE_HEIGHT - 125, 200, PAGE_HEIGHT - 125)
+
+        p.setFont("Helvetica", 12)
+        p.drawString(MARGIN, PAGE_HEIGHT - 150, f"Name: {data.get('name', 'N/A')}")
+        p.drawString(MARGIN, PAGE_HEIGHT - 170, f"Age: {data.get('age', 'N/A')}")
+        p.drawString(250, PAGE_HEIGHT - 150, f"Gender: {data.get('gender', 'N/A')}")
+        p.drawString(250, PAGE_HEIGHT - 170, f"Place: {data.get('place', 'N/A')}")
+
+        # --- Clinical Details ---
+        y = PAGE_HEIGHT - 220
+        for title, field in SECTIONS:
+            lines = wrap_text(data.get(field) or 'N/A')
+            # Keep a heading together with its first line.
+            if y - 20 < CONTENT_BOTTOM:
+                y = self._continue_page(data, date)
+            p.setFont("Helvetica-Bold", 12)
+            p.setFillColor(colors.HexColor(TEAL))
+            p.drawString(MARGIN, y, title)
+            y -= 20
+
+            p.setFillColor(colors.black)
+            text_obj = p.beginText(MARGIN, y)
+            text_obj.setFont(BODY_FONT, BODY_SIZE)
+            text_obj.setLeading(LEADING)
+            for line in lines:
+                if y < CONTENT_BOTTOM:
+                    p.drawText(text_obj)
+                    y = self._continue_page(data, date)
+                    p.setFillColor(colors.black)
+                    text_obj = p.beginText(MARGIN, y)
+                    text_obj.setFont(BODY_FONT, BODY_SIZE)
+                    text_obj.setLeading(LEADING)
+                text_obj.textLine(line)
+                y -= LEADING
+            p.drawText(text_obj)
+            y -= SECTION_GAP
+
+    def save(self):
+        self.canvas.save()
+
+
+def render_prescriptions(records):
+    """Renders records into one PDF and returns its bytes."""
+    buffer = BytesIO()
+    doc = PrescriptionDocument(buffer)
+    for data in records:
+        doc.add(data)
+    doc.save()
+    return buffer.getvalue()
+
+
+def render_prescription(data):
+    return render_prescriptions([data])
+
+
+def _render_each(records):
+    """Worker task: one PDF per record."""
+    return [render_prescription(data) for data in records]
+
+
+def pdf_filename(data, index=None):
+    name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(data.get('name') or 'patient'))
+    prefix = f"{index:04d}_" if index is not None else ""
+    return f"{prefix}prescription_{name}.pdf"
+
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pool
+
+
+def render_batch(records, fmt="pdf"):
+    """
+    Renders many prescriptions. fmt "pdf" returns one combined PDF, "zip" a
+    ZIP with one PDF per record. Returns (bytes, mimetype, extension).
+
+    ZIP batches are split across PDF_WORKERS processes. A combined PDF has
+    to come out of a single canvas, so it is rendered by one worker process
+    (keeping the CPU work off the request thread).
+    """
+    records = list(records)
+    inline = len(records) <= PDF_INLINE_MAX or PDF_WORKERS <= 1
+    if fmt == "pdf":
+        if inline:
+            data = render_prescriptions(records)
+        else:
+            data = _get_pool().submit(render_prescriptions, records).result()
+        return data, "application/pdf", "pdf"
+    if fmt != "zip":
+        raise ValueError(f"Unknown batch format: {fmt}")
+
+    if inline:
+        pdfs = _render_each(records)
+    else:
+        size = -(-len(records) // (PDF_WORKERS * 4))
+        parts = [records[i:i + size] for i in range(0, len(records), size)]
+        pdfs = [pdf for part in _get_pool().map(_render_each, parts) for pdf in part]
+
+    buffer = BytesIO()
+    # PDFs are mostly compressed streams already; storing avoids a second pass.
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for i, (data, pdf) in enumerate(zip(records, pdfs), 1):
+            zf.writestr(pdf_filename(data, i), pdf)
+    return buffer.getvalue(), "application/zip", "zip"
+
+
+def record_date(created_at):
+    return datetime.fromtimestamp(created_at).strftime("%Y-%m-%d") if created_at else "Today"
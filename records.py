@@ -0,0 +1,376 @@
+"""
+Patient Record Store
+
+sqlite (WAL mode) is the system of record for submitted forms. A submit is
+one indexed INSERT, whatever the number of stored records, and writers are
+serialized so concurrent submits cannot overwrite each other. The Excel and
+CSV files are exports: written on demand, or rewritten in the background a
+few seconds after new records arrive (EXPORT_INTERVAL_SECONDS).
+
+An existing data.csv is imported once into an empty database so records
+saved before the store existed are kept.
+
+The dashboard reads pages of records through page(): keyset pagination over
+(sort column, id) indexes and an FTS5 index on name, place and diagnosis, so
+a page costs the same at 100 records as at 100,000.
+"""
+import base64
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from metrics import stage
+
+RECORDS_DB_PATH = os.environ.get("RECORDS_DB_PATH", "records.sqlite")
+# Seconds to wait after a submit before the background export runs; 0 turns
+# background exports off (files are then only written on request).
+EXPORT_INTERVAL_SECONDS = float(os.environ.get("EXPORT_INTERVAL_SECONDS", 30))
+EXCEL_EXPORT_PATH = os.environ.get("EXCEL_EXPORT_PATH", "data.xlsx")
+CSV_EXPORT_PATH = os.environ.get("CSV_EXPORT_PATH", "data.csv")
+
+FIELDS = ["name", "place", "age", "gender", "symptoms", "diagnosis", "prescription"]
+HEADERS = ["Name", "Place", "Age", "Gender", "Symptoms", "Diagnosis", "Prescription"]
+
+EXPORT_BATCH_ROWS = 1000
+
+# Dashboard sort keys -> column; "created" is insertion order (the id).
+SORT_COLUMNS = {"created": None, "name": "name", "place": "place", "diagnosis": "diagnosis"}
+SEARCH_FIELDS = ["name", "place", "diagnosis"]
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+_SEARCH_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _cell(value):
+    # Stored as "" rather than NULL so (column, id) keyset comparisons work.
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or not values or not isinstance(values[-1], int):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class RecordStore:
+    def __init__(self, db_path=RECORDS_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            + ", ".join(f"{field} TEXT" for field in FIELDS) + ")"
+        )
+        for column in SORT_COLUMNS.values():
+            if column:
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS records_{column} ON records ({column} COLLATE NOCASE, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS records_created_at ON records (created_at)")
+        # Row count kept by a trigger so the dashboard total is one lookup.
+        self._db.execute("CREATE TABLE IF NOT EXISTS records_meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._db.execute(
+            "INSERT OR IGNORE INTO records_meta (key, value) SELECT 'count', COUNT(*) FROM records")
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS records_count_insert AFTER INSERT ON records BEGIN "
+            "UPDATE records_meta SET value = value + 1 WHERE key = 'count'; END")
+        self.fts = self._create_search_index()
+        self._db.commit()
+
+    def _create_search_index(self):
+        """
+        FTS5 index over SEARCH_FIELDS kept in sync by a trigger. Returns False
+        when this sqlite build has no FTS5 (search then uses prefix LIKE on
+        the column indexes).
+        """
+        exists = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'records_fts'").fetchone()
+        try:
+            self._db.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+                f"{', '.join(SEARCH_FIELDS)}, content='records', content_rowid='id')")
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable, using prefix search: {e}")
+            return False
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON records BEGIN "
+            f"INSERT INTO records_fts (rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"VALUES (new.id, {', '.join('new.' + f for f in SEARCH_FIELDS)}); END")
+        if not exists:
+            # Index records stored before the search index existed.
+            self._db.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+        return True
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints; a crash can lose the
+        # last commits but never corrupts the database.
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        """Per-thread read connection, so reads run alongside the writer."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def insert(self, record):
+        """Appends one record (a dict keyed by FIELDS) and returns its id."""
+        values = [_cell(record.get(field)) for field in FIELDS]
+        with self._lock:
+            cursor = self._db.execute(
+                f"INSERT INTO records (created_at, {', '.join(FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * len(FIELDS))})",
+                [time.time()] + values)
+            self._db.commit()
+        return cursor.lastrowid
+
+    def insert_many(self, rows, created_at=None):
+        """Bulk insert of row lists in FIELDS order (imports, benchmarks)."""
+        created_at = created_at or time.time()
+        with self._lock:
+            self._db.executemany(
+                f"INSERT INTO records (created_at, {', '.join(FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * len(FIELDS))})",
+                ([created_at] + [_cell(v) for v in row] for row in rows))
+            self._db.commit()
+
+    def count(self):
+        return self._reader().execute("SELECT value FROM records_meta WHERE key = 'count'").fetchone()[0]
+
+    def page(self, search=None, sort="created", order="desc", limit=PAGE_SIZE, cursor=None):
+        """
+        One page of records for the dashboard.
+
+        Returns {"records": [...], "next_cursor": str or None, "total": int or
+        None}. Pass next_cursor back to get the following page; total is only
+        given without a search, where it is known without counting matches.
+        Raises ValueError for an unknown sort or a malformed cursor.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort: {sort}")
+        descending = order == "desc"
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        column = SORT_COLUMNS[sort]
+        keys = ([f"r.{column} COLLATE NOCASE"] if column else []) + ["r.id"]
+
+        where, params = [], []
+        source = "records r"
+        terms = _SEARCH_TERM_RE.findall(search or "")
+        if terms and self.fts:
+            source = "records_fts f JOIN records r ON r.id = f.rowid"
+            if not column:
+                # Walk the full-text index in rowid order; it can stop after
+                # one page instead of sorting every match.
+                keys = ["f.rowid"]
+            where.append("records_fts MATCH ?")
+            params.append(" AND ".join(f'"{term}"*' for term in terms))
+        elif terms:
+            for term in terms:
+                where.append("(" + " OR ".join(f"r.{field} LIKE ?" for field in SEARCH_FIELDS) + ")")
+                params.extend([term.replace("%", "").replace("_", "") + "%"] * len(SEARCH_FIELDS))
+        if cursor:
+            values = _decode_cursor(cursor)
+            if len(values) != len(keys):
+                raise ValueError("Cursor does not match the sort")
+            where.append(f"({', '.join(keys)}) {'<' if descending else '>'} "
+                         f"({', '.join('?' * len(keys))})")
+            params.extend(values)
+
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT r.id, r.created_at, {', '.join('r.' + f for f in FIELDS)} FROM {source}"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + f" ORDER BY {', '.join(key + ' ' + direction for key in keys)} LIMIT ?")
+        rows = self._reader().execute(sql, params + [limit + 1]).fetchall()
+
+        records = [
+            dict(zip(HEADERS, row[2:]), id=row[0], created_at=row[1])
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = records[-1]
+            last_values = ([last[HEADERS[FIELDS.index(column)]]] if column else []) + [last["id"]]
+            next_cursor = _encode_cursor(last_values)
+        return {
+            "records": records,
+            "next_cursor": next_cursor,
+            "total": None if terms else self.count(),
+        }
+
+    def find(self, ids=None, day=None):
+        """
+        Records by id and/or for one local calendar day ("YYYY-MM-DD"), as
+        dicts keyed by FIELDS plus id and created_at, oldest first.
+        """
+        where, params = [], []
+        if ids is not None:
+            ids = [int(i) for i in ids]
+            if not ids:
+                return []
+            where.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if day:
+            start = datetime.strptime(day, "%Y-%m-%d")
+            where.append("created_at >= ? AND created_at < ?")
+            params.extend([start.timestamp(), (start + timedelta(days=1)).timestamp()])
+        rows = self._reader().execute(
+            f"SELECT id, created_at, {', '.join(FIELDS)} FROM records"
+            + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id", params).fetchall()
+        return [dict(zip(FIELDS, row[2:]), id=row[0], created_at=row[1]) for row in rows]
+
+    def iter_rows(self, batch_rows=EXPORT_BATCH_ROWS):
+        """Yields every record as a list in FIELDS order, oldest first."""
+        cursor = self._reader().execute(f"SELECT {', '.join(FIELDS)} FROM records ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            for row in rows:
+                yield list(row)
+
+    def import_csv(self, csv_path=CSV_EXPORT_PATH):
+        """
+        Loads an existing data.csv into an empty store. Returns the number of
+        rows imported.
+        """
+        if self.count() or not os.path.exists(csv_path):
+            return 0
+        with open(csv_path, mode='r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            rows = [(row + [None] * len(FIELDS))[:len(FIELDS)] for row in reader if row]
+        self.insert_many(rows)
+        print(f"Imported {len(rows)} records from {csv_path}")
+        return len(rows)
+
+    def export_csv(self, path=CSV_EXPORT_PATH):
+        with _replace_atomically(path) as tmp_path:
+            with open(tmp_path, mode='w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(HEADERS)
+                writer.writerows(self.iter_rows())
+        return path
+
+    def export_xlsx(self, path=EXCEL_EXPORT_PATH):
+        from openpyxl import Workbook
+
+        # write_only streams rows to disk instead of building the sheet in memory.
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(HEADERS)
+        for row in self.iter_rows():
+            ws.append(row)
+        with _replace_atomically(path) as tmp_path:
+            wb.save(tmp_path)
+        return path
+
+
+@contextmanager
+def _replace_atomically(path):
+    """Yields a temp path next to path, renamed over it once written."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ExportScheduler:
+    """
+    Rewrites the Excel and CSV exports in a background thread once no new
+    record has arrived for `interval` seconds (or at most every 4 intervals
+    under constant load), so the files stay close to current without any
+    work on the submit path.
+    """
+
+    def __init__(self, store, interval=EXPORT_INTERVAL_SECONDS,
+                 excel_path=EXCEL_EXPORT_PATH, csv_path=CSV_EXPORT_PATH):
+        self.store = store
+        self.interval = interval
+        self.excel_path = excel_path
+        self.csv_path = csv_path
+        self._dirty = threading.Event()
+        self._lock = threading.Lock()
+        self._last_change = 0.0
+        self._first_change = None
+        self.last_export = None
+        self.last_export_seconds = None
+        self.last_error = None
+        if interval > 0:
+            threading.Thread(target=self._loop, name="record-export", daemon=True).start()
+
+    def mark_dirty(self):
+        with self._lock:
+            now = time.monotonic()
+            self._last_change = now
+            if self._first_change is None:
+                self._first_change = now
+        self._dirty.set()
+
+    def _loop(self):
+        while True:
+            self._dirty.wait()
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    quiet = now - self._last_change >= self.interval
+                    overdue = now - self._first_change >= 4 * self.interval
+                    if quiet or overdue:
+                        self._dirty.clear()
+                        self._first_change = None
+                        break
+                time.sleep(min(self.interval, 1.0))
+            try:
+                self.export()
+            except Exception:
+                pass  # logged and kept in stats; retried on the next submit
+
+    def export(self):
+        """Writes both export files now; returns their paths."""
+        start = time.perf_counter()
+        try:
+            with stage("export"):
+                paths = [self.store.export_xlsx(self.excel_path), self.store.export_csv(self.csv_path)]
+        except Exception as e:
+            print(f"Record export failed: {e}")
+            self.last_error = str(e)
+            raise
+        self.last_export = time.time()
+        self.last_export_seconds = round(time.perf_counter() - start, 4)
+        self.last_error = None
+        return paths
+
+    def stats(self):
+        return {
+            "interval_seconds": self.interval,
+            "pending": self._dirty.is_set(),
+            "last_export": self.last_export,
+            "last_export_seconds": self.last_export_seconds,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,176 @@
+"""
+Silence-Aware Segmentation
+
+Splits decoded audio into speech segments using frame energy instead of
+fixed-length chunks. Long silences are dropped, cuts fall in pauses rather
+than mid-word, and short utterances are packed together (up to a maximum
+segment length) so fewer, shorter requests are billed.
+
+Selected with SEGMENTATION=vad (default "fixed", the old 15-second chunks).
+"""
+import os
+import wave
+from io import BytesIO
+
+import numpy as np
+
+from audio_pipeline import AudioChunk
+
+SEGMENTATION = os.environ.get("SEGMENTATION", "fixed").lower()
+
+VAD_FRAME_MS = 30
+# A frame is speech when it is VAD_MARGIN_DB above the noise floor (10th
+# percentile of frame energy), but never below VAD_ABS_FLOOR_DB.
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", 12))
+VAD_ABS_FLOOR_DB = float(os.environ.get("VAD_ABS_FLOOR_DB", -55))
+VAD_MIN_SILENCE_MS = int(os.environ.get("VAD_MIN_SILENCE_MS", 600))
+VAD_MIN_SPEECH_MS = 250
+VAD_PADDING_MS = 200
+# Long speech runs are cut at the quietest frame in this final part of the window.
+VAD_SPLIT_SEARCH_MS = 3000
+FRAME_BLOCK = 8192
+
+
+def frame_energy_db(audio, frame_ms=VAD_FRAME_MS):
+    """
+    RMS energy per frame in dBFS. Frames are processed in blocks so memory
+    stays bounded on hour-long recordings.
+    """
+    samples = np.frombuffer(audio.pcm, dtype="<i2")
+    if audio.channels > 1:
+        samples = samples[: len(samples) // audio.channels * audio.channels].reshape(-1, audio.channels)
+    frame_len = max(1, int(audio.sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    db = np.empty(n_frames, dtype=np.float32)
+    for start in range(0, n_frames, FRAME_BLOCK):
+        end = min(start + FRAME_BLOCK, n_frames)
+        block = samples[start * frame_len:end * frame_len].astype(np.float32)
+        if audio.channels > 1:
+            block = block.mean(axis=1)
+        block = block.reshape(end - start, frame_len)
+        rms = np.sqrt(np.mean(block * block, axis=1))
+        db[start:end] = 20 * np.log10(rms / 32768.0 + 1e-10)
+    return db
+
+
+def _runs(mask):
+    """(start, end) frame index pairs of the True runs in a boolean array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def speech_regions(audio, max_region_ms=15000, frame_ms=VAD_FRAME_MS):
+    """
+    Returns [(start_ms, end_ms)] of speech, padded, with pauses shorter than
+    VAD_MIN_SILENCE_MS bridged and no region longer than max_region_ms.
+    """
+    db = frame_energy_db(audio, frame_ms)
+    if len(db) == 0:
+        return []
+    floor = np.percentile(db, 10)
+    threshold = max(VAD_ABS_FLOOR_DB, min(floor + VAD_MARGIN_DB, np.percentile(db, 95) - 6))
+    voiced = db > threshold
+
+    min_silence = VAD_MIN_SILENCE_MS // frame_ms
+    min_speech = VAD_MIN_SPEECH_MS // frame_ms
+    runs = []
+    for start, end in _runs(voiced):
+        if runs and start - runs[-1][1] < min_silence:
+            runs[-1] = (runs[-1][0], end)
+        else:
+            runs.append((start, end))
+    runs = [(s, e) for s, e in runs if e - s >= min_speech]
+
+    total_ms = audio.duration_ms
+    regions = []
+    for s, e in runs:
+        start_ms = max(0, s * frame_ms - VAD_PADDING_MS)
+        end_ms = min(total_ms, e * frame_ms + VAD_PADDING_MS)
+        if regions and start_ms <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end_ms)
+        else:
+            regions.append((start_ms, end_ms))
+    return _split_long(regions, db, frame_ms, max_region_ms)
+
+
+def _split_long(regions, db, frame_ms, max_ms):
+    out = []
+    for start, end in regions:
+        while end - start > max_ms:
+            lo = int((start + max_ms - VAD_SPLIT_SEARCH_MS) / frame_ms)
+            hi = int((start + max_ms) / frame_ms)
+            lo = max(lo, int(start / frame_ms) + 1)
+            cut = (lo + int(np.argmin(db[lo:hi]))) * frame_ms if hi > lo else start + max_ms
+            out.append((start, cut))
+            start = cut
+        out.append((start, end))
+    return out
+
+
+class SpeechSegment(AudioChunk):
+    """
+    One or more speech spans of a DecodedAudio sent as a single request.
+    Silence between the spans is left out of the uploaded audio.
+    """
+
+    def __init__(self, audio, spans):
+        super().__init__(audio, spans[0][0], spans[-1][1])
+        self.spans = spans
+
+    @property
+    def pcm(self):
+        if len(self.spans) == 1:
+            return self.audio.view(*self.spans[0])
+        return b"".join(self.audio.view(s, e) for s, e in self.spans)
+
+    @property
+    def duration_s(self):
+        return sum(e - s for s, e in self.spans) / 1000
+
+    def wav(self):
+        out = BytesIO()
+        with wave.open(out, "wb") as dst:
+            dst.setnchannels(self.audio.channels)
+            dst.setsampwidth(2)
+            dst.setframerate(self.audio.sample_rate)
+            for s, e in self.spans:
+                dst.writeframes(self.audio.view(s, e))
+        out.seek(0)
+        return out
+
+
+def pack_regions(audio, regions, max_segment_ms=15000):
+    """
+    Packs consecutive speech regions into SpeechSegments of at most
+    max_segment_ms of audio each.
+    """
+    segments, spans, length = [], [], 0
+    for start, end in regions:
+        if spans and length + (end - start) > max_segment_ms:
+            segments.append(SpeechSegment(audio, spans))
+            spans, length = [], 0
+        spans.append((start, end))
+        length += end - start
+    if spans:
+        segments.append(SpeechSegment(audio, spans))
+    return segments
+
+
+def vad_segments(audio, max_segment_ms=15000):
+    """
+    Speech segments of at most max_segment_ms of audio each.
+    """
+    return pack_regions(audio, speech_regions(audio, max_segment_ms), max_segment_ms)
+
+
+def segment_audio(audio, chunk_ms, mode=None):
+    """
+    Chunks for transcription: fixed-length (make_chunks style) or VAD.
+    """
+    mode = (mode or SEGMENTATION).lower()
+    if mode == "vad":
+        return vad_segments(audio, max_segment_ms=chunk_ms)
+    if mode == "fixed":
+        return audio.chunks(chunk_ms)
+    raise ValueError(f"Unknown segmentation mode: {mode}")
@@ -0,0 +1,437 @@
+// Browser-side capture: the recording leaves the browser as 16 kHz mono in a
+// codec the server passes straight to Whisper, so uploads are small and the
+// server does not transcode them.
+//
+// - 'opus': the microphone runs through a 16 kHz mono WebAudio graph into
+//   MediaRecorder (webm or ogg, 24 kbit/s).
+// - 'flac': an AudioWorklet hands raw samples to a small FLAC encoder (fixed
+//   predictors, Rice-coded residuals). Used when asked for, or when the
+//   browser cannot record opus.
+// - 'native': plain MediaRecorder, for browsers without AudioWorklet.
+
+const CAPTURE_SAMPLE_RATE = 16000;
+const OPUS_BITRATE = 24000;
+const FLAC_BLOCK_SIZE = 4096;
+const OPUS_MIME_TYPES = ['audio/webm;codecs=opus', 'audio/ogg;codecs=opus'];
+const CAPTURE_WORKLET_URL = '/static/js/capture-worklet.js';
+
+// --- FLAC encoder ---
+
+const CRC8_TABLE = new Uint8Array(256);
+const CRC16_TABLE = new Uint16Array(256);
+for (let i = 0; i < 256; i++) {
+  let c8 = i;
+  let c16 = i << 8;
+  for (let b = 0; b < 8; b++) {
+    c8 = (c8 & 0x80) ? ((c8 << 1) ^ 0x07) & 0xFF : (c8 << 1) & 0xFF;
+    c16 = (c16 & 0x8000) ? ((c16 << 1) ^ 0x8005) & 0xFFFF : (c16 << 1) & 0xFFFF;
+  }
+  CRC8_TABLE[i] = c8;
+  CRC16_TABLE[i] = c16;
+}
+
+function crc8(bytes, length) {
+  let crc = 0;
+  for (let i = 0; i < length; i++) crc = CRC8_TABLE[crc ^ bytes[i]];
+  return crc;
+}
+
+function crc16(bytes, length) {
+  let crc = 0;
+  for (let i = 0; i < length; i++) crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ bytes[i]];
+  return crc;
+}
+
+class BitWriter {
+  constructor(capacity) {
+    this.bytes = new Uint8Array(capacity);
+    this.pos = 0;
+    this.acc = 0;
+    this.nbits = 0;
+  }
+
+  // Writes the low `bits` bits of value (bits <= 32), most significant first.
+  write(value, bits) {
+    while (bits > 0) {
+      const take = Math.min(bits, 8 - this.nbits);
+      const chunk = (value >>> (bits - take)) & ((1 << take) - 1);
+      this.acc = (this.acc << take) | chunk;
+      this.nbits += take;
+      bits -= take;
+      if (this.nbits === 8) {
+        if (this.pos === this.bytes.length) {
+          const grown = new Uint8Array(this.bytes.length * 2);
+          grown.set(this.bytes);
+          this.bytes = grown;
+        }
+        this.bytes[this.pos++] = this.acc;
+        this.acc = 0;
+        this.nbits = 0;
+      }
+    }
+  }
+
+  unary(zeros) {
+    while (zeros > 24) {
+      this.write(0, 24);
+      zeros -= 24;
+    }
+    this.write(1, zeros + 1);
+  }
+
+  align() {
+    if (this.nbits) this.write(0, 8 - this.nbits);
+  }
+
+  result() {
+    return this.bytes.slice(0, this.pos);
+  }
+}
+
+// Frame numbers are coded like UTF-8.
+function writeFrameNumber(w, n) {
+  if (n < 0x80) {
+    w.write(n, 8);
+    return;
+  }
+  let extra = 1;
+  while (n >= 2 ** (6 * extra + 6 - extra) && extra < 5) extra++;
+  w.write(((0xFF00 >> (extra + 1)) & 0xFF) | (n >>> (6 * extra)), 8);
+  for (let i = extra - 1; i >= 0; i--) w.write(0x80 | ((n >>> (6 * i)) & 0x3F), 8);
+}
+
+function fixedResiduals(x, order, out) {
+  const n = x.length;
+  for (let i = order; i < n; i++) {
+    let r;
+    switch (order) {
+      case 0: r = x[i]; break;
+      case 1: r = x[i] - x[i - 1]; break;
+      case 2: r = x[i] - 2 * x[i - 1] + x[i - 2]; break;
+      case 3: r = x[i] - 3 * x[i - 1] + 3 * x[i - 2] - x[i - 3]; break;
+      default: r = x[i] - 4 * x[i - 1] + 6 * x[i - 2] - 4 * x[i - 3] + x[i - 4];
+    }
+    out[i - order] = r >= 0 ? 2 * r : -2 * r - 1;  // zigzag
+  }
+  return n - order;
+}
+
+class FlacEncoder {
+  constructor(sampleRate = CAPTURE_SAMPLE_RATE, blockSize = FLAC_BLOCK_SIZE) {
+    this.sampleRate = sampleRate;
+    this.blockSize = blockSize;
+    this.pending = new Int16Array(blockSize);
+    this.filled = 0;
+    this.frameNumber = 0;
+    this.headerWritten = false;
+    this.residuals = [0, 1, 2, 3, 4].map(() => new Uint32Array(blockSize));
+  }
+
+  // "fLaC" and a STREAMINFO block; total samples and MD5 are left unknown
+  // (0) so the stream can be written as it is recorded.
+  header() {
+    const w = new BitWriter(42);
+    w.write(0x664C6143, 32);
+    w.write(1, 1);  // last metadata block
+    w.write(0, 7);  // STREAMINFO
+    w.write(34, 24);
+    w.write(this.blockSize, 16);
+    w.write(this.blockSize, 16);
+    w.write(0, 24);
+    w.write(0, 24);
+    w.write(this.sampleRate, 20);
+    w.write(0, 3);   // channels - 1
+    w.write(15, 5);  // bits per sample - 1
+    w.write(0, 4);
+    w.write(0, 32);  // total samples
+    for (let i = 0; i < 4; i++) w.write(0, 32);  // MD5
+    return w.result();
+  }
+
+  frame(x) {
+    const w = new BitWriter(x.length * 2 + 32);
+    w.write(0x3FFE, 14);
+    w.write(0, 2);  // reserved, fixed block size
+    w.write(0b0111, 4);  // block size - 1 follows as 16 bits
+    w.write(this.sampleRate === 16000 ? 0b0101 : 0, 4);
+    w.write(0, 4);  // mono
+    w.write(0b100, 3);  // 16 bits per sample
+    w.write(0, 1);
+    writeFrameNumber(w, this.frameNumber++);
+    w.write(x.length - 1, 16);
+    w.write(crc8(w.bytes, w.pos), 8);
+
+    // The fixed predictor order (0-4) with the smallest residuals.
+    let best = 0;
+    let bestSum = Infinity;
+    for (let order = 0; order <= Math.min(4, x.length); order++) {
+      const count = fixedResiduals(x, order, this.residuals[order]);
+      let sum = 0;
+      for (let i = 0; i < count; i++) sum += this.residuals[order][i];
+      if (sum < bestSum) {
+        best = order;
+        bestSum = sum;
+      }
+    }
+    const residual = this.residuals[best];
+    const count = x.length - best;
+
+    // Rice parameter with the fewest bits for the whole block.
+    let k = 0;
+    let bestBits = Infinity;
+    for (let p = 0; p <= 14; p++) {
+      let bits = count * (p + 1);
+      for (let i = 0; i < count && bits < bestBits; i++) bits += residual[i] >>> p;
+      if (bits < bestBits) {
+        k = p;
+        bestBits = bits;
+      }
+    }
+
+    w.write(0, 1);
+    w.write(0b001000 | best, 6);  // SUBFRAME_FIXED
+    w.write(0, 1);
+    for (let i = 0; i < best; i++) w.write(x[i] & 0xFFFF, 16);
+    w.write(0, 2);  // Rice coding, 4-bit parameters
+    w.write(0, 4);  // one partition
+    w.write(k, 4);
+    const mask = (1 << k) - 1;
+    for (let i = 0; i < count; i++) {
+      const u = residual[i];
+      w.unary(u >>> k);
+      if (k) w.write(u & mask, k);
+    }
+    w.align();
+    w.write(crc16(w.bytes, w.pos), 16);
+    return w.result();
+  }
+
+  // Encodes Int16 samples; returns the bytes of every completed frame.
+  encode(samples) {
+    const parts = [];
+    if (!this.headerWritten) {
+      parts.push(this.header());
+      this.headerWritten = true;
+    }
+    let offset = 0;
+    while (offset < samples.length) {
+      const n = Math.min(samples.length - offset, this.blockSize - this.filled);
+      this.pending.set(samples.subarray(offset, offset + n), this.filled);
+      this.filled += n;
+      offset += n;
+      if (this.filled === this.blockSize) {
+        parts.push(this.frame(this.pending));
+        this.filled = 0;
+      }
+    }
+    return parts;
+  }
+
+  // The last, shorter frame.
+  flush() {
+    const parts = this.encode(new Int16Array(0));
+    if (this.filled) {
+      parts.push(this.frame(this.pending.slice(0, this.filled)));
+      this.filled = 0;
+    }
+    return parts;
+  }
+}
+
+// Box-filter downsampler for browsers that cannot run the WebAudio graph at
+// 16 kHz; averaging over each output period is enough anti-aliasing for speech.
+class Downsampler {
+  constructor(inputRate, outputRate = CAPTURE_SAMPLE_RATE) {
+    this.ratio = inputRate / outputRate;
+    this.tail = new Float32Array(0);
+    this.pos = 0;
+  }
+
+  process(input) {
+    if (this.ratio === 1) return input;
+    const data = new Float32Array(this.tail.length + input.length);
+    data.set(this.tail);
+    data.set(input, this.tail.length);
+    const half = this.ratio / 2;
+    const out = new Float32Array(Math.ceil(data.length / this.ratio) + 1);
+    let n = 0;
+    let pos = this.pos;
+    while (pos + half < data.length) {
+      const start = Math.max(0, Math.ceil(pos - half));
+      const end = Math.min(data.length, Math.ceil(pos + half));
+      let sum = 0;
+      for (let i = start; i < end; i++) sum += data[i];
+      out[n++] = sum / Math.max(1, end - start);
+      pos += this.ratio;
+    }
+    const keep = Math.max(0, Math.floor(pos - half));
+    this.tail = data.slice(keep);
+    this.pos = pos - keep;
+    return out.subarray(0, n);
+  }
+}
+
+function floatToInt16(samples) {
+  const out = new Int16Array(samples.length);
+  for (let i = 0; i < samples.length; i++) {
+    const s = Math.max(-1, Math.min(1, samples[i]));
+    out[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
+  }
+  return out;
+}
+
+// --- Capture ---
+
+class AudioCapture {
+  // ondata(blob) receives the encoded recording in pieces (every timesliceMs
+  // when given, otherwise once at the end); pieces concatenate into one file.
+  constructor({ codec = 'opus', timesliceMs = null, ondata = () => {} } = {}) {
+    this.requestedCodec = codec;
+    this.timesliceMs = timesliceMs;
+    this.ondata = ondata;
+    this.stats = { codec: null, mimeType: null, sampleRate: null, bytes: 0, audioSeconds: 0, encodeMs: 0 };
+  }
+
+  static opusMimeType() {
+    if (typeof MediaRecorder === 'undefined' || !MediaRecorder.isTypeSupported) return null;
+    return OPUS_MIME_TYPES.find(type => MediaRecorder.isTypeSupported(type)) || null;
+  }
+
+  static extension(mimeType) {
+    if (mimeType.startsWith('audio/flac')) return 'flac';
+    if (mimeType.startsWith('audio/ogg')) return 'ogg';
+    if (mimeType.startsWith('audio/mp4')) return 'm4a';
+    return 'webm';
+  }
+
+  get mimeType() {
+    return this.stats.mimeType;
+  }
+
+  emit(blob) {
+    if (!blob || !blob.size) return;
+    this.stats.bytes += blob.size;
+    this.ondata(blob);
+  }
+
+  // A 16 kHz context when the browser can feed the microphone into one
+  // (Firefox cannot mix sample rates), otherwise a native-rate context.
+  connect(stream) {
+    const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+    try {
+      const context = new AudioContextClass({ sampleRate: CAPTURE_SAMPLE_RATE });
+      try {
+        return { context, source: context.createMediaStreamSource(stream) };
+      } catch (err) {
+        context.close();
+      }
+    } catch (err) {
+      // sampleRate option not supported
+    }
+    const context = new AudioContextClass();
+    return { context, source: context.createMediaStreamSource(stream) };
+  }
+
+  async start(stream) {
+    this.stream = stream;
+    this.startedAt = performance.now();
+    const opusMime = AudioCapture.opusMimeType();
+    const hasWorklet = typeof AudioWorkletNode !== 'undefined';
+    let codec = this.requestedCodec;
+    if (codec === 'opus' && !opusMime) codec = 'flac';
+    if (codec === 'flac' && !hasWorklet) codec = opusMime ? 'opus' : 'native';
+    this.stats.codec = codec;
+
+    if (codec === 'native') return this.startRecorder(stream, {});
+
+    ({ context: this.context, source: this.source } = this.connect(stream));
+    this.stats.sampleRate = CAPTURE_SAMPLE_RATE;
+    if (codec === 'opus') {
+      const destination = this.context.createMediaStreamDestination();
+      destination.channelCount = 1;
+      destination.channelCountMode = 'explicit';
+      this.source.connect(destination);
+      return this.startRecorder(destination.stream, { mimeType: opusMime, audioBitsPerSecond: OPUS_BITRATE });
+    }
+    return this.startFlac();
+  }
+
+  startRecorder(stream, options) {
+    this.recorder = new MediaRecorder(stream, options);
+    this.stats.mimeType = this.recorder.mimeType || options.mimeType || 'audio/webm';
+    this.recorder.ondataavailable = e => this.emit(e.data);
+    this.stopped = new Promise(resolve => { this.recorder.onstop = resolve; });
+    if (this.timesliceMs) this.recorder.start(this.timesliceMs);
+    else this.recorder.start();
+  }
+
+  async startFlac() {
+    this.stats.mimeType = 'audio/flac';
+    this.encoder = new FlacEncoder(CAPTURE_SAMPLE_RATE);
+    this.downsampler = new Downsampler(this.context.sampleRate);
+    this.parts = [];
+    this.samples = 0;
+    await this.context.audioWorklet.addModule(CAPTURE_WORKLET_URL);
+    this.node = new AudioWorkletNode(this.context, 'capture-processor', {
+      channelCount: 1,
+      channelCountMode: 'explicit',
+    });
+    this.node.port.onmessage = event => {
+      if (event.data === 'flushed') return;
+      const t0 = performance.now();
+      const samples = floatToInt16(this.downsampler.process(event.data));
+      this.samples += samples.length;
+      this.parts.push(...this.encoder.encode(samples));
+      this.stats.encodeMs += performance.now() - t0;
+    };
+    // The worklet only runs while connected; a muted gain keeps the
+    // microphone out of the speakers.
+    this.mute = this.context.createGain();
+    this.mute.gain.value = 0;
+    this.source.connect(this.node);
+    this.node.connect(this.mute);
+    this.mute.connect(this.context.destination);
+    if (this.timesliceMs) this.timer = setInterval(() => this.emitParts(), this.timesliceMs);
+  }
+
+  emitParts() {
+    if (this.parts.length) {
+      this.emit(new Blob(this.parts, { type: 'audio/flac' }));
+      this.parts = [];
+    }
+  }
+
+  // Resolves once the last piece has been handed to ondata.
+  async stop() {
+    if (this.recorder) {
+      if (this.recorder.state !== 'inactive') this.recorder.stop();
+      await this.stopped;
+      this.stats.audioSeconds = (performance.now() - this.startedAt) / 1000;
+    } else if (this.node) {
+      clearInterval(this.timer);
+      const flushed = new Promise(resolve => {
+        const handler = this.node.port.onmessage;
+        this.node.port.onmessage = event => {
+          handler(event);
+          if (event.data === 'flushed') resolve();
+        };
+      });
+      this.node.port.postMessage('flush');
+      await flushed;
+      const t0 = performance.now();
+      this.parts.push(...this.encoder.flush());
+      this.stats.encodeMs += performance.now() - t0;
+      this.stats.audioSeconds = this.samples / CAPTURE_SAMPLE_RATE;
+      this.emitParts();
+      this.source.disconnect();
+      this.node.disconnect();
+    }
+    if (this.context) this.context.close();
+    this.stream.getTracks().forEach(track => track.stop());
+    return this.stats;
+  }
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = { FlacEncoder, Downsampler, floatToInt16, AudioCapture };
+}
@@ -0,0 +1,43 @@
+// AudioWorklet processor for the FLAC capture path: copies the (mono) input
+// to the main thread in batches, so messages stay infrequent. A 'flush'
+// message sends the partial batch and answers 'flushed'.
+const BATCH_FRAMES = 2048;
+
+class CaptureProcessor extends AudioWorkletProcessor {
+  constructor() {
+    super();
+    this.batch = new Float32Array(BATCH_FRAMES);
+    this.filled = 0;
+    this.port.onmessage = event => {
+      if (event.data === 'flush') {
+        this.send();
+        this.port.postMessage('flushed');
+      }
+    };
+  }
+
+  send() {
+    if (this.filled > 0) {
+      const samples = this.batch.slice(0, this.filled);
+      this.port.postMessage(samples, [samples.buffer]);
+      this.filled = 0;
+    }
+  }
+
+  process(inputs) {
+    const channel = inputs[0] && inputs[0][0];
+    if (channel) {
+      let offset = 0;
+      while (offset < channel.length) {
+        const n = Math.min(channel.length - offset, BATCH_FRAMES - this.filled);
+        this.batch.set(channel.subarray(offset, offset + n), this.filled);
+        this.filled += n;
+        offset += n;
+        if (this.filled === BATCH_FRAMES) this.send();
+      }
+    }
+    return true;
+  }
+}
+
+registerProcessor('capture-processor', CaptureProcessor);
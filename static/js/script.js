@@ -1,6 +1,33 @@
-let mediaRecorder;
+let capture = null;
 let audioChunks = [];
 let activeFieldId = null;
+// Whole-form mode: one recording of the entire consultation is transcribed
+// once and a single LLM call fills every field (/transcribe/form).
+let wholeForm = false;
+
+// Recordings are encoded in the browser as 16 kHz mono, 'opus' or 'flac'
+// (see audio-capture.js), which the server forwards to Whisper unchanged.
+const CAPTURE_CODEC = 'opus';
+// One timing report per recording (size, encoding time, time from Stop to
+// text, server stages); logged to the console and sent to /metrics/client.
+const captureReports = [];
+
+// Streaming mode: recorder chunks are uploaded while recording and the field
+// is filled with partial text as segments are transcribed.
+const USE_STREAMING = true;
+const STREAM_TIMESLICE_MS = 2000;
+let streamSession = null;
+let streamSeq = 0;
+let streamQueue = Promise.resolve();
+
+// Streamed correction: the raw transcript appears as soon as it is ready
+// and the LLM's corrected text replaces it token by token (server-sent events).
+const STREAM_CORRECTION = true;
+
+// Job mode (used when streaming is off): the upload returns a job id right
+// away and the result is polled until the server-side worker finishes.
+const USE_JOB_QUEUE = false;
+const JOB_POLL_MS = 750;
 
 // List of voice-input field IDs
 const VOICE_FIELDS = ['age', 'symptoms', 'diagnosis', 'prescription', 'place'];
@@ -16,40 +43,87 @@ document.addEventListener('focusin', (event) => {
 
 function startRecording(event) {
   event.preventDefault();
-  activeFieldId = lastFocusedFieldId;
-  if (!VOICE_FIELDS.includes(activeFieldId)) {
+  wholeForm = event.currentTarget.id === 'formBtn';
+  activeFieldId = wholeForm ? null : lastFocusedFieldId;
+  if (!wholeForm && !VOICE_FIELDS.includes(activeFieldId)) {
     alert("Please focus a voice-input field (Age, Symptoms, Diagnosis, Prescription, or Place) before recording.");
     return;
   }
-  document.getElementById(activeFieldId).focus();
+  if (activeFieldId) document.getElementById(activeFieldId).focus();
   audioChunks = [];
-  navigator.mediaDevices.getUserMedia({ audio: true })
+  const fieldId = activeFieldId;
+  const streaming = USE_STREAMING && !wholeForm;
+  navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1 } })
     .then(stream => {
-      mediaRecorder = new MediaRecorder(stream);
-      mediaRecorder.start();
+      if (streaming) startStreamSession(fieldId);
+      capture = new AudioCapture({
+        codec: CAPTURE_CODEC,
+        timesliceMs: streaming ? STREAM_TIMESLICE_MS : null,
+        ondata: blob => {
+          if (streaming) sendStreamChunk(blob, fieldId, false);
+          else audioChunks.push(blob);
+        },
+      });
+      return capture.start(stream);
+    })
+    .then(() => {
       document.getElementById('stopBtn').disabled = false;
       document.getElementById('startBtn').disabled = true;
-      document.getElementById('status').textContent = "Recording...";
-      mediaRecorder.ondataavailable = e => audioChunks.push(e.data);
-      mediaRecorder.onstop = () => {
-        const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
-        uploadAudio(audioBlob, activeFieldId);
-        document.getElementById('startBtn').disabled = false;
-      };
+      document.getElementById('formBtn').disabled = true;
+      document.getElementById('status').textContent = wholeForm
+        ? "Recording the whole form... say each field's name before its value."
+        : "Recording...";
     })
     .catch(err => alert("Microphone error: " + err));
 }
 
 function stopRecording(event) {
   event.preventDefault();
-  if (mediaRecorder && mediaRecorder.state === 'recording') {
-    mediaRecorder.stop();
-    document.getElementById('stopBtn').disabled = true;
-    document.getElementById('status').textContent = 'Stopped recording. Processing...';
+  if (!capture) return;
+  const current = capture;
+  const fieldId = activeFieldId;
+  const stoppedAt = performance.now();
+  capture = null;
+  document.getElementById('stopBtn').disabled = true;
+  document.getElementById('status').textContent = 'Stopped recording. Processing...';
+  current.stop().then(stats => {
+    const onDone = (timing, data) => reportCapture(stats, stoppedAt, timing, data);
+    if (wholeForm) {
+      uploadForm(new Blob(audioChunks, { type: current.mimeType }), onDone);
+    } else if (USE_STREAMING) {
+      sendStreamChunk(null, fieldId, true, onDone);
+    } else {
+      uploadAudio(new Blob(audioChunks, { type: current.mimeType }), fieldId, onDone);
+    }
+    document.getElementById('startBtn').disabled = false;
+    document.getElementById('formBtn').disabled = false;
+  });
+}
+
+// Opus is encoded natively by the browser, so encode_ms is only measured for
+// FLAC. Call window.captureReport() in the console for the table so far.
+function reportCapture(stats, stoppedAt, serverTiming, data) {
+  const report = {
+    codec: stats.codec,
+    mime_type: stats.mimeType,
+    bytes: stats.bytes,
+    audio_seconds: Math.round(stats.audioSeconds * 100) / 100,
+    kbps: stats.audioSeconds ? Math.round(stats.bytes * 8 / stats.audioSeconds / 100) / 10 : null,
+    encode_ms: Math.round(stats.encodeMs),
+    stop_to_text_ms: Math.round(performance.now() - stoppedAt),
+    correction_ttft_ms: data && data.ttft_ms != null ? data.ttft_ms : null,
+    server_timing: serverTiming || '',
+  };
+  captureReports.push(report);
+  console.table([report]);
+  if (navigator.sendBeacon) {
+    navigator.sendBeacon('/metrics/client', new Blob([JSON.stringify(report)], { type: 'application/json' }));
   }
 }
 
-function uploadAudio(blob, fieldId) {
+window.captureReport = () => console.table(captureReports);
+
+function uploadAudio(blob, fieldId, onDone) {
   const loading = document.getElementById('loading');
   const status = document.getElementById('status');
 
@@ -57,10 +131,20 @@ function uploadAudio(blob, fieldId) {
   status.textContent = 'Processing audio...';
 
   const formData = new FormData();
-  formData.append('audio', blob, 'recording.wav');
+  formData.append('audio', blob, 'recording.' + AudioCapture.extension(blob.type));
   formData.append('field', fieldId);
-  fetch('/transcribe', { method: 'POST', body: formData })
-    .then(response => response.json())
+  let serverTiming = null;
+  const readResponse = response => {
+    serverTiming = response.headers.get('Server-Timing');
+    return readCorrection(response, document.getElementById(fieldId));
+  };
+  const request = USE_JOB_QUEUE
+    ? fetch('/transcribe/jobs', { method: 'POST', body: formData })
+        .then(readResponse)
+        .then(job => job.error ? job : pollJob(job.status_url))
+    : fetch('/transcribe', { method: 'POST', body: formData, headers: correctionHeaders() })
+        .then(readResponse);
+  request
     .then(data => {
       if (loading) loading.classList.add('hidden');
       if (data.error) {
@@ -73,6 +157,7 @@ function uploadAudio(blob, fieldId) {
         field.value = data.paraphrased_text;
       }
       status.textContent = 'Voice input recorded and transcribed.';
+      if (onDone) onDone(serverTiming, data);
     })
     .catch(() => {
       if (loading) loading.classList.add('hidden');
@@ -80,6 +165,160 @@ function uploadAudio(blob, fieldId) {
     });
 }
 
+function correctionHeaders() {
+  return STREAM_CORRECTION ? { Accept: 'text/event-stream' } : {};
+}
+
+// Resolves with the response's JSON or, for a streamed correction, with the
+// "done" event after writing the raw transcript and then each corrected
+// token into field as they arrive.
+function readCorrection(response, field) {
+  if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+    return response.json();
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let corrected = '';
+  let result = null;
+  const handle = block => {
+    let event = 'message';
+    let data = '';
+    block.split('\n').forEach(line => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) data += line.slice(5).trim();
+    });
+    if (!data) return;
+    const payload = JSON.parse(data);
+    if (event === 'transcript' && field) {
+      field.value = payload.raw_transcription;
+    } else if (event === 'token') {
+      corrected += payload.text;
+      if (field) field.value = corrected;
+    } else if (event === 'done') {
+      result = payload;
+    }
+  };
+  const pump = () => reader.read().then(({ value, done }) => {
+    if (value) buffer += decoder.decode(value, { stream: true });
+    let end;
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      handle(buffer.slice(0, end));
+      buffer = buffer.slice(end + 2);
+    }
+    if (done) return result || { error: 'The correction stream ended early' };
+    return pump();
+  });
+  return pump();
+}
+
+// Fills every field the server could extract; fields it could not are left
+// as they were and named in the status line.
+function uploadForm(blob, onDone) {
+  const loading = document.getElementById('loading');
+  const status = document.getElementById('status');
+
+  if (loading) loading.classList.remove('hidden');
+  status.textContent = 'Processing the whole-form recording...';
+
+  const formData = new FormData();
+  formData.append('audio', blob, 'recording.' + AudioCapture.extension(blob.type));
+  let serverTiming = null;
+  fetch('/transcribe/form', { method: 'POST', body: formData })
+    .then(response => {
+      serverTiming = response.headers.get('Server-Timing');
+      return response.json();
+    })
+    .then(data => {
+      if (loading) loading.classList.add('hidden');
+      if (data.error) {
+        alert('Error from server: ' + data.error);
+        status.textContent = 'Error during transcription.';
+        return;
+      }
+      const missing = [];
+      Object.entries(data.fields).forEach(([id, value]) => {
+        const field = document.getElementById(id);
+        if (field && value) field.value = value;
+        else missing.push(id);
+      });
+      status.textContent = missing.length
+        ? 'Form filled; please complete: ' + missing.join(', ') + '.'
+        : 'Form filled from the recording. Please review before submitting.';
+      if (onDone) onDone(serverTiming);
+    })
+    .catch(() => {
+      if (loading) loading.classList.add('hidden');
+      status.textContent = 'Failed to upload or transcribe audio.';
+    });
+}
+
+function startStreamSession(fieldId) {
+  streamSession = (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  streamSeq = 0;
+  streamQueue = Promise.resolve();
+  const field = document.getElementById(fieldId);
+  if (field) field.value = '';
+}
+
+// Chunks are sent one at a time, in order, so the server can append them to
+// the session's byte stream. onDone gets the final response's Server-Timing.
+function sendStreamChunk(blob, fieldId, isFinal, onDone) {
+  const session = streamSession;
+  const seq = streamSeq++;
+  const loading = document.getElementById('loading');
+  const status = document.getElementById('status');
+
+  streamQueue = streamQueue.then(() => {
+    const formData = new FormData();
+    formData.append('session', session);
+    formData.append('seq', seq);
+    formData.append('field', fieldId);
+    if (isFinal) {
+      formData.append('final', '1');
+      if (loading) loading.classList.remove('hidden');
+      status.textContent = 'Finishing transcription...';
+    }
+    if (blob) formData.append('audio', blob, 'chunk.' + AudioCapture.extension(blob.type));
+
+    let serverTiming = null;
+    const headers = isFinal ? correctionHeaders() : {};
+    return fetch('/transcribe/stream', { method: 'POST', body: formData, headers })
+      .then(response => {
+        serverTiming = response.headers.get('Server-Timing');
+        return readCorrection(response, document.getElementById(fieldId));
+      })
+      .then(data => {
+        if (data.error) throw new Error(data.error);
+        const field = document.getElementById(fieldId);
+        if (isFinal) {
+          if (loading) loading.classList.add('hidden');
+          if (field) field.value = data.paraphrased_text;
+          status.textContent = 'Voice input recorded and transcribed.';
+          if (onDone) onDone(serverTiming, data);
+        } else if (field && data.segment_text) {
+          field.value = data.partial_text;
+        }
+      });
+  }).catch(err => {
+    if (loading) loading.classList.add('hidden');
+    status.textContent = 'Streaming transcription failed: ' + err.message;
+  });
+}
+
+function pollJob(statusUrl) {
+  return new Promise(resolve => setTimeout(resolve, JOB_POLL_MS))
+    .then(() => fetch(statusUrl))
+    .then(response => response.json())
+    .then(job => {
+      if (job.status === 'done') return job.result;
+      if (job.status === 'error' || job.error) return { error: job.error };
+      return pollJob(statusUrl);
+    });
+}
+
 // SUBMIT FORM: Now sends to Flask backend `/submit`
 function submitForm() {
   const payload = {
@@ -107,6 +346,7 @@ function submitForm() {
 
 document.addEventListener('DOMContentLoaded', () => {
   document.getElementById('startBtn').addEventListener('click', startRecording);
+  document.getElementById('formBtn').addEventListener('click', startRecording);
   document.getElementById('stopBtn').addEventListener('click', stopRecording);
   document.getElementById('submitBtn').addEventListener('click', submitForm);
 });
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def headerless_webm():
+    """Makes opus-in-webm written to a pipe, so the header has no duration (like MediaRecorder)."""
+    from audio_pipeline import FFMPEG_EXE
+
+    def make(seconds):
+        return subprocess.run([
+            FFMPEG_EXE, "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+            "-ac", "1", "-c:a", "libopus", "-b:a", "24k", "-f", "webm", "pipe:1",
+        ], stdout=subprocess.PIPE, check=True).stdout
+    return make
+
+
+@pytest.fixture
+def slow_start_m4a(tmp_path):
+    """Makes an AAC m4a written to a file, so its moov box comes after the audio (not faststart)."""
+    from audio_pipeline import FFMPEG_EXE
+
+    def make(seconds):
+        path = tmp_path / f"slow_start_{seconds}.m4a"
+        subprocess.run([
+            FFMPEG_EXE, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=44100",
+            "-ac", "1", "-c:a", "aac", "-b:a", "64k", str(path),
+        ], check=True)
+        return path.read_bytes()
+    return make
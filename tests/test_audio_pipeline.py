@@ -0,0 +1,63 @@
+import subprocess
+from io import BytesIO
+
+import pytest
+
+from audio_pipeline import (FFMPEG_EXE, DecodedAudio, NoAudioError, check_upload, encode_audio, index_at_end,
+                            load_audio, overlapping_segments, prepare_upload)
+
+
+def test_slow_start_m4a_has_its_index_at_the_end(slow_start_m4a):
+    data = slow_start_m4a(10)
+    assert data.find(b"moov") > len(data) // 2
+    assert index_at_end(data[:256 * 1024])
+
+
+def test_slow_start_m4a_is_probed_from_a_file(slow_start_m4a):
+    upload = BytesIO(slow_start_m4a(60))
+    info = check_upload(upload)
+    assert info["codec"] == "aac"
+    assert info["duration"] == pytest.approx(60, abs=0.1)
+    assert upload.tell() == 0
+
+
+def test_slow_start_m4a_decodes_from_a_stream(slow_start_m4a):
+    data = slow_start_m4a(60)
+    assert load_audio(BytesIO(data)).duration_ms == pytest.approx(60000, abs=100)
+    segments = list(overlapping_segments(BytesIO(data), 20000, 2000))
+    assert [round(s.duration_ms / 1000) for s in segments] == [20, 20, 20, 6]
+
+
+def test_slow_start_m4a_is_transcoded_in_full(slow_start_m4a):
+    buffer, filename, _ = prepare_upload(BytesIO(slow_start_m4a(60)), passthrough=False)
+    try:
+        assert filename == "audio.flac"
+        assert load_audio(buffer).duration_ms == pytest.approx(60000, abs=100)
+    finally:
+        buffer.close()
+
+
+def fragmented_m4a(seconds):
+    """AAC in fragmented mp4, as Safari's MediaRecorder (audio/mp4) uploads it."""
+    return subprocess.run([
+        FFMPEG_EXE, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+        "-ac", "1", "-c:a", "aac", "-f", "mp4", "-movflags", "frag_keyframe+empty_moov", "pipe:1",
+    ], stdout=subprocess.PIPE, check=True).stdout
+
+
+@pytest.mark.parametrize("passthrough, filename", [(True, "audio.m4a"), (False, "audio.flac")])
+def test_safari_m4a_is_prepared_in_full(passthrough, filename):
+    data = fragmented_m4a(20)
+    assert not index_at_end(data)
+    buffer, name, info = prepare_upload(BytesIO(data), passthrough=passthrough)
+    try:
+        assert name == filename
+        assert load_audio(buffer).duration_ms == pytest.approx(20000, abs=100)
+    finally:
+        buffer.close()
+
+
+def test_encoding_a_recording_without_audio_raises():
+    with pytest.raises(NoAudioError):
+        encode_audio(DecodedAudio(b"", 16000).wav())
@@ -0,0 +1,25 @@
+import pytest
+
+from form_extraction import clean_value, merge_fields, split_by_labels
+
+
+def test_labels_fill_gender_followed_by_more_dictation():
+    transcript = "Patient name John Smith, age 45, gender male, from Pune, symptoms fever and cough for three days"
+    values = split_by_labels(transcript)
+    assert values["name"] == "John Smith"
+    assert values["age"] == "45"
+    assert values["gender"] == "Male"
+    assert values["symptoms"] == "fever and cough for three days"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Female", "Female"), ("m", "Male"), ("  male, from Pune", "Male"), ("woman aged 30", "Female"),
+    ("unknown", None), ("", None), (None, None), ("45", None),
+])
+def test_gender_is_read_from_the_first_word(value, expected):
+    assert clean_value("gender", value) == expected
+
+
+def test_label_fallback_fills_gender_when_the_llm_reply_is_unusable():
+    fields, sources = merge_fields(None, "gender female, age 30, diagnosis migraine")
+    assert (fields["gender"], sources["gender"]) == ("Female", "labels")
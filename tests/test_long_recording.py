@@ -0,0 +1,87 @@
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+from audio_pipeline import AudioLimitError
+from long_recording import stitch_pair, stitch_transcripts, transcribe_long
+from parallel import map_bounded
+
+WINDOW = 17
+
+
+def stitch(left, right):
+    return " ".join(stitch_pair(left.split(), right.split(), WINDOW))
+
+
+def test_overlap_at_the_seam_is_kept_once():
+    assert stitch("the patient reports chest pain for two",
+                  "pain for two days, worse at night") == "the patient reports chest pain for two days, worse at night"
+
+
+def test_overlap_ignores_case_and_punctuation():
+    assert stitch("no fever. Worse at night.",
+                  "worse at night and no vomiting") == "no fever. Worse at night. and no vomiting"
+
+
+def test_garbled_word_at_the_edge_is_tolerated():
+    # The last word of the left segment was cut off mid-word.
+    assert stitch("started on amoxicillin five hundred milli",
+                  "amoxicillin five hundred milligrams twice daily") == (
+        "started on amoxicillin five hundred milligrams twice daily")
+
+
+def test_spurious_common_bigram_away_from_the_seam_is_not_an_overlap():
+    left = "Ultrasound shows a small stone in the lower pole of the left kidney with mild"
+    right = "mild hydronephrosis. Advised plenty of fluids and a follow up of the scan in four weeks"
+    assert stitch(left, right) == left + " " + right
+
+
+def test_no_overlap_concatenates():
+    assert stitch("alpha beta", "gamma delta") == "alpha beta gamma delta"
+
+
+def test_stitch_transcripts_joins_every_seam():
+    texts = ["the patient reports chest pain for two", "pain for two days, worse at night.",
+             "worse at night and no fever"]
+    assert stitch_transcripts(texts, overlap_seconds=3) == (
+        "the patient reports chest pain for two days, worse at night. and no fever")
+
+
+def test_stitch_transcripts_handles_empty_segments():
+    assert stitch_transcripts(["", "one two", "", "three"], overlap_seconds=3) == "one two three"
+
+
+def test_recording_over_the_limit_is_rejected_before_any_segment_is_sent(headerless_webm):
+    calls = []
+    with pytest.raises(AudioLimitError):
+        transcribe_long(BytesIO(headerless_webm(70)), calls.append, max_seconds=60,
+                        segment_seconds=10, overlap_seconds=1)
+    assert calls == []
+
+
+def test_segments_are_transcribed_in_order(headerless_webm):
+    def transcribe(segment):
+        return f"{round(segment.duration_ms / 1000)}s"
+
+    text = transcribe_long(BytesIO(headerless_webm(25)), transcribe, max_seconds=60,
+                           segment_seconds=10, overlap_seconds=1, concurrency=2)
+    assert text == "10s 10s 7s"
+
+
+def test_map_bounded_caps_items_in_flight():
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def work(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return item * 2
+
+    assert map_bounded(work, iter(range(12)), concurrency=3) == [i * 2 for i in range(12)]
+    assert peak[0] == 3
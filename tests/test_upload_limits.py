@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import pytest
+
+from audio_pipeline import AudioLimitError, DecodedAudio, NoAudioError, check_upload, decoded_seconds, prepare_upload
+
+
+@pytest.mark.parametrize("passthrough", [True, False])
+def test_headerless_webm_over_the_limit_is_rejected(headerless_webm, passthrough):
+    upload = BytesIO(headerless_webm(70))
+    info = check_upload(upload, max_seconds=60)
+    assert info["duration"] is None
+
+    with pytest.raises(AudioLimitError) as excinfo:
+        prepare_upload(upload, passthrough=passthrough, info=info, max_seconds=60)
+    assert excinfo.value.reason == "duration"
+
+
+@pytest.mark.parametrize("passthrough", [True, False])
+def test_headerless_webm_under_the_limit_is_prepared(headerless_webm, passthrough):
+    data = headerless_webm(20)
+    buffer, filename, _ = prepare_upload(BytesIO(data), passthrough=passthrough, max_seconds=60)
+    try:
+        if passthrough:
+            assert filename == "audio.webm"
+            assert buffer.read() == data
+        else:
+            assert buffer.read(4)
+    finally:
+        buffer.close()
+
+
+def test_slow_start_m4a_over_the_limit_is_rejected_from_its_header(slow_start_m4a):
+    with pytest.raises(AudioLimitError) as excinfo:
+        check_upload(BytesIO(slow_start_m4a(70)), max_seconds=60)
+    assert excinfo.value.reason == "duration"
+
+
+@pytest.mark.parametrize("passthrough", [True, False])
+def test_slow_start_m4a_over_the_limit_is_rejected_when_measured(slow_start_m4a, passthrough):
+    # Without check_upload's info, prepare_upload measures the recording itself.
+    with pytest.raises(AudioLimitError):
+        prepare_upload(BytesIO(slow_start_m4a(70)), passthrough=passthrough, max_seconds=60)
+
+
+def test_slow_start_m4a_is_measured_in_full(slow_start_m4a):
+    assert decoded_seconds(BytesIO(slow_start_m4a(20))) == pytest.approx(20, abs=0.1)
+
+
+def test_recording_without_audio_is_not_measured_as_zero_seconds():
+    with pytest.raises(NoAudioError):
+        decoded_seconds(DecodedAudio(b"", 16000).wav(), max_seconds=60)
@@ -0,0 +1,146 @@
+"""
+Transcription Backends
+
+transcribe_audio goes through one of these, chosen with TRANSCRIBE_BACKEND:
+
+- "remote" (default): the OpenAI-compatible /audio/transcriptions endpoint
+  through the upstream layer.
+- "local": faster-whisper on the CPU (CTranslate2, int8 by default). The
+  model is loaded once per process and shared by all requests; at most
+  LOCAL_WHISPER_WORKERS transcriptions run on it at a time.
+
+faster-whisper is optional and only imported when the local backend is
+first used.
+"""
+import os
+import threading
+
+import numpy as np
+
+from audio_pipeline import UPLOAD_SAMPLE_RATE, load_audio
+
+TRANSCRIBE_BACKEND = os.environ.get("TRANSCRIBE_BACKEND", "remote").lower()
+LOCAL_WHISPER_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "small")
+LOCAL_WHISPER_COMPUTE_TYPE = os.environ.get("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+# 0 lets CTranslate2 pick (one thread per core).
+LOCAL_WHISPER_THREADS = int(os.environ.get("LOCAL_WHISPER_THREADS", 0))
+LOCAL_WHISPER_WORKERS = int(os.environ.get("LOCAL_WHISPER_WORKERS", 1))
+LOCAL_WHISPER_BEAM_SIZE = int(os.environ.get("LOCAL_WHISPER_BEAM_SIZE", 1))
+LOCAL_WHISPER_LANGUAGE = os.environ.get("LOCAL_WHISPER_LANGUAGE", "en") or None
+
+
+class TranscriptionBackend:
+    """
+    transcribe(audio, filename, audio_seconds) takes an encoded recording
+    (binary file object) and returns its text; transcribe_chunk takes an
+    AudioChunk. model_id identifies the model and settings in cache keys.
+    """
+    name = ""
+    model_id = ""
+
+    def transcribe(self, audio, filename, audio_seconds=None):
+        raise NotImplementedError
+
+    def transcribe_chunk(self, chunk):
+        upload, filename = chunk.encode()
+        try:
+            return self.transcribe(upload, filename, chunk.duration_s)
+        finally:
+            upload.close()
+
+    def warm(self):
+        """Loads whatever the backend needs ahead of the first request."""
+
+
+class RemoteBackend(TranscriptionBackend):
+    name = "remote"
+
+    def __init__(self, upstream, model="whisper-1"):
+        self.upstream = upstream
+        self.model = model
+        self.model_id = model
+
+    def transcribe(self, audio, filename, audio_seconds=None):
+        # The raw response; app._transcript_text handles the formats
+        # OpenAI-compatible servers reply with.
+        return self.upstream.transcribe(
+            (filename, audio),
+            audio_seconds=audio_seconds,
+            model=self.model,
+            response_format="text"
+        )
+
+
+def pcm_to_float(pcm):
+    """16-bit little-endian PCM to float32 samples in [-1, 1]."""
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    name = "local"
+
+    def __init__(self, model=LOCAL_WHISPER_MODEL, compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+                 cpu_threads=LOCAL_WHISPER_THREADS, workers=LOCAL_WHISPER_WORKERS,
+                 beam_size=LOCAL_WHISPER_BEAM_SIZE, language=LOCAL_WHISPER_LANGUAGE):
+        self.model = model
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.workers = max(1, workers)
+        self.beam_size = beam_size
+        self.language = language
+        self.model_id = f"faster-whisper/{model}/{compute_type}/beam{beam_size}"
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError:
+                    raise RuntimeError("TRANSCRIBE_BACKEND=local needs faster-whisper (pip install faster-whisper)")
+                print(f"Loading local Whisper model {self.model_id}")
+                self._model = WhisperModel(
+                    self.model,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.workers,
+                )
+            return self._model
+
+    def warm(self):
+        try:
+            self._load()
+        except Exception as e:
+            # Requests will raise the same error; the app keeps serving the rest.
+            print(f"Local Whisper model not loaded: {e}")
+
+    def transcribe_samples(self, samples):
+        """Transcribes float32 mono samples at 16 kHz."""
+        model = self._load()
+        with self._slots:
+            segments, _ = model.transcribe(samples, beam_size=self.beam_size, language=self.language)
+            # segments is a generator; decoding happens while it is consumed.
+            return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def transcribe(self, audio, filename=None, audio_seconds=None):
+        decoded = load_audio(audio, UPLOAD_SAMPLE_RATE, 1)
+        return self.transcribe_samples(pcm_to_float(decoded.pcm))
+
+    def transcribe_chunk(self, chunk):
+        # Decoded chunks are already 16 kHz mono PCM; skip the encode/decode.
+        if chunk.audio.sample_rate == UPLOAD_SAMPLE_RATE and chunk.audio.channels == 1:
+            return self.transcribe_samples(pcm_to_float(chunk.pcm))
+        return super().transcribe_chunk(chunk)
+
+
+def make_backend(name=TRANSCRIBE_BACKEND, upstream=None, model="whisper-1"):
+    if name == "remote":
+        if upstream is None:
+            raise ValueError("The remote backend needs an upstream")
+        return RemoteBackend(upstream, model)
+    if name == "local":
+        return LocalWhisperBackend()
+    raise ValueError(f"Unknown transcription backend: {name}")
@@ -0,0 +1,403 @@
+"""
+Upstream API Layer
+
+Wraps the OpenAI-compatible endpoint(s) used for transcription and
+correction:
+
+- one pooled HTTP client per endpoint (OPENAI_MAX_CONNECTIONS,
+  OPENAI_KEEPALIVE_CONNECTIONS, OPENAI_KEEPALIVE_SECONDS);
+- per-call deadlines: transcriptions get TRANSCRIBE_TIMEOUT_BASE plus
+  TRANSCRIBE_TIMEOUT_PER_SECOND for every second of audio, chat calls
+  CHAT_TIMEOUT (for streamed chat, the time allowed per read);
+- jittered exponential retries of transient errors within the deadline,
+  and a circuit breaker per endpoint that fails fast after
+  CIRCUIT_FAILURE_THRESHOLD consecutive failures;
+- optional hedging: with OPENAI_HEDGE_BASE_URL set, a call still running
+  after the primary's HEDGE_PERCENTILE latency is duplicated to the second
+  endpoint and the first answer wins. Transcriptions of known length are
+  compared per second of audio, so long recordings are not hedged just for
+  being longer than the usual dictation, and recordings over
+  HEDGE_MAX_AUDIO_SECONDS are never sent twice.
+
+The OpenAI SDK is imported when an endpoint's client is first used (see
+core.LazyClient); importing this module stays cheap.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core import LazyClient
+from metrics import UPSTREAM_SECONDS
+
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_KEEPALIVE_CONNECTIONS", 10))
+OPENAI_KEEPALIVE_SECONDS = float(os.environ.get("OPENAI_KEEPALIVE_SECONDS", 60))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 2))
+
+TRANSCRIBE_TIMEOUT_BASE = float(os.environ.get("TRANSCRIBE_TIMEOUT_BASE", 10))
+TRANSCRIBE_TIMEOUT_PER_SECOND = float(os.environ.get("TRANSCRIBE_TIMEOUT_PER_SECOND", 0.5))
+TRANSCRIBE_TIMEOUT_MAX = float(os.environ.get("TRANSCRIBE_TIMEOUT_MAX", 300))
+CHAT_TIMEOUT = float(os.environ.get("CHAT_TIMEOUT", 30))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", 30))
+
+OPENAI_HEDGE_BASE_URL = os.environ.get("OPENAI_HEDGE_BASE_URL", "")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 95))
+HEDGE_MAX_AUDIO_SECONDS = float(os.environ.get("HEDGE_MAX_AUDIO_SECONDS", 60))
+# Hedging starts once this many primary latencies have been seen.
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection errors and timeouts carry no status code.
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+
+def backoff_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Exponential backoff with jitter in [50%, 100%] of the step."""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def transcription_timeout(audio_seconds=None):
+    """Deadline in seconds for transcribing audio_seconds of audio."""
+    if not audio_seconds:
+        return TRANSCRIBE_TIMEOUT_MAX
+    return min(TRANSCRIBE_TIMEOUT_MAX, TRANSCRIBE_TIMEOUT_BASE + TRANSCRIBE_TIMEOUT_PER_SECOND * audio_seconds)
+
+
+def make_client(api_key, base_url):
+    """
+    OpenAI client with a tuned connection pool. SDK retries are off; the
+    callers (Upstream or parallel.call_with_backoff) retry instead.
+    """
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        timeout=httpx.Timeout(CHAT_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        http_client=DefaultHttpxClient(limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+        )),
+    )
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures; after `reset_seconds` one
+    trial call is let through (half-open) and its outcome closes or reopens
+    the circuit.
+    """
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls, per operation."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, op, seconds):
+        with self._lock:
+            self._samples.setdefault(op, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, op, pct, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples.get(op, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def summary(self):
+        with self._lock:
+            ops = list(self._samples)
+        return {
+            op: {
+                "samples": len(self._samples[op]),
+                "p50": round(self.percentile(op, 50), 4),
+                "p95": round(self.percentile(op, 95), 4),
+            }
+            for op in ops
+        }
+
+
+class Endpoint:
+    def __init__(self, name, api_key, base_url):
+        self.name = name
+        self.base_url = base_url
+        self.client = LazyClient(api_key, base_url)
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "errors": 0, "retries": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def count(self, event):
+        """Adds one to a stats counter; calls run on worker and hedge threads."""
+        with self._lock:
+            self.stats[event] += 1
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+class Upstream:
+    """
+    Transcription and chat calls against the primary endpoint, with deadlines,
+    retries, circuit breaking and optional hedging to a second endpoint.
+    """
+
+    def __init__(self, api_key, base_url, hedge_base_url=OPENAI_HEDGE_BASE_URL,
+                 max_retries=OPENAI_MAX_RETRIES, hedge_percentile=HEDGE_PERCENTILE):
+        self.primary = Endpoint("primary", api_key, base_url)
+        self.hedge = Endpoint("hedge", api_key, hedge_base_url) if hedge_base_url else None
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.hedge_stats = {"launched": 0, "won": 0}
+        self._hedge_pool = ThreadPoolExecutor(thread_name_prefix="upstream-hedge") if self.hedge else None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The primary endpoint's OpenAI client."""
+        return self.primary.client
+
+    def warm(self):
+        """Builds the clients (and imports the SDK) ahead of the first call."""
+        for endpoint in (self.primary, self.hedge):
+            if endpoint is not None:
+                endpoint.client.get()
+
+    def transcribe(self, file, audio_seconds=None, **kwargs):
+        """
+        audio.transcriptions.create with a deadline scaled to the audio
+        length. file is a (filename, bytes or file object) tuple.
+        """
+        filename, data = file
+        if self.hedge and not isinstance(data, bytes):
+            # Both endpoints may send the upload, so it must be re-readable.
+            data.seek(0)
+            data = data.read()
+
+        def request(client, timeout):
+            if not isinstance(data, bytes):
+                data.seek(0)
+            return client.audio.transcriptions.create(file=(filename, data), timeout=timeout, **kwargs)
+
+        return self._call("transcribe", request, transcription_timeout(audio_seconds), audio_seconds)
+
+    def chat(self, timeout=CHAT_TIMEOUT, **kwargs):
+        """chat.completions.create with a CHAT_TIMEOUT deadline."""
+        return self._call("chat", lambda client, t: client.chat.completions.create(timeout=t, **kwargs), timeout)
+
+    def chat_stream(self, timeout=CHAT_TIMEOUT, **kwargs):
+        """
+        chat.completions.create(stream=True), yielding the content deltas as
+        they arrive. Opening the stream is retried like any call but never
+        hedged (the losing stream would keep its connection busy); an error
+        after the first delta ends the stream with that error.
+        """
+        deadline = time.monotonic() + timeout
+        stream = self._attempts(
+            self.primary, "chat_stream",
+            lambda client, t: client.chat.completions.create(stream=True, timeout=t, **kwargs), deadline)
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    def _call(self, op, request, deadline_seconds, audio_seconds=None):
+        deadline = time.monotonic() + deadline_seconds
+        if not self.hedge:
+            return self._attempts(self.primary, op, request, deadline, audio_seconds=audio_seconds)
+        if not self.primary.breaker.allow():
+            # Primary is failing; send everything to the hedge endpoint.
+            self.primary.count("rejected")
+            return self._attempts(self.hedge, op, request, deadline, audio_seconds=audio_seconds)
+        if audio_seconds and audio_seconds > HEDGE_MAX_AUDIO_SECONDS:
+            # Too costly to send twice.
+            return self._attempts(self.primary, op, request, deadline, audio_seconds=audio_seconds)
+        return self._hedged(op, request, deadline, audio_seconds)
+
+    @staticmethod
+    def _latency_key(op, audio_seconds):
+        """Latencies of calls with a known audio length are kept per second of audio."""
+        return f"{op}_per_audio_second" if audio_seconds else op
+
+    def _attempts(self, endpoint, op, request, deadline, checked=False, audio_seconds=None):
+        """Calls endpoint, retrying transient errors until the deadline."""
+        attempt = 0
+        while True:
+            if not checked and not endpoint.breaker.allow():
+                endpoint.count("rejected")
+                raise CircuitOpenError(f"{endpoint.name} endpoint circuit is open")
+            checked = False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{op} deadline exceeded on {endpoint.name} endpoint")
+            start = time.monotonic()
+            endpoint.count("calls")
+            try:
+                result = request(endpoint.client, remaining)
+            except Exception as e:
+                UPSTREAM_SECONDS.observe(time.monotonic() - start, op=op, endpoint=endpoint.name, outcome="error")
+                endpoint.count("errors")
+                if not is_retryable(e):
+                    # The request itself is bad; the endpoint is fine.
+                    endpoint.breaker.record_success()
+                    raise
+                endpoint.breaker.record_failure()
+                delay = retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                endpoint.count("retries")
+                print(f"Retrying {op} on {endpoint.name} after {type(e).__name__} "
+                      f"(attempt {attempt}/{self.max_retries}, {delay:.1f}s)")
+                time.sleep(delay)
+                continue
+            endpoint.breaker.record_success()
+            seconds = time.monotonic() - start
+            UPSTREAM_SECONDS.observe(seconds, op=op, endpoint=endpoint.name, outcome="ok")
+            endpoint.latency.add(self._latency_key(op, audio_seconds),
+                                 seconds / audio_seconds if audio_seconds else seconds)
+            return result
+
+    def _hedged(self, op, request, deadline, audio_seconds=None):
+        """
+        Runs the call on the primary; if it has not answered after the
+        primary's HEDGE_PERCENTILE latency (per second of audio times
+        audio_seconds, when the length is known), starts the same call on the hedge
+        endpoint and returns whichever succeeds first. The slower request is
+        left to finish in the background (sync HTTP calls cannot be aborted).
+        """
+        primary = self._hedge_pool.submit(self._attempts, self.primary, op, request, deadline, True, audio_seconds)
+        delay = self.primary.latency.percentile(self._latency_key(op, audio_seconds), self.hedge_percentile,
+                                                HEDGE_MIN_SAMPLES)
+        if delay is not None and audio_seconds:
+            delay *= audio_seconds
+        if delay is None or self.hedge.breaker.state == "open":
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedge_stats["launched"] += 1
+        hedge = self._hedge_pool.submit(self._attempts, self.hedge, op, request, deadline, audio_seconds=audio_seconds)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_stats["won"] += 1
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def stats(self):
+        endpoints = [self.primary] + ([self.hedge] if self.hedge else [])
+        with self._lock:
+            hedge_stats = dict(self.hedge_stats)
+        return {
+            "endpoints": {
+                e.name: dict(e.stats_snapshot(), circuit=e.breaker.state, times_opened=e.breaker.times_opened,
+                             latency=e.latency.summary())
+                for e in endpoints
+            },
+            "hedging": dict(hedge_stats, percentile=self.hedge_percentile) if self.hedge else None,
+        }
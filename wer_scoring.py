@@ -0,0 +1,240 @@
+"""
+WER Scoring
+
+Aligns a whole hypothesis to the whole reference once (word-level edit
+distance) and derives every metric the benchmarks report from that single
+alignment:
+
+- overall WER (substitutions + deletions + insertions over reference words)
+- per-segment WER, where each hypothesis segment (one transcribed chunk) is
+  scored against the reference words aligned to it, instead of against an
+  equal-word-count slice of the reference; an empty segment (e.g. a chunk
+  whose API call failed) gets the reference words deleted between its
+  neighbours, so it scores 1.0 rather than passing its errors on
+- word-weighted WER (WER_wrd), which equals the overall WER because the
+  per-segment errors and reference words partition the alignment
+
+The dynamic program runs one vectorized numpy row per reference word and
+keeps only one byte of backpointer per cell. References beyond
+FULL_ALIGNMENT_MAX_CELLS cells are aligned inside a diagonal band of
+ALIGNMENT_BAND words either side, so hour-long transcripts stay in a few
+megabytes; a path that would leave the band can only overstate the errors.
+
+Words are whitespace-separated tokens compared as-is, like jiwer's default.
+"""
+import math
+import os
+
+import numpy as np
+
+FULL_ALIGNMENT_MAX_CELLS = int(os.environ.get("FULL_ALIGNMENT_MAX_CELLS", 25_000_000))
+ALIGNMENT_BAND = int(os.environ.get("ALIGNMENT_BAND", 1000))
+
+# Backpointer / operation codes
+MATCH, SUBSTITUTION, DELETION, INSERTION = 0, 1, 2, 3
+_DIAGONAL = 1  # backpointer for a match or substitution
+
+_INF = np.iinfo(np.int32).max // 2
+
+
+class Alignment:
+    """
+    The edit operations turning the reference into the hypothesis, in order.
+    ops[k] is one of MATCH/SUBSTITUTION/DELETION/INSERTION; ref_index[k] and
+    hyp_index[k] are the word positions involved, -1 where there is none.
+    """
+
+    def __init__(self, ops, ref_index, hyp_index, n_ref, n_hyp):
+        self.ops = ops
+        self.ref_index = ref_index
+        self.hyp_index = hyp_index
+        self.n_ref = n_ref
+        self.n_hyp = n_hyp
+
+    def counts(self):
+        counts = np.bincount(self.ops, minlength=4)
+        return {"hits": int(counts[MATCH]), "substitutions": int(counts[SUBSTITUTION]),
+                "deletions": int(counts[DELETION]), "insertions": int(counts[INSERTION])}
+
+    @property
+    def errors(self):
+        return int(np.count_nonzero(self.ops != MATCH))
+
+    @property
+    def wer(self):
+        if self.n_ref == 0:
+            return 1.0 if self.n_hyp else 0.0
+        return self.errors / self.n_ref
+
+
+def _band(n_ref, n_hyp, band):
+    """Per-row column bounds (inclusive) of the cells the DP fills."""
+    rows = np.arange(n_ref + 1)
+    if band is None:
+        return np.zeros(n_ref + 1, dtype=np.int64), np.full(n_ref + 1, n_hyp, dtype=np.int64)
+    # Wide enough that consecutive rows' bands always connect.
+    half = max(band, math.ceil(n_hyp / max(n_ref, 1)) + 1)
+    center = np.rint(rows * (n_hyp / max(n_ref, 1))).astype(np.int64)
+    return np.clip(center - half, 0, n_hyp), np.clip(center + half, 0, n_hyp)
+
+
+def align(reference, hypothesis, band="auto"):
+    """
+    Aligns two word lists (or strings, split on whitespace). band="auto"
+    uses the full matrix up to FULL_ALIGNMENT_MAX_CELLS cells and a band of
+    ALIGNMENT_BAND beyond; None forces the full matrix; an int sets the band.
+    """
+    ref = reference.split() if isinstance(reference, str) else list(reference)
+    hyp = hypothesis.split() if isinstance(hypothesis, str) else list(hypothesis)
+    n, m = len(ref), len(hyp)
+
+    vocab = {}
+    ref_ids = np.array([vocab.setdefault(w, len(vocab)) for w in ref], dtype=np.int64)
+    hyp_ids = np.array([vocab.setdefault(w, len(vocab)) for w in hyp], dtype=np.int64)
+
+    if band == "auto":
+        band = None if (n + 1) * (m + 1) <= FULL_ALIGNMENT_MAX_CELLS else ALIGNMENT_BAND
+    lo, hi = _band(n, m, band)
+    width = int((hi - lo).max()) + 1
+    back = np.zeros((n + 1, width), dtype=np.uint8)
+
+    # Row 0: only insertions.
+    prev = np.full(m + 1, _INF, dtype=np.int64)
+    prev[lo[0]:hi[0] + 1] = np.arange(lo[0], hi[0] + 1)
+    back[0, :hi[0] - lo[0] + 1] = INSERTION
+
+    for i in range(1, n + 1):
+        a, b = lo[i], hi[i]
+        cols = np.arange(a, b + 1)
+        # Deletion: from (i-1, j)
+        best = prev[a:b + 1] + 1
+        moves = np.full(b - a + 1, DELETION, dtype=np.uint8)
+        # Match/substitution: from (i-1, j-1), for j >= 1
+        start = 1 if a == 0 else 0
+        if b >= 1:
+            diag = prev[a + start - 1:b] + (hyp_ids[a + start - 1:b] != ref_ids[i - 1])
+            better = diag <= best[start:]
+            best[start:] = np.where(better, diag, best[start:])
+            moves[start:][better] = _DIAGONAL
+        # Insertion: from (i, j-1). cur[j] = min_k<=j best[k] + (j - k),
+        # a running minimum of best[k] - k.
+        run = np.minimum.accumulate(best - cols) + cols
+        inserted = run < best
+        moves[inserted] = INSERTION
+        cur = np.full(m + 1, _INF, dtype=np.int64)
+        cur[a:b + 1] = np.where(inserted, run, best)
+        back[i, :b - a + 1] = moves
+        prev = cur
+
+    ops, ref_index, hyp_index = [], [], []
+    i, j = n, m
+    while i > 0 or j > 0:
+        move = back[i, j - lo[i]]
+        if i > 0 and move == _DIAGONAL:
+            i, j = i - 1, j - 1
+            ops.append(MATCH if ref_ids[i] == hyp_ids[j] else SUBSTITUTION)
+            ref_index.append(i)
+            hyp_index.append(j)
+        elif i > 0 and move == DELETION:
+            i -= 1
+            ops.append(DELETION)
+            ref_index.append(i)
+            hyp_index.append(-1)
+        else:
+            j -= 1
+            ops.append(INSERTION)
+            ref_index.append(-1)
+            hyp_index.append(j)
+    return Alignment(
+        np.array(ops[::-1], dtype=np.int8),
+        np.array(ref_index[::-1], dtype=np.int64),
+        np.array(hyp_index[::-1], dtype=np.int64),
+        n, m,
+    )
+
+
+def wer(reference, hypothesis):
+    """Word error rate of hypothesis against reference (0.0 - 1.0+)."""
+    return align(reference, hypothesis).wer
+
+
+class SegmentScores:
+    """
+    Per-segment scores derived from one alignment. wers, errors and
+    ref_words are arrays with one entry per hypothesis segment;
+    reference_texts are the reference words aligned to each segment.
+    """
+
+    def __init__(self, alignment, segment_of_op, n_segments, reference_words):
+        self.alignment = alignment
+        scored = segment_of_op >= 0
+        errors = (alignment.ops != MATCH)[scored]
+        has_ref = alignment.ref_index >= 0
+        self.errors = np.bincount(segment_of_op[scored], weights=errors, minlength=n_segments).astype(np.int64)
+        self.ref_words = np.bincount(segment_of_op[scored], weights=has_ref[scored],
+                                     minlength=n_segments).astype(np.int64)
+        # A segment with no reference words scores 1.0 if it has any words at all.
+        self.wers = np.where(self.ref_words > 0, self.errors / np.maximum(self.ref_words, 1),
+                             (self.errors > 0).astype(float))
+        self.reference_texts = [
+            " ".join(reference_words[k] for k in alignment.ref_index[(segment_of_op == s) & has_ref])
+            for s in range(n_segments)
+        ]
+
+    @property
+    def avg_wer(self):
+        return float(self.wers.mean()) if len(self.wers) else 0.0
+
+    @property
+    def std_wer(self):
+        # Sample standard deviation, as pandas reports it.
+        return float(self.wers.std(ddof=1)) if len(self.wers) > 1 else 0.0
+
+    @property
+    def wer_wrd(self):
+        """WER of each segment weighted by its reference words."""
+        total = int(self.ref_words.sum())
+        return float(self.errors.sum() / total) if total else 0.0
+
+    @property
+    def wer(self):
+        return self.alignment.wer
+
+
+def score_segments(reference, segments, band="auto"):
+    """
+    Scores hypothesis segments (e.g. chunk transcripts, in order) against the
+    full reference text with a single alignment. Reference words deleted
+    between two hypothesis words are shared evenly, in order, among the
+    empty segments between them; with no empty segment in between they go
+    to the segment of the preceding hypothesis word (the following one
+    before the first hypothesis word). No segments give no segment scores.
+    """
+    reference_words = reference.split()
+    words, segment_of_word = [], []
+    for s, text in enumerate(segments):
+        segment_words = text.split()
+        words.extend(segment_words)
+        segment_of_word.extend([s] * len(segment_words))
+    alignment = align(reference_words, words, band)
+
+    n_segments = len(segments)
+    n_ops = len(alignment.ops)
+    segment_of_op = np.full(n_ops, -1, dtype=np.int64)
+    with_hyp = alignment.hyp_index >= 0
+    segment_of_op[with_hyp] = np.asarray(segment_of_word, dtype=np.int64)[alignment.hyp_index[with_hyp]]
+    if n_segments and n_ops:
+        # Every op without a hypothesis word is a deletion. Find the ops of
+        # the hypothesis words either side of it and their segments.
+        pos = np.arange(n_ops)
+        prev_pos = np.maximum.accumulate(np.where(with_hyp, pos, -1))
+        next_pos = np.minimum.accumulate(np.where(with_hyp, pos, n_ops)[::-1])[::-1]
+        prev_seg = np.where(prev_pos >= 0, segment_of_op[np.maximum(prev_pos, 0)], -1)
+        next_seg = np.where(next_pos < n_ops, segment_of_op[np.minimum(next_pos, n_ops - 1)], n_segments)
+        empty_between = next_seg - prev_seg - 1
+        rank, run = pos - prev_pos - 1, next_pos - prev_pos - 1
+        shared = prev_seg + 1 + rank * np.maximum(empty_between, 1) // np.maximum(run, 1)
+        neighbour = np.where(prev_seg >= 0, prev_seg, next_seg)
+        deleted = ~with_hyp
+        segment_of_op[deleted] = np.where(empty_between > 0, shared, neighbour)[deleted]
+    return SegmentScores(alignment, segment_of_op, n_segments, reference_words)